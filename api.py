@@ -1,9 +1,67 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict
+from datetime import datetime
+import asyncio
+import json
+import os
 
-app = FastAPI(title="Supermercado API", version="1.0")
+from modules.analytics import get_sales_analytics
+from modules.catalog import Catalog
+from modules.database import create_database_manager, plan_upserts
+from modules.http_cache import VersionedResponseCache
+from modules.product_index import FuzzyProductIndex, normalize_name
+from modules.stock import StockManager
+from modules.write_behind import WriteBehindStore
+
+
+# Estado em memória, carregado do banco ao subir (ver lifespan)
+
+# Produtos por nome normalizado, em ordem estável (cursor de GET /produtos)
+catalogo = Catalog()
+usuarios: List[dict] = []
+carrinhos: Dict[str, List[dict]] = {}
+
+# Baixa de estoque com trava por produto. Com SUPERMERCADO_API_RESERVA_S > 0, adicionar
+# ao carrinho reserva o estoque por esse tempo (renovado a cada inclusão). As rotas são
+# async e rodam na thread do event loop, então aqui as travas nunca disputam: a baixa
+# já é atômica por não haver await no meio; elas valem para quem usa o StockManager em threads
+estoque = StockManager(catalogo, reservation_ttl=float(os.environ.get("SUPERMERCADO_API_RESERVA_S", "0")) or None)
+
+# Corpos de GET /produtos já serializados, por versão do catálogo (ETag / 304)
+cache_produtos = VersionedResponseCache()
+
+# Busca aproximada por nome (erros de digitação e do reconhecedor de fala)
+busca_produtos = FuzzyProductIndex()
+
+# Mesmo banco de modules/ (SUPERMERCADO_DB_BACKEND / SUPERMERCADO_DB_FILE). As rotas
+# mudam a memória e só enfileiram a mutação; 'persistencia' grava em lotes em uma
+# thread, a cada SUPERMERCADO_API_FLUSH_MS, e ao desligar
+db = create_database_manager()
+persistencia = WriteBehindStore(db)
+
+
+async def carregar_estado():
+    data = await asyncio.to_thread(db.load_data)
+    catalogo.replace(data['produtos'])
+    busca_produtos.sync(p["nome"] for p in catalogo)
+    usuarios[:] = data['usuarios']
+    carrinhos.clear()
+    carrinhos.update(data.get('carrinhos', {}))
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await carregar_estado()
+    await persistencia.start()
+    yield
+    await persistencia.stop()
+
+
+app = FastAPI(title="Supermercado API", version="1.0", lifespan=lifespan)
 
 # Libera para o frontend conectar
 app.add_middleware(
@@ -15,14 +73,6 @@ app.add_middleware(
 )
 
 
-# Estruturas de dados em memória
-
-produtos: List[dict] = []
-usuarios: List[dict] = []
-vendas: List[dict] = []
-carrinhos: Dict[str, List[dict]] = {}
-
-
 # Entrada de dados
 
 class ProductIn(BaseModel):
@@ -30,6 +80,15 @@ class ProductIn(BaseModel):
     preco: float
     quantidade: int
 
+class BulkProductIn(BaseModel):
+    nome: str
+    preco: float | None = None
+    quantidade: int | None = None
+
+class StockChangeIn(BaseModel):
+    nome: str
+    delta: int
+
 class ProductUpdate(BaseModel):
     novo_preco: float | None = None
     nova_quantidade: int | None = None
@@ -50,43 +109,117 @@ class NewUserIn(BaseModel):
 # Helpers
 
 def find_product(nome: str) -> dict | None:
-    return next((p for p in produtos if p["nome"].lower() == nome.lower()), None)
+    return catalogo.get(nome)
 
 def get_cart(username: str) -> List[dict]:
     if username not in carrinhos:
         carrinhos[username] = []
     return carrinhos[username]
 
+def salvar_carrinho(username: str):
+    persistencia.submit({"op": "set_cart", "usuario": username,
+                         "itens": [dict(item) for item in carrinhos.get(username, [])]})
+
+async def ressincronizar_estoque(nomes):
+    # Depois de uma venda recusada pelo banco, o estoque em memória está desatualizado.
+    # A fila é esvaziada e os produtos relidos sem ceder o event loop no meio, para nenhuma
+    # mutação em memória ficar entre as duas coisas (caminho raro: a leitura bloqueia o loop)
+    await persistencia.flush()
+    for nome in set(nomes):
+        produto, no_banco = find_product(nome), db.find_product(nome)
+        if produto is not None and no_banco is not None:
+            produto["quantidade"] = no_banco["quantidade"]
+    catalogo.touch()
+
+async def relatorio(metodo: str, *args):
+    # As vendas enfileiradas entram no relatório; a leitura roda fora do event loop
+    await persistencia.flush()
+    return await asyncio.to_thread(lambda: getattr(get_sales_analytics(db), metodo)(*args))
+
 
 # Rotas - Saúde
 
 @app.get("/")
-def health():
-    return {"status": "ok", "message": "API em memória rodando"}
+async def health():
+    return {"status": "ok", "message": "API rodando", "persistencia": persistencia.stats(),
+            "cache_produtos": cache_produtos.stats()}
 
 # Rotas - Produtos
 
-@app.get("/produtos", response_model=List[dict])
-def listar_produtos():
-    return produtos
+@app.get("/produtos")
+async def listar_produtos(
+    request: Request,
+    cursor: int | None = None,
+    limite: int = Query(100, ge=1, le=1000),
+    prefixo: str | None = None,
+    preco_min: float | None = None,
+    preco_max: float | None = None,
+    em_estoque: bool = False,
+):
+    # Página seguinte: repita a consulta com cursor=<proximo_cursor> até ele vir nulo.
+    # A ETag muda a cada alteração do catálogo; com If-None-Match igual a resposta é 304
+    versao = catalogo.version
+    cabecalhos = {"ETag": cache_produtos.etag(versao), "Cache-Control": "no-cache"}
+    if cache_produtos.not_modified_for(request.headers.get("if-none-match"), versao):
+        return Response(status_code=304, headers=cabecalhos)
+
+    def filtro(produto):
+        return ((preco_min is None or produto["preco"] >= preco_min)
+                and (preco_max is None or produto["preco"] <= preco_max)
+                and (not em_estoque or produto["quantidade"] > 0))
+
+    def montar():
+        filtrar = preco_min is not None or preco_max is not None or em_estoque
+        itens, proximo = catalogo.page(cursor, limite, prefix=prefixo, predicate=filtro if filtrar else None)
+        return json.dumps({"produtos": itens, "proximo_cursor": proximo}, ensure_ascii=False).encode()
+
+    chave = (cursor, limite, prefixo, preco_min, preco_max, em_estoque)
+    corpo = cache_produtos.body(versao, chave, montar)
+    return Response(corpo, media_type="application/json", headers=cabecalhos)
+
+@app.get("/produtos/busca")
+async def buscar_parecidos(q: str, limite: int = 5):
+    return [
+        {"produto": find_product(nome), "score": score}
+        for nome, score in busca_produtos.search(q, limit=limite)
+    ]
 
 @app.get("/produtos/{nome_produto}")
-def buscar_produto(nome_produto: str):
+async def buscar_produto(nome_produto: str):
     produto = find_product(nome_produto)
     if not produto:
         raise HTTPException(status_code=404, detail="Produto não encontrado")
     return produto
 
 @app.post("/produtos", status_code=201)
-def criar_produto(prod: ProductIn):
+async def criar_produto(prod: ProductIn):
     if find_product(prod.nome):
         raise HTTPException(status_code=400, detail="Produto já existe")
     produto = prod.dict()
-    produtos.append(produto)
+    catalogo.add(produto)
+    busca_produtos.add(produto["nome"])
+    persistencia.submit({"op": "add_product", "produto": dict(produto)})
     return produto
 
+@app.post("/produtos/bulk")
+async def carga_produtos(itens: List[BulkProductIn]):
+    # Inclui ou atualiza pelo nome, tudo ou nada, com uma única mutação gravada
+    produtos = [{k: v for k, v in item.dict().items() if v is not None} for item in itens]
+    ok, resultados = plan_upserts(produtos, find_product)
+    if not ok:
+        raise HTTPException(status_code=422, detail={"aplicado": False, "resultados": resultados})
+    for produto, resultado in zip(produtos, resultados):
+        if resultado["status"] == "criado":
+            catalogo.add(dict(produto))
+            busca_produtos.add(produto["nome"])
+        else:
+            find_product(produto["nome"]).update({k: v for k, v in produto.items() if k != "nome"})
+    catalogo.touch()
+    persistencia.submit({"op": "upsert_products", "produtos": produtos})
+    return {"aplicado": True, "resultados": resultados}
+
 @app.put("/produtos/{nome_produto}")
-def atualizar_produto(nome_produto: str, payload: ProductUpdate):
+async def atualizar_produto(nome_produto: str, payload: ProductUpdate):
     produto = find_product(nome_produto)
     if not produto:
         raise HTTPException(status_code=404, detail="Produto não encontrado")
@@ -94,77 +227,180 @@ def atualizar_produto(nome_produto: str, payload: ProductUpdate):
         produto["preco"] = payload.novo_preco
     if payload.nova_quantidade is not None:
         produto["quantidade"] = payload.nova_quantidade
+    catalogo.touch()
+    campos = {"preco": payload.novo_preco, "quantidade": payload.nova_quantidade}
+    persistencia.submit({"op": "update_product", "nome": produto["nome"],
+                         "campos": {k: v for k, v in campos.items() if v is not None}})
     return {"detail": "Produto atualizado com sucesso", "produto": produto}
 
 @app.delete("/produtos/{nome_produto}")
-def deletar_produto(nome_produto: str):
-    global produtos
-    produto = find_product(nome_produto)
+async def deletar_produto(nome_produto: str):
+    produto = catalogo.remove(nome_produto)
     if not produto:
         raise HTTPException(status_code=404, detail="Produto não encontrado")
-    produtos.remove(produto)
+    busca_produtos.remove(produto["nome"])
+    persistencia.submit({"op": "remove_product", "nome": produto["nome"]})
     return {"detail": "Produto removido com sucesso"}
 
+# Rotas - Estoque
+
+@app.patch("/estoque/bulk")
+async def ajustar_estoque(alteracoes: List[StockChangeIn]):
+    # Deltas de estoque (ex.: chegada de mercadoria), tudo ou nada
+    pares = [(a.nome, a.delta) for a in alteracoes]
+    ok, resultados = estoque.adjust(pares)
+    if not ok:
+        raise HTTPException(status_code=409, detail={"aplicado": False, "resultados": resultados})
+    persistencia.submit({"op": "update_stock_many", "alteracoes": [list(par) for par in pares]})
+    return {"aplicado": True, "resultados": resultados}
+
 # Rotas - Carrinho
 
 @app.post("/carrinho/{username}/adicionar")
-def adicionar_carrinho(username: str, item: AddToCartIn):
+async def adicionar_carrinho(username: str, item: AddToCartIn):
     produto = find_product(item.produto_nome)
     if not produto:
         raise HTTPException(status_code=404, detail="Produto não encontrado")
-    if produto["quantidade"] < item.quantidade:
+    if not estoque.reserve(username, produto["nome"], item.quantidade):
         raise HTTPException(status_code=400, detail="Quantidade indisponível")
 
     cart = get_cart(username)
-    cart.append({"nome": item.produto_nome, "quantidade": item.quantidade, "preco": produto["preco"]})
+    cart.append({"nome": produto["nome"], "quantidade": item.quantidade, "preco": produto["preco"]})
+    salvar_carrinho(username)
     return {"detail": "Produto adicionado ao carrinho", "carrinho": cart}
 
+@app.post("/carrinho/{username}/adicionar/lote")
+async def adicionar_carrinho_lote(username: str, itens: List[AddToCartIn]):
+    # Todas as linhas entram no carrinho, ou nenhuma
+    ok, resultados = estoque.reserve_many(username, [(i.produto_nome, i.quantidade) for i in itens])
+    if not ok:
+        raise HTTPException(status_code=409, detail={"aplicado": False, "resultados": resultados})
+
+    cart = get_cart(username)
+    for item in itens:
+        produto = find_product(item.produto_nome)
+        cart.append({"nome": produto["nome"], "quantidade": item.quantidade, "preco": produto["preco"]})
+    salvar_carrinho(username)
+    return {"aplicado": True, "resultados": resultados, "carrinho": cart}
+
 @app.post("/carrinho/{username}/remover")
-def remover_carrinho(username: str, payload: RemoveFromCartIn):
+async def remover_carrinho(username: str, payload: RemoveFromCartIn):
     cart = get_cart(username)
+    chave = normalize_name(payload.produto_nome)
     for item in cart:
-        if item["nome"].lower() == payload.produto_nome.lower():
+        if normalize_name(item["nome"]) == chave:
             if payload.quantidade is None or payload.quantidade >= item["quantidade"]:
                 cart.remove(item)
+                estoque.release(username, item["nome"], item["quantidade"])
             else:
                 item["quantidade"] -= payload.quantidade
+                estoque.release(username, item["nome"], payload.quantidade)
+            salvar_carrinho(username)
             return {"detail": "Item removido/atualizado", "carrinho": cart}
     raise HTTPException(status_code=404, detail="Produto não encontrado no carrinho")
 
 @app.get("/carrinho/{username}")
-def ver_carrinho(username: str):
+async def ver_carrinho(username: str):
     return {"usuario": username, "carrinho": get_cart(username)}
 
 @app.post("/carrinho/{username}/limpar")
-def limpar_carrinho(username: str):
+async def limpar_carrinho(username: str):
     carrinhos[username] = []
+    estoque.release(username)
+    salvar_carrinho(username)
     return {"detail": "Carrinho limpado"}
 
 @app.post("/carrinho/{username}/finalizar")
-def finalizar_compra(username: str):
+async def finalizar_compra(username: str):
     cart = get_cart(username)
     if not cart:
         raise HTTPException(status_code=400, detail="Carrinho vazio")
-    total = sum(item["preco"] * item["quantidade"] for item in cart)
-    vendas.append({"usuario": username, "itens": cart.copy(), "total": total})
+    # Confere e baixa todas as linhas de uma vez em memória (recusa rápida)
+    ok, falta = estoque.checkout(username, [(item["nome"], item["quantidade"]) for item in cart])
+    if not ok:
+        raise HTTPException(status_code=409, detail=f"Estoque insuficiente para {falta}")
+    # Os itens saem do carrinho já, para um segundo 'finalizar' não vender de novo
+    itens = list(cart)
     carrinhos[username] = []
+    total = sum(item["preco"] * item["quantidade"] for item in itens)
+    registro = {"op": "checkout", "venda": {
+        "usuario": username,
+        "itens": [
+            {
+                "produto": item["nome"],
+                "quantidade": item["quantidade"],
+                "preco_unitario": item["preco"],
+                "subtotal": item["preco"] * item["quantidade"],
+            }
+            for item in itens
+        ],
+        "total": total,
+        "data": datetime.now().isoformat(),
+    }}
+
+    # Só responde depois de o banco gravar a venda: ele confere de novo o estoque,
+    # que outro processo (main.py, backend/app.py) pode ter vendido nesse meio tempo
+    try:
+        gravada = await persistencia.commit(registro)
+    except Exception:
+        gravada = None
+    if not gravada:
+        carrinhos[username] = itens + get_cart(username)
+        salvar_carrinho(username)
+        await ressincronizar_estoque(item["nome"] for item in itens)
+        if gravada is None:
+            raise HTTPException(status_code=503, detail="Não foi possível gravar a venda; tente de novo")
+        raise HTTPException(status_code=409, detail=f"Estoque insuficiente para {registro.get('falta')}")
+    salvar_carrinho(username)
     return {"detail": "Compra finalizada", "total": total}
 
 
 # Rotas - Usuários e Vendas
 
 @app.get("/usuarios")
-def listar_usuarios():
+async def listar_usuarios():
     return usuarios
 
 @app.post("/usuarios", status_code=201)
-def criar_usuario(payload: NewUserIn):
-    if any(u["nome"].lower() == payload.nome.lower() for u in usuarios):
+async def criar_usuario(payload: NewUserIn):
+    chave = normalize_name(payload.nome)
+    if any(normalize_name(u["nome"]) == chave for u in usuarios):
         raise HTTPException(status_code=400, detail="Usuário já existe")
     novo = {"nome": payload.nome, "nivel_acesso": payload.nivel_acesso}
     usuarios.append(novo)
+    persistencia.submit({"op": "add_user", "usuario": dict(novo)})
     return novo
 
 @app.get("/vendas")
-def listar_vendas():
-    return vendas
\ No newline at end of file
+async def listar_vendas(usuario: str | None = None):
+    # Uma venda por linha (JSON Lines), enviada em blocos conforme é lida
+    filtro = (lambda v: v.get("usuario") == usuario) if usuario else None
+
+    def gerar_linhas():
+        for venda in db.iter_sales(filter=filtro):
+            yield json.dumps(venda, ensure_ascii=False) + "\n"
+
+    # Gerador síncrono: o Starlette o percorre em uma thread, fora do event loop
+    await persistencia.flush()
+    return StreamingResponse(gerar_linhas(), media_type="application/x-ndjson")
+
+
+# Rotas - Relatórios (rollups mantidos a cada venda, sem reler o histórico)
+
+@app.get("/relatorios/produtos")
+async def relatorio_produtos():
+    return await relatorio("revenue_by_product")
+
+@app.get("/relatorios/usuarios")
+async def relatorio_usuarios():
+    return await relatorio("revenue_by_user")
+
+@app.get("/relatorios/dias")
+async def relatorio_dias():
+    return await relatorio("revenue_by_day")
+
+@app.get("/relatorios/mais-vendidos")
+async def relatorio_mais_vendidos(k: int = 10, por: str = "quantidade"):
+    if por not in ("quantidade", "receita"):
+        raise HTTPException(status_code=400, detail="Parâmetro 'por' deve ser 'quantidade' ou 'receita'")
+    return await relatorio("top_sellers", k, por)
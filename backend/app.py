@@ -1,20 +1,26 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import sys
 import os
+import json
+import threading
 
 # Adicionar o diretório raiz ao path para importar os módulos
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Importar o sistema original que criamos
 from main import VoiceSupermarketSystem
+from modules.http_cache import VersionedResponseCache
 
 app = Flask(__name__)
 CORS(app)  # Permitir requests do React
 
-# Inicializar o MESMO sistema que já temos
+# Inicializar o MESMO sistema que já temos (TTS, microfone e ML só carregam no primeiro uso)
 sistema_voz = VoiceSupermarketSystem()
 
+# Corpo de /api/products já serializado, por versão do banco (ETag / 304)
+cache_produtos = VersionedResponseCache()
+
 # Variável para controle de sessão
 sessoes_ativas = {}
 
@@ -27,6 +33,17 @@ def health_check():
         "versao": "1.0"
     })
 
+@app.route('/api/voice-model-cache', methods=['GET'])
+def voice_model_cache_stats():
+    """Acertos e falhas do cache de modelos de voz"""
+    return jsonify({"success": True, "cache": sistema_voz.model_cache.stats()})
+
+@app.route('/api/audio-stats', methods=['GET'])
+def audio_stats():
+    """Duração média gravada, CPU da extração de características e fila de fala"""
+    return jsonify({"success": True, "vad": sistema_voz.use_vad, "audio": sistema_voz.audio_stats.summary(),
+                    "tts": sistema_voz.tts.stats()})
+
 @app.route('/api/register', methods=['POST'])
 def register_user():
     """Inicia cadastro de novo usuário"""
@@ -98,14 +115,20 @@ def login_user():
         username = data.get('username')
         
         if not username:
-            return jsonify({"success": False, "message": "Username é obrigatório"})
-        
-        # CORREÇÃO: Adicionar verificação se usuário existe
-        if not sistema_voz.user_exists(username):
-            return jsonify({"success": False, "message": "Usuário não encontrado"})
+            # Sem nome: identifica o usuário só pela frase de acesso
+            username = sistema_voz.identify_voice()
+            if not username:
+                return jsonify({"success": False, "message": "Voz não identificada. Informe o username"})
+            autenticado = True
+        else:
+            # CORREÇÃO: Adicionar verificação se usuário existe
+            if not sistema_voz.user_exists(username):
+                return jsonify({"success": False, "message": "Usuário não encontrado"})
+            
+            # Usar o MESMO método de autenticação
+            autenticado = sistema_voz.authenticate_user(username)
         
-        # Usar o MESMO método de autenticação
-        if sistema_voz.authenticate_user(username):
+        if autenticado:
             # Criar sessão ativa
             sessoes_ativas[username] = {
                 'tipo': 'logado',
@@ -131,13 +154,22 @@ def get_products():
     """Retorna lista de produtos"""
     try:
         # CORREÇÃO: Não chamar list_products_voice() pois faz síntese de voz
-        products = sistema_voz.load_data()['produtos']
+        # A versão do banco muda a cada gravação; se o cliente já tem essa versão, 304
+        versao = sistema_voz.db.data_version()
+        cabecalhos = {"ETag": cache_produtos.etag(versao), "Cache-Control": "no-cache"}
+        if cache_produtos.not_modified_for(request.headers.get('If-None-Match'), versao):
+            return Response(status=304, headers=cabecalhos)
         
-        return jsonify({
-            "success": True,
-            "products": products,
-            "count": len(products)
-        })
+        def montar():
+            products = sistema_voz.read_data()['produtos']
+            return json.dumps({
+                "success": True,
+                "products": products,
+                "count": len(products)
+            }).encode()
+        
+        corpo = cache_produtos.body(versao, 'produtos', montar)
+        return Response(corpo, mimetype='application/json', headers=cabecalhos)
     except Exception as e:
         return jsonify({"success": False, "message": f"Erro: {str(e)}"})
 
@@ -170,7 +202,7 @@ def process_voice_command():
         
         # Adicionar dados específicos baseados no comando
         if 'listar' in command_text:
-            products = sistema_voz.load_data()['produtos']
+            products = sistema_voz.read_data()['produtos']
             response_data['data'] = products
             response_data['type'] = 'products_list'
             
@@ -274,4 +306,8 @@ if __name__ == '__main__':
     print("   GET  /api/cart")
     print("   POST /api/checkout")
     
+    # Carrega os modelos de voz em segundo plano, sem atrasar a primeira requisição
+    threading.Thread(target=sistema_voz.prewarm_voice_models, daemon=True).start()
+    sistema_voz.warm_prompts()
+    
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -1,125 +1,278 @@
-import pyttsx3
-import json
 import os
-import numpy as np
+import threading
 import warnings
-import sounddevice as sd
-import wavio
-from sklearn.mixture import GaussianMixture
-import librosa
-import joblib
 from datetime import datetime
-import speech_recognition as sr
-import requests
 from time import sleep
+from modules.asr import build_grammar, create_recognizer
+from modules.audio import (SAMPLE_RATE, AudioTurnStats, extract_mfcc_features, listen_for_barge_in,
+                           record_samples, record_until_silence, to_audio_data)
+from modules.database import create_database_manager
+from modules.intent import IntentParser, parse_number, tokenize
+from modules.speaker_models import SpeakerIdentifier, SpeakerModelCache
+from modules.speaker_store import SpeakerModelStore
+from modules.product_manager import ProductManager
+from modules.prompt_cache import PromptCache
+from modules.tts import SpeechWorker
+
+# pyttsx3, speech_recognition e sklearn são importados no primeiro uso:
+# importar este módulo (e subir o backend) não espera pelas pilhas de áudio e ML
 
 warnings.filterwarnings('ignore')
 
+_NAO_INICIADO = object()
+
+# Vocabulário dos comandos de voz, na ordem em que são testados; também
+# forma a gramática do reconhecedor offline
+COMANDOS_MENU = (
+    ('register_user', ('cadastrar', 'registrar', 'novo')),
+    ('login', ('login', 'entrar', 'acessar')),
+    ('sair', ('sair', 'terminar', 'fechar')),
+)
+COMANDOS_VOZ = (
+    ('add_product_voice', ('cadastrar', 'cadastro', 'adicionar')),
+    ('list_products_voice', ('listar', 'mostrar', 'ver')),
+    ('update_product_voice', ('atualizar', 'alterar', 'mudar')),
+    ('remove_product_voice', ('remover', 'excluir', 'deletar')),
+    ('add_to_cart_voice', ('comprar', 'adicionar carrinho')),
+    ('view_cart_voice', ('carrinho', 'meu carrinho')),
+    ('checkout_voice', ('finalizar', 'concluir', 'checkout')),
+    ('sair', ('sair', 'logout', 'terminar')),
+)
+# Ações que aceitam o produto (e a quantidade) já na frase do comando;
+# com um produto na frase, elas vencem as demais ("adicionar arroz ao carrinho")
+ACOES_COM_PRODUTO = ('add_to_cart_voice', 'remove_product_voice', 'update_product_voice')
+
+# Frases fixas do sistema: pré-renderizadas no cache de voz na inicialização
+PROMPTS_FIXOS = (
+    "Estou ouvindo",
+    "Estou ouvindo seu comando...",
+    "Gravando... Por favor, fale agora",
+    "Diga: cadastrar para novo usuário, login para entrar, ou sair",
+    "Sistema de supermercado com reconhecimento de voz iniciado!",
+    "Sistema de voz ativado. Aguardando seus comandos.",
+    "Comando não reconhecido. Tente novamente.",
+    "Não consegui entender o comando. Tente novamente.",
+    "Não entendi o que você disse. Poderia repetir?",
+    "Não ouvi nada. Tente novamente.",
+    "Erro de conexão. Verifique sua internet.",
+    "Microfone não disponível. Usando gravação alternativa.",
+    "Por favor, diga seu nome de usuário",
+    "Por favor, repita a frase: Eu quero acessar o sistema",
+    "Não consegui identificar sua voz. Por favor, diga seu nome de usuário",
+    "Usuário já existe. Tente outro nome.",
+    "Usuário não encontrado.",
+    "Falha na autenticação por voz.",
+    "Falha no cadastro da voz. Tente novamente.",
+    "Diga o nome do produto",
+    "Diga o preço do produto",
+    "Diga a quantidade em estoque",
+    "Diga o nome do produto que deseja atualizar",
+    "Diga o novo preço",
+    "Diga a nova quantidade",
+    "Diga o nome do produto que deseja remover",
+    "Diga o nome do produto que deseja comprar",
+    "Diga a quantidade desejada",
+    "Produto não encontrado.",
+    "Produto atualizado com sucesso!",
+    "Produto removido com sucesso!",
+    "Não há produtos cadastrados.",
+    "Erro ao processar os dados. Tente novamente.",
+    "Erro ao processar a quantidade. Tente novamente.",
+    "Seu carrinho está vazio.",
+    "Itens no seu carrinho:",
+    "Obrigado pela compra!",
+    "Saindo do sistema. Até logo!",
+    "Gravação 1 de 3. Fale agora",
+    "Gravação 2 de 3. Fale agora",
+    "Gravação 3 de 3. Fale agora",
+)
+# Frases com partes variáveis ('{}') que também vão para o cache ao serem faladas
+PROMPTS_MODELOS = (
+    "Olá {}, vou cadastrar sua voz",
+    "Usuário {} cadastrado com sucesso!",
+    "Bem-vindo, {}! Autenticação por voz bem-sucedida.",
+    "Produto {} já está cadastrado.",
+    "Produto {} cadastrado com sucesso!",
+    "Adicionado {} ao carrinho",
+    "Estoque insuficiente para {}. Compra não finalizada.",
+)
+
+
 class VoiceSupermarketSystem:
     def __init__(self):
-        try:
-            self.engine = pyttsx3.init()
-            voices = self.engine.getProperty('voices')
-            for voice in voices:
-                if 'portuguese' in voice.name.lower() or 'brazil' in voice.name.lower():
-                    self.engine.setProperty('voice', voice.id)
-                    break
-            print("Sistema de voz inicializado com sucesso!")
-        except Exception as e:
-            print(f"Erro ao inicializar síntese de voz: {e}")
-            self.engine = None
-        
-        self.recognizer = sr.Recognizer()
-        self.microphone = None
-        try:
-            self.microphone = sr.Microphone()
-            print("Microfone detectado!")
-        except:
-            print("Microfone não detectado. Usando gravação alternativa.")
+        # Síntese de voz, reconhecedor e microfone só são criados no primeiro uso.
+        # A fala roda em uma thread própria: speak() não bloqueia quem chama
+        self.prompt_cache = PromptCache("tts_cache", prompts=PROMPTS_FIXOS, templates=PROMPTS_MODELOS)
+        self.tts = SpeechWorker(self._init_engine, prompt_cache=self.prompt_cache)
+        self.barge_in = True
+        self._recognizer = None
+        self._microphone = _NAO_INICIADO
+        self._asr = None
+        self._init_lock = threading.Lock()
         
         self.current_user = None
-        self.database_file = "database.json"
+        self.db = create_database_manager()
+        self.products = ProductManager(self.db)
+        self.database_file = self.db.database_file
         self.voice_profiles_dir = "voice_profiles"
         self.carrinho = []
         
+        # Com VAD a gravação para quando a fala termina e o silêncio é descartado;
+        # desligue para comparar em audio_stats
+        self.use_vad = True
+        self.audio_stats = AudioTurnStats()
+        
         os.makedirs(self.voice_profiles_dir, exist_ok=True)
+        self.model_cache = SpeakerModelCache(self.voice_profiles_dir)
+        self.model_store = SpeakerModelStore(self.voice_profiles_dir)
+        self.speaker_identifier = SpeakerIdentifier(self.model_store)
+        
+        # Comandos e campos (produto, quantidade) reconhecidos em uma frase só
+        self.menu_intents = IntentParser(COMANDOS_MENU)
+        self.intents = IntentParser(COMANDOS_VOZ)
+        self._intent_produtos = None
         self.initialize_database()
     
     def initialize_database(self):
-        """Inicializa o arquivo JSON se não existir"""
-        if not os.path.exists(self.database_file):
-            data = {
-                "produtos": [
-                    {"id": 1, "nome": "arroz", "preco": 5.99, "quantidade": 50},
-                    {"id": 2, "nome": "feijão", "preco": 4.5, "quantidade": 30},
-                    {"id": 3, "nome": "açúcar", "preco": 3.75, "quantidade": 40},
-                    {"id": 4, "nome": "café", "preco": 8.99, "quantidade": 25},
-                    {"id": 5, "nome": "óleo", "preco": 4.25, "quantidade": 35}
-                ],
-                "usuarios": [],
-                "vendas": []
-            }
-            self.save_data(data)
+        """Popula o banco com produtos de exemplo se ele estiver vazio"""
+        data = self.db.read_data()
+        if not (data['produtos'] or data['usuarios'] or data['vendas']):
+            # Uma gravação só, recusada se outro processo já tiver gravado algo
+            self.db.commit({'op': 'seed_products', 'produtos': [
+                {"id": 1, "nome": "arroz", "preco": 5.99, "quantidade": 50},
+                {"id": 2, "nome": "feijão", "preco": 4.5, "quantidade": 30},
+                {"id": 3, "nome": "açúcar", "preco": 3.75, "quantidade": 40},
+                {"id": 4, "nome": "café", "preco": 8.99, "quantidade": 25},
+                {"id": 5, "nome": "óleo", "preco": 4.25, "quantidade": 35}
+            ]})
     
-    def load_data(self):
-        """Carrega dados do arquivo JSON"""
+    def _init_engine(self):
+        """Cria o motor pyttsx3 (chamado pela thread de fala; None se indisponível)"""
         try:
-            with open(self.database_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {"produtos": [], "usuarios": [], "vendas": []}
-    
-    def save_data(self, data):
-        """Salva dados no arquivo JSON"""
-        with open(self.database_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    
-    def speak(self, text):
-        """Fala o texto usando síntese de voz"""
+            import pyttsx3
+            engine = pyttsx3.init()
+            voices = engine.getProperty('voices')
+            for voice in voices:
+                if 'portuguese' in voice.name.lower() or 'brazil' in voice.name.lower():
+                    engine.setProperty('voice', voice.id)
+                    break
+            print("Sistema de voz inicializado com sucesso!")
+            return engine
+        except Exception as e:
+            print(f"Erro ao inicializar síntese de voz: {e}")
+            return None
+    
+    @property
+    def recognizer(self):
+        """Reconhecedor do speech_recognition, criado no primeiro uso"""
+        if self._recognizer is None:
+            import speech_recognition as sr
+            self._recognizer = sr.Recognizer()
+        return self._recognizer
+    
+    @property
+    def microphone(self):
+        """Microfone a 16 kHz, detectado no primeiro uso (None se indisponível)"""
+        if self._microphone is _NAO_INICIADO:
+            with self._init_lock:
+                if self._microphone is _NAO_INICIADO:
+                    try:
+                        import speech_recognition as sr
+                        # Captura direto em 16 kHz, a taxa usada pelos MFCCs
+                        self._microphone = sr.Microphone(sample_rate=SAMPLE_RATE)
+                        print("Microfone detectado!")
+                    except Exception:
+                        print("Microfone não detectado. Usando gravação alternativa.")
+                        self._microphone = None
+        return self._microphone
+    
+    @property
+    def asr(self):
+        """Reconhecedor de fala (ver modules/asr.py e SUPERMERCADO_ASR)"""
+        if self._asr is None:
+            self._asr = create_recognizer(recognizer=self.recognizer, grammar=self.asr_grammar)
+        return self._asr
+    
+    def asr_grammar(self):
+        """Gramática do reconhecedor offline: comandos, números e produtos do catálogo"""
+        produtos = [p['nome'] for p in self.read_data()['produtos']]
+        return build_grammar([words for _, words in COMANDOS_MENU + COMANDOS_VOZ], produtos)
+    
+    def load_data(self):
+        """Carrega uma cópia editável dos dados"""
+        return self.db.load_data()
+    
+    def read_data(self):
+        """Retorna uma visão somente leitura dos dados (em cache)"""
+        return self.db.read_data()
+    
+    def speak(self, text, wait=False):
+        """Fala o texto usando síntese de voz, sem bloquear (wait=True espera terminar)"""
         print(f"Sistema: {text}")
-        if self.engine:
+        return self.tts.speak(text, wait)
+    
+    def warm_prompts(self):
+        """Renderiza em segundo plano as frases fixas que ainda não estão no cache de voz"""
+        self.tts.warm(PROMPTS_FIXOS)
+    
+    def wait_speech_output(self):
+        """Espera o sistema terminar de falar antes de ouvir o microfone
+
+        Se o usuário começar a falar antes (barge-in), a fala é interrompida.
+        """
+        if not self.tts.busy():
+            return
+        if self.barge_in:
             try:
-                self.engine.say(text)
-                self.engine.runAndWait()
-            except Exception as e:
-                print(f"Erro ao falar: {e}")
+                if listen_for_barge_in(self.tts.idle):
+                    self.tts.cancel()
+            except Exception:
+                # Sem sounddevice ou sem dispositivo: apenas espera
+                pass
+        self.tts.wait()
     
-    def record_audio(self, filename, duration=3, sample_rate=16000):
-        """Grava áudio usando sounddevice"""
+    def record_audio(self, duration=3, sample_rate=SAMPLE_RATE):
+        """Grava até 'duration' segundos com sounddevice e devolve as amostras em memória"""
         try:
             self.speak("Gravando... Por favor, fale agora")
+            self.wait_speech_output()
             print("🎤 Gravando áudio...")
             
-            audio = sd.rec(int(duration * sample_rate), 
-                          samplerate=sample_rate, 
-                          channels=1, 
-                          dtype='float32')
-            sd.wait()
-            
-            wavio.write(filename, audio, sample_rate, sampwidth=2)
-            return True
+            if self.use_vad:
+                samples = record_until_silence(duration, sample_rate)
+            else:
+                samples = record_samples(duration, sample_rate)
+            self.audio_stats.add_recording(samples, sample_rate)
+            return samples
             
         except Exception as e:
             print(f"Erro ao gravar áudio: {e}")
-            return False
+            return None
     
-    def listen_speech(self, timeout=5, phrase_time_limit=5):
-        """Ouve e reconhece fala usando Google Speech Recognition"""
+    def listen_speech(self, timeout=5, phrase_time_limit=5, restricted=True):
+        """Ouve e reconhece fala com o reconhecedor configurado
+
+        Com restricted=False (nomes de usuário e de produtos novos) o
+        reconhecedor offline não se limita à gramática de comandos.
+        """
+        import speech_recognition as sr
+        
         try:
             if not self.microphone:
                 self.speak("Microfone não disponível. Usando gravação alternativa.")
-                return self.listen_alternative()
+                return self.listen_alternative(restricted)
             
+            self.wait_speech_output()
             with self.microphone as source:
                 self.recognizer.adjust_for_ambient_noise(source)
                 print("🎤 Estou ouvindo... Fale agora!")
-                self.speak("Estou ouvindo")
+                self.speak("Estou ouvindo", wait=True)
                 
                 audio = self.recognizer.listen(source, timeout=timeout, phrase_time_limit=phrase_time_limit)
             
-            text = self.recognizer.recognize_google(audio, language='pt-BR')
+            text = self.asr.recognize(audio, restricted)
             print(f"👤 Usuário disse: {text}")
-            return text.lower()
+            return text
             
         except sr.UnknownValueError:
             self.speak("Não entendi o que você disse. Poderia repetir?")
@@ -135,29 +288,23 @@ class VoiceSupermarketSystem:
             print(f"Erro inesperado: {e}")
             return None
     
-    def listen_alternative(self):
+    def listen_alternative(self, restricted=True):
         """Método alternativo se o microfone não funcionar"""
-        audio_file = os.path.join(self.voice_profiles_dir, "temp_speech.wav")
-        if self.record_audio(audio_file, duration=5):
+        samples = self.record_audio(duration=5)
+        if samples is not None:
             try:
-                with sr.AudioFile(audio_file) as source:
-                    audio = self.recognizer.record(source)
-                text = self.recognizer.recognize_google(audio, language='pt-BR')
+                audio = to_audio_data(samples)
+                text = self.asr.recognize(audio, restricted)
                 print(f"👤 Usuário disse: {text}")
-                return text.lower()
+                return text
             except:
                 pass
-            finally:
-                if os.path.exists(audio_file):
-                    os.remove(audio_file)
         return None
     
-    def extract_voice_features(self, audio_file):
-        """Extrai características MFCC da voz"""
+    def extract_voice_features(self, audio, sample_rate=SAMPLE_RATE):
+        """Extrai características MFCC da voz a partir do áudio em memória"""
         try:
-            y, sr = librosa.load(audio_file, sr=16000)
-            mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
-            return np.mean(mfcc.T, axis=0)
+            return extract_mfcc_features(audio, sample_rate, trim=self.use_vad, stats=self.audio_stats)
         except Exception as e:
             print(f"Erro ao extrair características: {e}")
             return None
@@ -171,21 +318,21 @@ class VoiceSupermarketSystem:
         for i in range(3):
             self.speak(f"Gravação {i+1} de 3. Fale agora")
             
-            audio_file = os.path.join(self.voice_profiles_dir, f"{username}_sample_{i}.wav")
-            if self.record_audio(audio_file, duration=3):
-                features = self.extract_voice_features(audio_file)
+            samples = self.record_audio(duration=3)
+            if samples is not None:
+                features = self.extract_voice_features(samples)
                 if features is not None:
                     features_list.append(features)
-                if os.path.exists(audio_file):
-                    os.remove(audio_file)
             sleep(1)
         
         if features_list:
+            from sklearn.mixture import GaussianMixture
+            
             gmm = GaussianMixture(n_components=3, covariance_type='diag')
             gmm.fit(features_list)
             
-            model_file = os.path.join(self.voice_profiles_dir, f"{username}_gmm.pkl")
-            joblib.dump(gmm, model_file)
+            self.model_store.add(username, gmm)
+            self.model_cache.invalidate(username)
             
             return True
         return False
@@ -194,26 +341,48 @@ class VoiceSupermarketSystem:
         """Verifica se a voz corresponde ao usuário"""
         self.speak("Por favor, repita a frase: Eu quero acessar o sistema")
         
-        audio_file = os.path.join(self.voice_profiles_dir, "temp_verify.wav")
-        if not self.record_audio(audio_file, duration=3):
+        samples = self.record_audio(duration=3)
+        if samples is None:
             return False
         
-        features = self.extract_voice_features(audio_file)
+        features = self.extract_voice_features(samples)
         if features is None:
             return False
         
-        if os.path.exists(audio_file):
-            os.remove(audio_file)
-        
-        model_file = os.path.join(self.voice_profiles_dir, f"{username}_gmm.pkl")
-        if not os.path.exists(model_file):
+        gmm = self.model_store.get(username)
+        if gmm is None:
+            # Modelo antigo em pickle, ainda não convertido (python -m modules.speaker_store)
+            gmm = self.model_cache.get(username)
+        if gmm is None:
             return False
         
-        gmm = joblib.load(model_file)
         score = gmm.score([features])
         
         return score > -50 
     
+    def identify_voice(self):
+        """Identifica o usuário só pela frase de acesso (1:N entre todos os cadastrados)"""
+        self.speak("Por favor, repita a frase: Eu quero acessar o sistema")
+        
+        samples = self.record_audio(duration=3)
+        if samples is None:
+            return None
+        
+        features = self.extract_voice_features(samples)
+        if features is None:
+            return None
+        
+        username = self.speaker_identifier.best_match(features)
+        if username is not None and self.user_exists(username):
+            return username
+        return None
+    
+    def prewarm_voice_models(self, usernames=None):
+        """Carrega no cache os modelos de voz (por padrão, de todos os usuários)"""
+        if usernames is None:
+            usernames = [u['nome'] for u in self.read_data()['usuarios']]
+        return self.model_cache.prewarm(usernames)
+    
     def listen_command(self):
         """Ouve um comando de voz"""
         self.speak("Estou ouvindo seu comando...")
@@ -228,22 +397,19 @@ class VoiceSupermarketSystem:
     
     def user_exists(self, username):
         """Verifica se usuário existe"""
-        data = self.load_data()
-        return any(u['nome'] == username for u in data['usuarios'])
+        return self.db.user_exists(username)
     
     def add_user(self, username):
         """Adiciona usuário ao banco de dados"""
-        data = self.load_data()
-        data['usuarios'].append({
+        return self.db.commit({'op': 'add_user', 'usuario': {
             'nome': username,
             'data_cadastro': datetime.now().isoformat()
-        })
-        self.save_data(data)
+        }})
     
     def register_user(self):
         """Cadastra novo usuário"""
         self.speak("Por favor, diga seu nome de usuário")
-        username = self.listen_speech()
+        username = self.listen_speech(restricted=False)
         
         if not username:
             return
@@ -258,13 +424,24 @@ class VoiceSupermarketSystem:
         else:
             self.speak("Falha no cadastro da voz. Tente novamente.")
     
-    def authenticate_user(self):
-        """Autentica usuário por voz"""
-        self.speak("Por favor, diga seu nome de usuário")
-        username = self.listen_speech()
-        
-        if not username:
-            return False
+    def authenticate_user(self, username=None):
+        """Autentica usuário por voz
+
+        Sem nome, identifica o usuário só pela frase de acesso; se a
+        identificação for ambígua, pede o nome e faz a verificação 1:1.
+        """
+        if username is None:
+            username = self.identify_voice()
+            if username is not None:
+                self.current_user = username
+                self.speak(f"Bem-vindo, {username}! Autenticação por voz bem-sucedida.")
+                return True
+            
+            self.speak("Não consegui identificar sua voz. Por favor, diga seu nome de usuário")
+            username = self.listen_speech(restricted=False)
+            
+            if not username:
+                return False
         
         if not self.user_exists(username):
             self.speak("Usuário não encontrado.")
@@ -279,47 +456,61 @@ class VoiceSupermarketSystem:
             return False
     
     def find_product(self, name):
-        """Encontra produto pelo nome"""
-        data = self.load_data()
-        for produto in data['produtos']:
-            if produto['nome'].lower() == name.lower():
-                return produto
-        return None
+        """Encontra produto pelo nome, tolerando erros do reconhecedor ("feijam" -> "Feijão")"""
+        return self.products.match_product(name)
+    
+    def parse_command(self, command):
+        """Ação, produto e quantidade de uma frase (ver modules/intent.py)"""
+        produtos = self.read_data()['produtos']
+        if produtos is not self._intent_produtos:
+            self.intents.set_products(p['nome'] for p in produtos)
+            self._intent_produtos = produtos
+        return self.intents.parse(command)
     
     def handle_voice_command(self, command):
-        """Processa comandos de voz"""
+        """Processa comandos de voz
+
+        Produto e quantidade ditos junto com o comando ("comprar dois pacotes
+        de arroz") não são perguntados de novo.
+        """
         if not command:
             return True
-            
-        if any(word in command for word in ['cadastrar', 'cadastro', 'adicionar']):
-            self.add_product_voice()
-        elif any(word in command for word in ['listar', 'mostrar', 'ver']):
-            self.list_products_voice()
-        elif any(word in command for word in ['atualizar', 'alterar', 'mudar']):
-            self.update_product_voice()
-        elif any(word in command for word in ['remover', 'excluir', 'deletar']):
-            self.remove_product_voice()
-        elif any(word in command for word in ['comprar', 'adicionar carrinho']):
-            self.add_to_cart_voice()
-        elif any(word in command for word in ['carrinho', 'meu carrinho']):
-            self.view_cart_voice()
-        elif any(word in command for word in ['finalizar', 'concluir', 'checkout']):
-            self.checkout_voice()
-        elif any(word in command for word in ['sair', 'logout', 'terminar']):
+        
+        intent = self.parse_command(command)
+        if not intent['produto'] and intent['resto'] and any(
+                a in ACOES_COM_PRODUTO or a == 'view_cart_voice' for a in intent['acoes']):
+            # O produto pode ter vindo com um erro do reconhecedor ("comprar dois arros")
+            produto = self.find_product(intent['resto'])
+            if produto:
+                intent['produto'] = produto['nome']
+        action = intent['acao']
+        if intent['produto']:
+            action = next((a for a in intent['acoes'] if a in ACOES_COM_PRODUTO), action)
+            # "adicionar <produto> ao carrinho": o produto já existe, então é compra
+            if action == 'add_product_voice' and 'view_cart_voice' in intent['acoes']:
+                action = 'add_to_cart_voice'
+        
+        if action == 'sair':
             self.speak("Saindo do sistema. Até logo!")
             return False
+        elif action == 'add_to_cart_voice':
+            self.add_to_cart_voice(intent['produto'], intent['quantidade'])
+        elif action in ACOES_COM_PRODUTO:
+            getattr(self, action)(intent['produto'])
+        elif action:
+            getattr(self, action)()
         else:
             self.speak("Comando não reconhecido. Tente novamente.")
         return True
     
-    def get_voice_input(self, prompt):
+    def get_voice_input(self, prompt, restricted=True):
         """Obtém entrada de voz com prompt específico"""
         self.speak(prompt)
-        return self.listen_speech()
+        return self.listen_speech(restricted=restricted)
     
     def add_product_voice(self):
         """Cadastra produto por voz"""
-        nome = self.get_voice_input("Diga o nome do produto")
+        nome = self.get_voice_input("Diga o nome do produto", restricted=False)
         if not nome:
             return
         
@@ -335,17 +526,10 @@ class VoiceSupermarketSystem:
             preco = self.parse_price(preco_str)
             quantidade = self.parse_quantity(quantidade_str)
             
-            data = self.load_data()
-            product_id = len(data['produtos']) + 1
-            
-            data['produtos'].append({
-                'id': product_id,
-                'nome': nome,
-                'preco': preco,
-                'quantidade': quantidade
-            })
+            if not self.products.add_product(nome, preco, quantidade):
+                self.speak(f"Produto {nome} já está cadastrado.")
+                return
             
-            self.save_data(data)
             self.speak(f"Produto {nome} cadastrado com sucesso!")
             
         except (ValueError, AttributeError):
@@ -375,24 +559,19 @@ class VoiceSupermarketSystem:
     
     def parse_quantity(self, quantity_str):
         """Converte string de quantidade para int"""
-        number_words = {
-            'um': 1, 'dois': 2, 'três': 3, 'quatro': 4, 'cinco': 5,
-            'seis': 6, 'sete': 7, 'oito': 8, 'nove': 9, 'dez': 10,
-            'vinte': 20, 'trinta': 30, 'quarenta': 40, 'cinquenta': 50
-        }
-        
         try:
             return int(quantity_str)
         except ValueError:
-            words = quantity_str.split()
-            for word in words:
-                if word in number_words:
-                    return number_words[word]
+            tokens = tokenize(quantity_str)
+            for i in range(len(tokens)):
+                numero = parse_number(tokens, i)
+                if numero:
+                    return numero[0]
             return 1  # Valor padrão
     
     def list_products_voice(self):
         """Lista produtos por voz"""
-        data = self.load_data()
+        data = self.read_data()
         produtos = data['produtos']
         
         if not produtos:
@@ -403,16 +582,26 @@ class VoiceSupermarketSystem:
         for produto in produtos:
             self.speak(f"{produto['nome']} - {produto['preco']} reais - Estoque: {produto['quantidade']}")
     
-    def update_product_voice(self):
-        """Atualiza produto por voz"""
+    def ask_product(self, prompt):
+        """Pergunta o produto; devolve (produto, quantidade dita junto ou None)"""
         self.list_products_voice()
-        nome = self.get_voice_input("Diga o nome do produto que deseja atualizar")
-        if not nome:
-            return
+        resposta = self.get_voice_input(prompt)
+        if not resposta:
+            return None, None
         
-        produto = self.find_product(nome)
+        intent = self.parse_command(resposta)
+        produto = self.find_product(intent['produto'] or resposta)
         if not produto:
             self.speak("Produto não encontrado.")
+        return produto, intent['quantidade']
+    
+    def update_product_voice(self, nome=None):
+        """Atualiza produto por voz"""
+        if nome:
+            produto = self.find_product(nome)
+        else:
+            produto, _ = self.ask_product("Diga o nome do produto que deseja atualizar")
+        if not produto:
             return
         
         preco_str = self.get_voice_input("Diga o novo preço")
@@ -427,50 +616,45 @@ class VoiceSupermarketSystem:
             novo_preco = self.parse_price(preco_str)
             nova_quantidade = self.parse_quantity(quantidade_str)
             
-            data = self.load_data()
-            for p in data['produtos']:
-                if p['id'] == produto['id']:
-                    p['preco'] = novo_preco
-                    p['quantidade'] = nova_quantidade
-                    break
-            
-            self.save_data(data)
+            self.products.update_product(produto['nome'], novo_preco, nova_quantidade)
             self.speak("Produto atualizado com sucesso!")
             
         except (ValueError, AttributeError):
             self.speak("Erro ao processar os dados. Tente novamente.")
     
-    def remove_product_voice(self):
+    def remove_product_voice(self, nome=None):
         """Remove produto por voz"""
-        self.list_products_voice()
-        nome = self.get_voice_input("Diga o nome do produto que deseja remover")
         if not nome:
-            return
+            produto, _ = self.ask_product("Diga o nome do produto que deseja remover")
+            if not produto:
+                return
+            nome = produto['nome']
         
-        data = self.load_data()
-        data['produtos'] = [p for p in data['produtos'] if p['nome'].lower() != nome.lower()]
+        if not self.products.remove_product(nome):
+            self.speak("Produto não encontrado.")
+            return
         
-        self.save_data(data)
         self.speak("Produto removido com sucesso!")
     
-    def add_to_cart_voice(self):
-        """Adiciona produto ao carrinho por voz"""
-        self.list_products_voice()
-        nome = self.get_voice_input("Diga o nome do produto que deseja comprar")
-        if not nome:
-            return
-        
-        produto = self.find_product(nome)
+    def add_to_cart_voice(self, nome=None, quantidade=None):
+        """Adiciona produto ao carrinho por voz
+
+        Só pergunta o que não veio no comando (nome do produto e/ou quantidade).
+        """
+        if nome:
+            produto = self.find_product(nome)
+        else:
+            produto, dita = self.ask_product("Diga o nome do produto que deseja comprar")
+            quantidade = quantidade or dita
         if not produto:
-            self.speak("Produto não encontrado.")
-            return
-        
-        quantidade_str = self.get_voice_input("Diga a quantidade desejada")
-        if not quantidade_str:
             return
         
         try:
-            quantidade = self.parse_quantity(quantidade_str)
+            if quantidade is None:
+                quantidade_str = self.get_voice_input("Diga a quantidade desejada")
+                if not quantidade_str:
+                    return
+                quantidade = self.parse_quantity(quantidade_str)
             
             if quantidade > produto['quantidade']:
                 self.speak(f"Quantidade indisponível. Estoque: {produto['quantidade']}")
@@ -507,26 +691,18 @@ class VoiceSupermarketSystem:
             self.speak("Seu carrinho está vazio.")
             return
         
-        data = self.load_data()
         total = sum(item['subtotal'] for item in self.carrinho)
         
-        for item in self.carrinho:
-            for produto in data['produtos']:
-                if produto['nome'] == item['produto']:
-                    produto['quantidade'] -= item['quantidade']
-                    break
-        
-        # Registrar venda
-        venda_id = len(data['vendas']) + 1
-        data['vendas'].append({
-            'id': venda_id,
+        success, result = self.db.checkout({
             'usuario': self.current_user,
             'itens': self.carrinho.copy(),
             'total': total,
             'data': datetime.now().isoformat()
         })
+        if not success:
+            self.speak(f"Estoque insuficiente para {result}. Compra não finalizada.")
+            return
         
-        self.save_data(data)
         self.carrinho = []
         
         self.speak(f"Compra finalizada com sucesso! Total: {total} reais")
@@ -557,12 +733,13 @@ class VoiceSupermarketSystem:
             if not command:
                 continue
                 
-            if any(word in command for word in ['cadastrar', 'registrar', 'novo']):
+            action = self.menu_intents.match(command)
+            if action == 'register_user':
                 self.register_user()
-            elif any(word in command for word in ['login', 'entrar', 'acessar']):
+            elif action == 'login':
                 if self.authenticate_user():
                     self.voice_command_loop()
-            elif any(word in command for word in ['sair', 'terminar', 'fechar']):
+            elif action == 'sair':
                 self.speak("Saindo do sistema. Até logo!")
                 break
             else:
@@ -573,4 +750,5 @@ if __name__ == "__main__":
     print("Iniciando sistema...")
     
     sistema = VoiceSupermarketSystem()
+    sistema.warm_prompts()
     sistema.start_system()
\ No newline at end of file
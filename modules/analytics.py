@@ -0,0 +1,260 @@
+import os
+import threading
+
+import numpy as np
+
+from modules.database import add_sale_listener, create_database_manager
+from modules.product_index import normalize_name
+
+SEM_DATA = "sem data"
+
+
+class _Dictionary:
+    """Codifica strings em inteiros consecutivos para indexar os arrays"""
+
+    def __init__(self):
+        self.codes = {}
+        self.names = []
+
+    def __len__(self):
+        return len(self.names)
+
+    def encode(self, key, name=None):
+        """Código de 'key'; 'name' (padrão: a própria chave) é o nome exibido nos relatórios"""
+        code = self.codes.get(key)
+        if code is None:
+            code = self.codes[key] = len(self.names)
+            self.names.append(key if name is None else name)
+        return code
+
+
+class _Rollup:
+    """Soma por código em um array NumPy que cresce sob demanda"""
+
+    def __init__(self, dtype):
+        self.values = np.zeros(16, dtype=dtype)
+
+    def _ensure(self, size):
+        if size > len(self.values):
+            grown = np.zeros(max(size, 2 * len(self.values)), dtype=self.values.dtype)
+            grown[:len(self.values)] = self.values
+            self.values = grown
+
+    def add_batch(self, codes, weights):
+        """Group-by vetorizado: soma 'weights' agrupando por 'codes'"""
+        if len(codes) == 0:
+            return
+        sums = np.bincount(codes, weights=weights)
+        self._ensure(len(sums))
+        self.values[:len(sums)] += sums.astype(self.values.dtype)
+
+    def add(self, code, value):
+        self._ensure(code + 1)
+        self.values[code] += value
+
+
+def _sale_day(venda):
+    data = venda.get('data')
+    return data[:10] if data else SEM_DATA
+
+
+def _item_revenue(item):
+    subtotal = item.get('subtotal')
+    if subtotal is None:
+        subtotal = (item.get('preco_unitario') or 0) * item['quantidade']
+    return subtotal
+
+
+class SalesAnalytics:
+    """Agregados de vendas por produto, usuário e dia
+
+    O histórico é carregado uma vez em colunas NumPy, em blocos, e somado com
+    group-bys vetorizados (np.bincount). Depois disso os rollups são
+    atualizados venda a venda, sem reler o histórico: as vendas deste
+    processo chegam pelo ouvinte de vendas, e antes de cada relatório
+    refresh() soma as de id maior que a última aplicada (gravadas por
+    main.py, backend/app.py ou outro processo).
+
+    Os produtos são agrupados pelo nome normalizado ("Feijão" e "feijao"
+    são o mesmo) e aparecem com o nome do catálogo.
+    """
+
+    def __init__(self, db=None, chunk_size=50000):
+        self.db = db or create_database_manager()
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self.load()
+
+    def _reset(self):
+        self.produtos = _Dictionary()
+        self.usuarios = _Dictionary()
+        self.dias = _Dictionary()
+        self.receita_produto = _Rollup(np.float64)
+        self.quantidade_produto = _Rollup(np.int64)
+        self.receita_usuario = _Rollup(np.float64)
+        self.receita_dia = _Rollup(np.float64)
+        self.vendas_dia = _Rollup(np.int64)
+        self.total_vendas = 0
+        self.ultima_venda = 0
+        self._versao = None
+
+    def load(self):
+        """Recalcula todos os rollups a partir do histórico de vendas"""
+        with self._lock:
+            self._reset()
+            self._read_new_sales()
+
+    def refresh(self):
+        """Soma as vendas gravadas desde a última leitura (por qualquer processo)"""
+        with self._lock:
+            self._read_new_sales()
+
+    def _read_new_sales(self):
+        """Lê, em blocos, as vendas com id maior que a última aplicada; exige a trava"""
+        versao = self.db.data_version()
+        if versao == self._versao:
+            return
+        # A primeira leitura pega tudo, inclusive vendas antigas sem id
+        after_id = None if self._versao is None else self.ultima_venda
+        chunk = []
+        for venda in self.db.iter_sales(after_id=after_id):
+            chunk.append(venda)
+            if len(chunk) >= self.chunk_size:
+                self._add_chunk(chunk)
+                chunk = []
+        self._add_chunk(chunk)
+        self._versao = versao
+
+    def _product_code(self, nome):
+        key = normalize_name(nome)
+        code = self.produtos.codes.get(key)
+        if code is None:
+            # Nome do catálogo; o da venda só se o produto não existir mais
+            produto = self.db.find_product(nome)
+            code = self.produtos.encode(key, produto['nome'] if produto else nome)
+        return code
+
+    def _add_chunk(self, vendas):
+        """Converte um bloco de vendas em colunas e agrega de uma vez"""
+        if not vendas:
+            return
+
+        item_produto, item_quantidade, item_receita, item_usuario = [], [], [], []
+        venda_dia = []
+        for venda in vendas:
+            usuario = self.usuarios.encode(venda.get('usuario') or '')
+            venda_dia.append(self.dias.encode(_sale_day(venda)))
+            for item in venda.get('itens', ()):
+                item_produto.append(self._product_code(item['produto']))
+                item_quantidade.append(item['quantidade'])
+                item_receita.append(_item_revenue(item))
+                item_usuario.append(usuario)
+
+        produto = np.asarray(item_produto, dtype=np.int64)
+        quantidade = np.asarray(item_quantidade, dtype=np.int64)
+        receita = np.asarray(item_receita, dtype=np.float64)
+        usuario = np.asarray(item_usuario, dtype=np.int64)
+        dia = np.asarray(venda_dia, dtype=np.int64)
+        total = np.asarray([venda.get('total', 0) for venda in vendas], dtype=np.float64)
+
+        self.receita_produto.add_batch(produto, receita)
+        self.quantidade_produto.add_batch(produto, quantidade)
+        self.receita_usuario.add_batch(usuario, receita)
+        self.receita_dia.add_batch(dia, total)
+        self.vendas_dia.add_batch(dia, np.ones(len(dia), dtype=np.int64))
+        self.total_vendas += len(vendas)
+        self.ultima_venda = max(self.ultima_venda, max(venda.get('id', 0) for venda in vendas))
+
+    def record_sale(self, venda):
+        """Atualiza os rollups com uma venda nova
+
+        Só aplica a venda seguinte à última já somada; fora de ordem (houve
+        vendas de outro processo no meio), ela fica para o próximo refresh().
+        """
+        with self._lock:
+            if venda.get('id') != self.ultima_venda + 1:
+                return
+            self.ultima_venda = venda['id']
+            # Em dia com o banco: o próximo relatório não precisa reler nada
+            self._versao = self.db.data_version()
+            usuario = self.usuarios.encode(venda.get('usuario') or '')
+            for item in venda.get('itens', ()):
+                produto = self._product_code(item['produto'])
+                receita = _item_revenue(item)
+                self.receita_produto.add(produto, receita)
+                self.quantidade_produto.add(produto, item['quantidade'])
+                self.receita_usuario.add(usuario, receita)
+            dia = self.dias.encode(_sale_day(venda))
+            self.receita_dia.add(dia, venda.get('total', 0))
+            self.vendas_dia.add(dia, 1)
+            self.total_vendas += 1
+
+    def _as_dict(self, dictionary, rollup, order_by_value=True):
+        values = rollup.values[:len(dictionary)]
+        if order_by_value:
+            order = np.argsort(-values, kind='stable')
+        else:
+            order = np.argsort(np.asarray(dictionary.names), kind='stable')
+        return {dictionary.names[i]: values[i].item() for i in order}
+
+    def revenue_by_product(self):
+        """Receita por produto, da maior para a menor"""
+        with self._lock:
+            self._read_new_sales()
+            return self._as_dict(self.produtos, self.receita_produto)
+
+    def revenue_by_user(self):
+        """Receita por usuário, da maior para a menor"""
+        with self._lock:
+            self._read_new_sales()
+            return self._as_dict(self.usuarios, self.receita_usuario)
+
+    def revenue_by_day(self):
+        """Receita e número de vendas por dia, em ordem cronológica"""
+        with self._lock:
+            self._read_new_sales()
+            receita = self._as_dict(self.dias, self.receita_dia, order_by_value=False)
+            vendas = self._as_dict(self.dias, self.vendas_dia, order_by_value=False)
+            return {dia: {'receita': receita[dia], 'vendas': vendas[dia]} for dia in receita}
+
+    def top_sellers(self, k=10, by='quantidade'):
+        """Os k produtos mais vendidos, por 'quantidade' ou 'receita'"""
+        with self._lock:
+            self._read_new_sales()
+            rollup = self.quantidade_produto if by == 'quantidade' else self.receita_produto
+            values = rollup.values[:len(self.produtos)]
+            k = min(k, len(values))
+            if k <= 0:
+                return []
+            top = np.argpartition(-values, k - 1)[:k]
+            top = top[np.argsort(-values[top], kind='stable')]
+            return [
+                {
+                    'produto': self.produtos.names[i],
+                    'quantidade': self.quantidade_produto.values[i].item(),
+                    'receita': self.receita_produto.values[i].item()
+                }
+                for i in top
+            ]
+
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def _on_sale(db, venda):
+    analytics = _instances.get(os.path.abspath(db.database_file))
+    if analytics is not None:
+        analytics.record_sale(venda)
+
+
+def get_sales_analytics(db=None):
+    """SalesAnalytics compartilhado do processo, atualizado a cada venda gravada e antes de cada relatório"""
+    db = db or create_database_manager()
+    path = os.path.abspath(db.database_file)
+    with _instances_lock:
+        if not _instances:
+            add_sale_listener(_on_sale)
+        if path not in _instances:
+            _instances[path] = SalesAnalytics(db)
+        return _instances[path]
@@ -0,0 +1,164 @@
+import json
+import os
+import threading
+
+from modules.audio import SAMPLE_RATE
+
+DEFAULT_VOSK_MODEL = os.environ.get("SUPERMERCADO_VOSK_MODEL", "models/vosk-model-small-pt-0.3")
+
+PALAVRAS_NUMEROS = (
+    'zero', 'um', 'uma', 'dois', 'duas', 'três', 'quatro', 'cinco', 'seis', 'sete', 'oito',
+    'nove', 'dez', 'onze', 'doze', 'treze', 'quatorze', 'catorze', 'quinze', 'dezesseis',
+    'dezessete', 'dezoito', 'dezenove', 'vinte', 'trinta', 'quarenta', 'cinquenta',
+    'sessenta', 'setenta', 'oitenta', 'noventa', 'cem', 'cento', 'duzentos', 'trezentos',
+    'quatrocentos', 'quinhentos', 'mil'
+)
+PALAVRAS_VALORES = ('e', 'reais', 'real', 'centavos', 'vírgula', 'ponto', 'unidades', 'quilos')
+
+
+def build_grammar(comandos, produtos):
+    """Frases aceitas pelo reconhecedor restrito: comandos, números e nomes de produtos
+
+    'comandos' é uma sequência de grupos de palavras (como COMANDOS_VOZ em
+    main.py); o resultado termina com '[unk]' para o que estiver fora dela.
+    """
+    frases = set(PALAVRAS_NUMEROS) | set(PALAVRAS_VALORES)
+    for palavras in comandos:
+        frases.update(palavra.lower() for palavra in palavras)
+    frases.update(" ".join(produto.lower().split()) for produto in produtos)
+    return sorted(frases) + ['[unk]']
+
+
+class SpeechRecognizerEngine:
+    """Interface dos reconhecedores de fala
+
+    recognize() recebe um speech_recognition.AudioData e devolve o texto em
+    minúsculas. Levanta sr.UnknownValueError se nada foi entendido e
+    sr.RequestError se o motor não puder ser usado. Com restricted=True o
+    motor pode limitar o vocabulário à gramática de comandos e produtos.
+    """
+
+    name = None
+
+    def recognize(self, audio, restricted=True):
+        raise NotImplementedError
+
+
+class GoogleRecognizer(SpeechRecognizerEngine):
+    """Google Speech Recognition (online, vocabulário livre)"""
+
+    name = "google"
+
+    def __init__(self, recognizer=None, language="pt-BR"):
+        if recognizer is None:
+            import speech_recognition as sr
+            recognizer = sr.Recognizer()
+        self.recognizer = recognizer
+        self.language = language
+
+    def recognize(self, audio, restricted=True):
+        # A API não aceita gramática; 'restricted' é ignorado
+        return self.recognizer.recognize_google(audio, language=self.language).lower()
+
+
+class VoskRecognizer(SpeechRecognizerEngine):
+    """Vosk/Kaldi local: funciona sem rede e aceita uma gramática restrita
+
+    'grammar' é uma função que devolve a lista de frases (ver build_grammar);
+    ela é consultada a cada reconhecimento restrito, então produtos novos
+    entram na gramática sem reiniciar nada.
+    """
+
+    name = "vosk"
+
+    def __init__(self, model_path=DEFAULT_VOSK_MODEL, grammar=None):
+        self.model_path = model_path
+        self.grammar = grammar
+        self._lock = threading.Lock()
+        self._model = None
+        self._free = None
+        self._restricted = None
+        self._grammar_json = None
+
+    @staticmethod
+    def available(model_path=DEFAULT_VOSK_MODEL):
+        """True se o pacote vosk e o modelo estiverem instalados"""
+        try:
+            import vosk  # noqa: F401
+        except ImportError:
+            return False
+        return os.path.isdir(model_path)
+
+    def _recognizer(self, restricted):
+        import vosk
+
+        if self._model is None:
+            if not os.path.isdir(self.model_path):
+                import speech_recognition as sr
+                raise sr.RequestError(f"Modelo Vosk não encontrado em {self.model_path}")
+            vosk.SetLogLevel(-1)
+            self._model = vosk.Model(self.model_path)
+
+        if not restricted or self.grammar is None:
+            if self._free is None:
+                self._free = vosk.KaldiRecognizer(self._model, SAMPLE_RATE)
+            return self._free
+
+        grammar_json = json.dumps(self.grammar(), ensure_ascii=False)
+        if self._restricted is None:
+            self._restricted = vosk.KaldiRecognizer(self._model, SAMPLE_RATE, grammar_json)
+        elif grammar_json != self._grammar_json:
+            self._restricted.SetGrammar(grammar_json)
+        self._grammar_json = grammar_json
+        return self._restricted
+
+    def recognize(self, audio, restricted=True):
+        import speech_recognition as sr
+
+        pcm = audio.get_raw_data(convert_rate=SAMPLE_RATE, convert_width=2)
+        with self._lock:
+            recognizer = self._recognizer(restricted)
+            recognizer.AcceptWaveform(pcm)
+            result = json.loads(recognizer.FinalResult())
+            recognizer.Reset()
+
+        text = " ".join(word for word in result.get("text", "").split() if word != "[unk]")
+        if not text:
+            raise sr.UnknownValueError()
+        return text.lower()
+
+
+class FallbackRecognizer(SpeechRecognizerEngine):
+    """Usa 'primary' e recorre a 'fallback' quando o primeiro falha (ex.: sem rede)"""
+
+    def __init__(self, primary, fallback):
+        self.primary = primary
+        self.fallback = fallback
+        self.name = f"{primary.name}+{fallback.name}"
+
+    def recognize(self, audio, restricted=True):
+        import speech_recognition as sr
+
+        try:
+            return self.primary.recognize(audio, restricted)
+        except sr.RequestError:
+            return self.fallback.recognize(audio, restricted)
+
+
+def create_recognizer(engine=None, recognizer=None, grammar=None, model_path=DEFAULT_VOSK_MODEL):
+    """Cria o reconhecedor escolhido por SUPERMERCADO_ASR ("auto", "vosk" ou "google")
+
+    Em "auto" (o padrão) o Vosk é usado se o modelo estiver instalado, com o
+    Google como reserva; sem o modelo, só o Google.
+    """
+    engine = engine or os.environ.get("SUPERMERCADO_ASR", "auto")
+    if engine == "google":
+        return GoogleRecognizer(recognizer)
+    if engine == "vosk":
+        return VoskRecognizer(model_path, grammar)
+    if engine != "auto":
+        raise ValueError(f"Reconhecedor desconhecido: {engine}")
+
+    if VoskRecognizer.available(model_path):
+        return FallbackRecognizer(VoskRecognizer(model_path, grammar), GoogleRecognizer(recognizer))
+    return GoogleRecognizer(recognizer)
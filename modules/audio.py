@@ -0,0 +1,202 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+from modules import mfcc as numpy_mfcc
+from modules.vad import VoiceActivityDetector, trim_silence
+
+SAMPLE_RATE = 16000
+
+# "numpy" (padrão) ou "librosa"; o librosa só é importado se for usado
+MFCC_BACKEND = os.environ.get("SUPERMERCADO_MFCC_BACKEND", "numpy")
+
+
+def to_samples(audio, sample_rate=SAMPLE_RATE):
+    """Converte áudio em memória para um array float32 mono em [-1, 1]
+
+    Aceita speech_recognition.AudioData, bytes PCM de 16 bits (little-endian,
+    mono) ou um array NumPy (float ou int16, como o devolvido por sounddevice).
+    Nada é gravado em disco; arrays float32 contíguos são usados sem cópia.
+    """
+    if hasattr(audio, 'get_raw_data'):
+        # AudioData: só converte taxa/largura se a captura não estiver em 16 kHz/16 bits
+        audio = audio.get_raw_data(convert_rate=sample_rate, convert_width=2)
+
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        pcm = np.frombuffer(audio, dtype='<i2')
+        samples = pcm.astype(np.float32)
+        samples *= 1.0 / 32768.0
+        return samples
+
+    samples = np.asarray(audio)
+    if samples.ndim > 1:
+        # (frames, canais) do sounddevice: usa o primeiro canal
+        samples = samples[:, 0]
+    if samples.dtype == np.int16:
+        samples = samples.astype(np.float32)
+        samples *= 1.0 / 32768.0
+        return samples
+    return np.ascontiguousarray(samples, dtype=np.float32)
+
+
+def to_pcm16(samples):
+    """Converte amostras float em bytes PCM de 16 bits"""
+    samples = np.asarray(samples, dtype=np.float32)
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype('<i2').tobytes()
+
+
+def to_audio_data(samples, sample_rate=SAMPLE_RATE):
+    """Empacota amostras em um speech_recognition.AudioData para o reconhecedor"""
+    import speech_recognition as sr
+    return sr.AudioData(to_pcm16(samples), sample_rate, 2)
+
+
+def record_samples(duration, sample_rate=SAMPLE_RATE):
+    """Grava do microfone com sounddevice e devolve as amostras float32"""
+    import sounddevice as sd
+
+    audio = sd.rec(int(duration * sample_rate),
+                   samplerate=sample_rate,
+                   channels=1,
+                   dtype='float32')
+    sd.wait()
+    return audio[:, 0]
+
+
+def record_until_silence(max_duration, sample_rate=SAMPLE_RATE, vad=None):
+    """Grava do microfone até a fala terminar (ou até 'max_duration' segundos)"""
+    import sounddevice as sd
+
+    vad = vad or VoiceActivityDetector(sample_rate)
+    block_size = vad.frame_length
+    blocks = []
+    with sd.InputStream(samplerate=sample_rate, channels=1, dtype='float32',
+                        blocksize=block_size) as stream:
+        for _ in range(int(max_duration * sample_rate) // block_size):
+            block, _ = stream.read(block_size)
+            blocks.append(block[:, 0].copy())
+            if vad.process(blocks[-1]):
+                break
+    if not blocks:
+        return np.empty(0, dtype=np.float32)
+    return np.concatenate(blocks)
+
+
+def listen_for_barge_in(stop_event, sample_rate=SAMPLE_RATE, vad=None):
+    """Monitora o microfone até 'stop_event'; True se alguém começou a falar antes
+
+    Os primeiros quadros calibram o ruído com a própria fala do sistema
+    tocando, então só uma voz mais forte que ela dispara a interrupção.
+    """
+    import sounddevice as sd
+
+    vad = vad or VoiceActivityDetector(sample_rate)
+    with sd.InputStream(samplerate=sample_rate, channels=1, dtype='float32',
+                        blocksize=vad.frame_length) as stream:
+        while not stop_event.is_set():
+            block, _ = stream.read(vad.frame_length)
+            vad.process(block[:, 0])
+            if vad.triggered:
+                return True
+    return False
+
+
+class AudioTurnStats:
+    """Duração gravada e tempo de CPU da extração de características por turno"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.gravacoes = 0
+            self.segundos_gravados = 0.0
+            self.extracoes = 0
+            self.segundos_analisados = 0.0
+            self.cpu_extracao = 0.0
+
+    def add_recording(self, samples, sample_rate=SAMPLE_RATE):
+        with self._lock:
+            self.gravacoes += 1
+            self.segundos_gravados += len(samples) / sample_rate
+
+    def add_extraction(self, seconds, cpu_seconds):
+        with self._lock:
+            self.extracoes += 1
+            self.segundos_analisados += seconds
+            self.cpu_extracao += cpu_seconds
+
+    def summary(self):
+        """Médias por gravação e por extração"""
+        with self._lock:
+            return {
+                'gravacoes': self.gravacoes,
+                'segundos_por_gravacao': self.segundos_gravados / self.gravacoes if self.gravacoes else 0.0,
+                'extracoes': self.extracoes,
+                'segundos_analisados_por_extracao':
+                    self.segundos_analisados / self.extracoes if self.extracoes else 0.0,
+                'cpu_ms_por_extracao': 1000 * self.cpu_extracao / self.extracoes if self.extracoes else 0.0
+            }
+
+
+def _load_signal(audio, sample_rate, backend):
+    """Amostras float32 a 16 kHz de um áudio em memória ou de um arquivo"""
+    if isinstance(audio, str):
+        if backend == "numpy":
+            try:
+                y, sample_rate = numpy_mfcc.load_wav(audio)
+            except Exception:
+                # Formatos que o módulo wave não lê (float, compactados...)
+                backend = "librosa"
+        if backend == "librosa":
+            import librosa
+            return librosa.load(audio, sr=SAMPLE_RATE)[0]
+    else:
+        y = to_samples(audio, sample_rate)
+
+    if sample_rate != SAMPLE_RATE:
+        if backend == "librosa":
+            import librosa
+            return librosa.resample(y, orig_sr=sample_rate, target_sr=SAMPLE_RATE)
+        return numpy_mfcc.resample(y, sample_rate, SAMPLE_RATE)
+    return y
+
+
+def _mfcc(signals, n_mfcc, backend):
+    if backend == "librosa":
+        import librosa
+        return [librosa.feature.mfcc(y=y, sr=SAMPLE_RATE, n_mfcc=n_mfcc) for y in signals]
+    return numpy_mfcc.mfcc_batch(signals, SAMPLE_RATE, n_mfcc)
+
+
+def extract_mfcc_features_batch(audios, sample_rate=SAMPLE_RATE, n_mfcc=13, trim=True, stats=None,
+                                backend=None):
+    """Médias dos MFCCs de vários áudios, calculadas juntas; array (áudios, n_mfcc)
+
+    Cada áudio pode ser um AudioData, bytes PCM, um array NumPy ou o caminho
+    de um WAV. O padrão é a implementação em NumPy (modules.mfcc); com
+    backend="librosa" o librosa é usado.
+    """
+    backend = backend or MFCC_BACKEND
+    cpu_start = time.process_time()
+    signals = [_load_signal(audio, sample_rate, backend) for audio in audios]
+    if trim:
+        signals = [trim_silence(y, SAMPLE_RATE) for y in signals]
+
+    features = np.array([np.mean(m.T, axis=0) for m in _mfcc(signals, n_mfcc, backend)])
+    if stats is not None:
+        cpu = (time.process_time() - cpu_start) / max(1, len(signals))
+        for y in signals:
+            stats.add_extraction(len(y) / SAMPLE_RATE, cpu)
+    return features.reshape(len(signals), n_mfcc)
+
+
+def extract_mfcc_features(audio, sample_rate=SAMPLE_RATE, n_mfcc=13, trim=True, stats=None, backend=None):
+    """Média dos MFCCs de um áudio em memória (ou de um arquivo, se for um caminho)
+
+    Com 'trim', o silêncio do começo e do fim é descartado antes dos MFCCs.
+    """
+    return extract_mfcc_features_batch([audio], sample_rate, n_mfcc, trim, stats, backend)[0]
@@ -0,0 +1,103 @@
+import threading
+from bisect import bisect_right
+
+from modules.product_index import normalize_name
+
+
+class Catalog:
+    """Catálogo em memória: produtos por nome normalizado, em ordem estável de inclusão
+
+    Busca, inclusão e remoção são O(1). Cada produto recebe um número de
+    sequência crescente que serve de cursor de paginação: inclusões e
+    remoções entre uma página e outra não repetem nem pulam itens.
+
+    'version' muda a cada inclusão ou remoção; quem altera um produto no
+    lugar (preço, estoque) chama touch().
+    """
+
+    def __init__(self, produtos=()):
+        self.version = 0
+        self._version_lock = threading.Lock()
+        self.replace(produtos)
+
+    def touch(self):
+        """Marca o catálogo como alterado"""
+        with self._version_lock:
+            self.version += 1
+
+    def replace(self, produtos):
+        """Troca todo o conteúdo (os cursores antigos deixam de valer)"""
+        self._por_nome = {}
+        self._seq_por_nome = {}
+        self._nome_por_seq = {}
+        self._ordem = []
+        self._proximo = 1
+        for produto in produtos:
+            self.add(produto)
+        self.touch()
+
+    def __len__(self):
+        return len(self._por_nome)
+
+    def __contains__(self, name):
+        return normalize_name(name) in self._por_nome
+
+    def __iter__(self):
+        """Produtos na ordem de inclusão"""
+        return iter(self._por_nome.values())
+
+    def get(self, name):
+        """Retorna o produto com esse nome, ou None"""
+        return self._por_nome.get(normalize_name(name))
+
+    def add(self, produto):
+        """Inclui um produto no fim da ordem; retorna False se o nome já existir"""
+        key = normalize_name(produto['nome'])
+        if key in self._por_nome:
+            return False
+        seq = self._proximo
+        self._proximo += 1
+        self._por_nome[key] = produto
+        self._seq_por_nome[key] = seq
+        self._nome_por_seq[seq] = key
+        self._ordem.append(seq)
+        self.touch()
+        return True
+
+    def remove(self, name):
+        """Remove o produto e o retorna (None se não existir)"""
+        key = normalize_name(name)
+        produto = self._por_nome.pop(key, None)
+        if produto is None:
+            return None
+        del self._nome_por_seq[self._seq_por_nome.pop(key)]
+        # As sequências removidas ficam em _ordem até passarem da metade
+        if len(self._ordem) > 2 * len(self._por_nome) + 64:
+            self._ordem = [seq for seq in self._ordem if seq in self._nome_por_seq]
+        self.touch()
+        return produto
+
+    def page(self, cursor=None, limit=100, prefix=None, predicate=None):
+        """Uma página de produtos depois de 'cursor'
+
+        'prefix' filtra pelo começo do nome (sem acentos nem maiúsculas) e
+        'predicate(produto)' por qualquer outro critério. Retorna (produtos,
+        próximo cursor), com o cursor None na última página.
+        """
+        prefix = normalize_name(prefix) if prefix else None
+        start = bisect_right(self._ordem, cursor) if cursor is not None else 0
+        itens = []
+        last = None
+        for i in range(start, len(self._ordem)):
+            seq = self._ordem[i]
+            key = self._nome_por_seq.get(seq)
+            if key is None or (prefix and not key.startswith(prefix)):
+                continue
+            produto = self._por_nome[key]
+            if predicate is not None and not predicate(produto):
+                continue
+            if len(itens) == limit:
+                return itens, last
+            itens.append(produto)
+            last = seq
+        return itens, None
@@ -1,49 +1,560 @@
 import json
 import os
+from bisect import bisect_right
+import random
+import tempfile
+import threading
+import time
+
+from modules.file_lock import FileLock, file_mode_for
+from modules.json_stream import iter_array_items
+from modules.product_index import ProductIndex, normalize_name
+
+# Documentos já lidos, por caminho absoluto (_CacheEntry)
+_read_cache = {}
+_read_cache_lock = threading.Lock()
+
+# Funções chamadas com (db, venda) depois de cada venda gravada neste processo
+_sale_listeners = []
+
+
+def add_sale_listener(listener):
+    """Registra uma função chamada a cada venda gravada"""
+    _sale_listeners.append(listener)
+
+
+def remove_sale_listener(listener):
+    """Remove uma função registrada com add_sale_listener"""
+    if listener in _sale_listeners:
+        _sale_listeners.remove(listener)
+
+
+class FrozenDict(dict):
+    """Dicionário somente leitura usado nas visões em cache"""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Visão somente leitura; use load_data() para obter uma cópia editável")
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __ior__(self, other):
+        self._readonly()
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+
+def freeze(value):
+    """Converte um documento JSON em uma visão imutável"""
+    if isinstance(value, dict):
+        return FrozenDict((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def thaw(value):
+    """Converte uma visão imutável em uma cópia editável"""
+    if isinstance(value, dict):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(v) for v in value]
+    return value
+
+
+def first_sale_after(vendas, after_id):
+    """Posição da primeira venda com id maior que 'after_id' (a lista está em ordem de id)"""
+    return bisect_right(vendas, after_id, key=lambda venda: venda.get('id', 0))
+
+
+def plan_upserts(produtos, get):
+    """Confere uma carga de produtos (inclui ou atualiza pelo nome) sem aplicar nada
+
+    'get(nome)' devolve o produto já cadastrado ou None. Retorna (ok,
+    resultados), um por item: 'criado', 'atualizado' ou 'invalido' (nome
+    vazio, valor negativo, ou produto novo sem preço e quantidade). Um nome
+    repetido na carga atualiza o que veio antes.
+    """
+    vistos = set()
+    resultados = []
+    for produto in produtos:
+        nome = produto.get('nome') or ''
+        key = normalize_name(nome)
+        preco, quantidade = produto.get('preco'), produto.get('quantidade')
+        existe = key in vistos or (key and get(nome) is not None)
+        if (not key or (preco is not None and preco < 0) or (quantidade is not None and quantidade < 0)
+                or (not existe and (preco is None or quantidade is None))):
+            status = 'invalido'
+        else:
+            status = 'atualizado' if existe else 'criado'
+            vistos.add(key)
+        resultados.append({'nome': nome, 'status': status})
+    return all(r['status'] != 'invalido' for r in resultados), resultados
+
+
+def plan_stock_changes(alteracoes, get):
+    """Confere alterações de estoque [(nome, delta)] sem aplicar nada
+
+    Deltas do mesmo produto se acumulam na ordem da lista. Retorna (ok,
+    resultados, novas): um resultado por item ('ok', 'nao_encontrado' ou
+    'estoque_insuficiente', com a quantidade resultante) e, por nome
+    normalizado, [produto, quantidade final]. Com ok False nada deve ser aplicado.
+    """
+    novas = {}
+    resultados = []
+    for nome, delta in alteracoes:
+        key = normalize_name(nome)
+        if key not in novas:
+            produto = get(nome)
+            if produto is None:
+                resultados.append({'nome': nome, 'status': 'nao_encontrado'})
+                continue
+            novas[key] = [produto, produto['quantidade']]
+        linha = novas[key]
+        if linha[1] + delta < 0:
+            resultados.append({'nome': nome, 'status': 'estoque_insuficiente', 'quantidade': linha[1]})
+            continue
+        linha[1] += delta
+        resultados.append({'nome': nome, 'status': 'ok', 'quantidade': linha[1]})
+    return all(r['status'] == 'ok' for r in resultados), resultados, novas
+
+
+def apply_mutation(data, record, index=None):
+    """Aplica um registro de mutação ao documento em memória
+
+    'index' é o ProductIndex de data['produtos']; se omitido, é montado na hora.
+    """
+    op = record['op']
+
+    if op == 'add_user':
+        usuario = record['usuario']
+        if any(u['nome'] == usuario['nome'] for u in data['usuarios']):
+            return False
+        data['usuarios'].append(usuario)
+        return True
+
+    if op == 'set_cart':
+        carrinhos = data.setdefault('carrinhos', {})
+        if record['itens']:
+            carrinhos[record['usuario']] = record['itens']
+        else:
+            carrinhos.pop(record['usuario'], None)
+        return True
+
+    if op == 'add_sale':
+        venda = record['venda']
+        if 'id' not in venda:
+            venda = record['venda'] = {'id': len(data['vendas']) + 1, **venda}
+        data['vendas'].append(venda)
+        return True
+
+    if index is None:
+        index = ProductIndex(data['produtos'])
+
+    if op == 'seed_products':
+        # Só em um banco vazio: quem chegar depois de outro processo já ter gravado não muda nada
+        if data['produtos'] or data['usuarios'] or data['vendas']:
+            return False
+        for produto in record['produtos']:
+            index.add(produto)
+            data['produtos'].append(produto)
+        return True
+
+    if op == 'add_product':
+        produto = record['produto']
+        if produto['nome'] in index:
+            return False
+        if 'id' not in produto:
+            produto = record['produto'] = {'id': len(data['produtos']) + 1, **produto}
+        index.add(produto)
+        data['produtos'].append(produto)
+        return True
+
+    if op == 'update_product':
+        produto = index.get(record['nome'])
+        if produto is None:
+            return False
+        campos = record['campos']
+        old_name = produto['nome']
+        if 'nome' in campos and index.get(campos['nome']) not in (None, produto):
+            return False
+        produto.update(campos)
+        if 'nome' in campos:
+            index.rename(old_name, produto)
+        return True
+
+    if op == 'remove_product':
+        produto = index.remove(record['nome'])
+        if produto is None:
+            return False
+        data['produtos'].remove(produto)
+        return True
+
+    if op == 'update_stock':
+        produto = index.get(record['nome'])
+        if produto is None:
+            return False
+        new_quantity = produto['quantidade'] + record['delta']
+        if new_quantity < 0:
+            return False
+        produto['quantidade'] = new_quantity
+        return True
+
+    if op == 'upsert_products':
+        # Confere a carga inteira antes de incluir ou alterar qualquer produto
+        ok, record['resultados'] = plan_upserts(record['produtos'], index.get)
+        if not ok:
+            return False
+        produtos = []
+        for produto, resultado in zip(record['produtos'], record['resultados']):
+            if resultado['status'] == 'criado':
+                if 'id' not in produto:
+                    produto = {'id': len(data['produtos']) + 1, **produto}
+                index.add(produto)
+                data['produtos'].append(produto)
+            else:
+                index.get(produto['nome']).update(
+                    {k: produto[k] for k in ('preco', 'quantidade') if produto.get(k) is not None})
+            produtos.append(produto)
+        # Os ids ficam no registro (o log reaplica os mesmos)
+        record['produtos'] = produtos
+        return True
+
+    if op == 'update_stock_many':
+        ok, record['resultados'], novas = plan_stock_changes(record['alteracoes'], index.get)
+        if not ok:
+            return False
+        for produto, quantidade in novas.values():
+            produto['quantidade'] = quantidade
+        return True
+
+    if op == 'checkout':
+        # Valida todas as linhas antes de alterar qualquer estoque
+        venda = record['venda']
+        linhas = {}
+        for item in venda['itens']:
+            produto = index.get(item['produto'])
+            if produto is None:
+                record['falta'] = item['produto']
+                return False
+            linha = linhas.setdefault(id(produto), [produto, 0])
+            linha[1] += item['quantidade']
+
+        for produto, quantidade in linhas.values():
+            if produto['quantidade'] < quantidade:
+                record['falta'] = produto['nome']
+                return False
+
+        for produto, quantidade in linhas.values():
+            produto['quantidade'] -= quantidade
+
+        if 'id' not in venda:
+            venda = record['venda'] = {'id': len(data['vendas']) + 1, **venda}
+        data['vendas'].append(venda)
+        return True
+
+    raise ValueError(f"Operação desconhecida: {op}")
+
+
+class ConcurrentModificationError(Exception):
+    """O arquivo foi alterado por outro processo desde a leitura"""
+
+
+class _CacheEntry:
+    """Documento em cache com a identidade do arquivo de onde foi lido"""
+
+    def __init__(self, key, document, version):
+        self.key = key
+        self.document = document
+        self.version = version
+        self.index = None
+
+
+def _file_key(stat):
+    # O inode muda a cada os.replace, então detecta escritas com mesmo mtime e tamanho
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
 
 class DatabaseManager:
+    max_retries = 10
+
     def __init__(self, database_file="database.json"):
         self.database_file = database_file
+        self.lock_file = database_file + ".lock"
         self.initialize_database()
-    
+
     def initialize_database(self):
         """Inicializa o arquivo JSON se não existir"""
-        if not os.path.exists(self.database_file):
-            data = {
-                "produtos": [],
-                "usuarios": [],
-                "vendas": []
-            }
-            self.save_data(data)
-    
+        with FileLock(self.lock_file):
+            if not os.path.exists(self.database_file):
+                data = {
+                    "produtos": [],
+                    "usuarios": [],
+                    "vendas": []
+                }
+                self._write(data, 1)
+
+    def _cache_entry(self):
+        """Entrada do cache de leitura, relendo o arquivo só se ele mudou"""
+        path = os.path.abspath(self.database_file)
+        for attempt in range(self.max_retries):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                return _CacheEntry(None, freeze({"produtos": [], "usuarios": [], "vendas": []}), 0)
+
+            key = _file_key(stat)
+            cached = _read_cache.get(path)
+            if cached and cached.key == key:
+                return cached
+
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    document = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                # Arquivo trocado ou gravado por um escritor antigo não atômico: tenta de novo
+                if attempt == self.max_retries - 1:
+                    raise
+                time.sleep(0.01 * (attempt + 1))
+                continue
+
+            version = document.pop('_versao', 0)
+            entry = _CacheEntry(key, freeze(document), version)
+            with _read_cache_lock:
+                _read_cache[path] = entry
+            return entry
+
+    def read_data(self):
+        """Retorna uma visão somente leitura dos dados, relendo o arquivo só se ele mudou"""
+        return self._cache_entry().document
+
+    def product_index(self):
+        """Índice por nome normalizado sobre os produtos em cache"""
+        entry = self._cache_entry()
+        if entry.index is None:
+            entry.index = ProductIndex(entry.document['produtos'])
+        return entry.index
+
     def load_data(self):
         """Carrega dados do arquivo JSON"""
+        return thaw(self.read_data())
+
+    def data_version(self):
+        """Número de versão dos dados; muda a cada gravação"""
+        return self._cache_entry().version
+
+    def load_versioned(self):
+        """Carrega uma cópia editável dos dados junto com o número de versão"""
+        entry = self._cache_entry()
+        return thaw(entry.document), entry.version
+
+    def _write(self, data, version):
+        """Grava o documento atomicamente; exige a trava já adquirida"""
+        path = os.path.abspath(self.database_file)
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                        dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(dict(data, _versao=version), f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp_path, file_mode_for(path))
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        entry = _CacheEntry(_file_key(os.stat(path)), freeze(data), version)
+        with _read_cache_lock:
+            _read_cache[path] = entry
+
+    def save_data(self, data, expected_version=None):
+        """Salva dados no arquivo JSON
+
+        Com 'expected_version', só grava se ninguém tiver alterado o arquivo
+        desde a leitura; caso contrário levanta ConcurrentModificationError.
+        """
+        with FileLock(self.lock_file):
+            current = self._cache_entry().version
+            if expected_version is not None and expected_version != current:
+                raise ConcurrentModificationError(
+                    f"{self.database_file}: versão {current}, esperada {expected_version}")
+            self._write(data, current + 1)
+
+    def commit(self, record):
+        """Aplica uma mutação e persiste o resultado (concorrência otimista)"""
+        original = dict(record)
+        for attempt in range(self.max_retries):
+            record.clear()
+            record.update(original)
+            data, version = self.load_versioned()
+            if not apply_mutation(data, record):
+                return False
+            try:
+                self.save_data(data, expected_version=version)
+                return True
+            except ConcurrentModificationError:
+                time.sleep(random.uniform(0, 0.005 * (attempt + 1)))
+
+        # Muita disputa: aplica com a trava segura, sem nova chance de conflito
+        with FileLock(self.lock_file):
+            record.clear()
+            record.update(original)
+            data, version = self.load_versioned()
+            if not apply_mutation(data, record):
+                return False
+            self._write(data, version + 1)
+            return True
+
+    def commit_many(self, records, notify=True):
+        """Aplica várias mutações e grava o arquivo uma vez só
+
+        Cada registro vale por si: um que falha não impede os demais. Retorna
+        a lista de resultados, na ordem; as vendas gravadas são avisadas aos
+        ouvintes, como em add_sale.
+        """
+        originals = [dict(record) for record in records]
+
+        def apply_all(data):
+            for record, original in zip(records, originals):
+                record.clear()
+                record.update(original)
+            index = ProductIndex(data['produtos'])
+            return [apply_mutation(data, record, index) for record in records]
+
+        for attempt in range(self.max_retries):
+            data, version = self.load_versioned()
+            results = apply_all(data)
+            if not any(results):
+                return results
+            try:
+                self.save_data(data, expected_version=version)
+                break
+            except ConcurrentModificationError:
+                time.sleep(random.uniform(0, 0.005 * (attempt + 1)))
+        else:
+            with FileLock(self.lock_file):
+                data, version = self.load_versioned()
+                results = apply_all(data)
+                if any(results):
+                    self._write(data, version + 1)
+
+        if notify:
+            self._notify_sales(records, results)
+        return results
+
+    def _notify_sales(self, records, results):
+        for record, ok in zip(records, results):
+            if ok and record['op'] in ('add_sale', 'checkout'):
+                self._notify_sale(record['venda'])
+
+    def iter_sales(self, filter=None, after_id=None):
+        """Gera as vendas uma a uma direto do arquivo, sem carregar a lista inteira
+
+        'filter' é uma função opcional venda -> bool. Com 'after_id', só as
+        vendas de id maior, tiradas do documento já em cache (lido a cada
+        versão de qualquer forma) a partir de uma busca binária.
+        """
+        if after_id is not None:
+            vendas = self.read_data()['vendas']
+            for position in range(first_sale_after(vendas, after_id), len(vendas)):
+                if filter is None or filter(vendas[position]):
+                    yield vendas[position]
+            return
         try:
-            with open(self.database_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {"produtos": [], "usuarios": [], "vendas": []}
-    
-    def save_data(self, data):
-        """Salva dados no arquivo JSON"""
-        with open(self.database_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    
+            f = open(self.database_file, 'r', encoding='utf-8')
+        except FileNotFoundError:
+            return
+        # os.replace troca o arquivo inteiro, então o descritor aberto segue íntegro
+        with f:
+            for venda in iter_array_items(f, 'vendas'):
+                if filter is None or filter(venda):
+                    yield venda
+
     def add_user(self, username, access_level="usuario"):
         """Adiciona um novo usuário"""
-        data = self.load_data()
-        
-        if any(u['nome'] == username for u in data['usuarios']):
-            return False
-        
-        data['usuarios'].append({
-            'nome': username,
-            'nivel_acesso': access_level
+        return self.commit({
+            'op': 'add_user',
+            'usuario': {'nome': username, 'nivel_acesso': access_level}
         })
-        self.save_data(data)
-        return True
-    
+
     def user_exists(self, username):
         """Verifica se um usuário existe"""
-        data = self.load_data()
-        return any(u['nome'] == username for u in data['usuarios'])
\ No newline at end of file
+        data = self.read_data()
+        return any(u['nome'] == username for u in data['usuarios'])
+
+    def find_product(self, name):
+        """Encontra um produto pelo nome"""
+        return self.product_index().get(name)
+
+    def add_product(self, product):
+        """Adiciona um produto"""
+        return self.commit({'op': 'add_product', 'produto': dict(product)})
+
+    def update_product(self, name, changes):
+        """Atualiza campos de um produto"""
+        return self.commit({'op': 'update_product', 'nome': name, 'campos': dict(changes)})
+
+    def remove_product(self, name):
+        """Remove um produto"""
+        return self.commit({'op': 'remove_product', 'nome': name})
+
+    def update_stock(self, name, quantity_change):
+        """Soma uma variação ao estoque de um produto"""
+        return self.commit({'op': 'update_stock', 'nome': name, 'delta': quantity_change})
+
+    def carts(self):
+        """Carrinhos em aberto, por usuário"""
+        return self.read_data().get('carrinhos', {})
+
+    def set_cart(self, username, itens):
+        """Substitui o carrinho do usuário (lista vazia apaga)"""
+        return self.commit({'op': 'set_cart', 'usuario': username, 'itens': [dict(item) for item in itens]})
+
+    def add_sale(self, sale):
+        """Registra uma venda"""
+        record = {'op': 'add_sale', 'venda': dict(sale)}
+        if not self.commit(record):
+            return False
+        self._notify_sale(record['venda'])
+        return True
+
+    def _notify_sale(self, venda):
+        for listener in list(_sale_listeners):
+            listener(self, venda)
+
+    def checkout(self, sale):
+        """Baixa o estoque de todos os itens e registra a venda em uma única operação
+
+        Retorna (True, venda registrada) ou (False, nome do produto sem estoque).
+        """
+        record = {'op': 'checkout', 'venda': dict(sale, itens=[dict(item) for item in sale['itens']])}
+        if self.commit(record):
+            self._notify_sale(record['venda'])
+            return True, record['venda']
+        return False, record.get('falta')
+
+
+def create_database_manager(backend=None, database_file=None):
+    """Cria o DatabaseManager configurado
+
+    O backend vem do argumento ou da variável SUPERMERCADO_DB_BACKEND
+    ("json", "journal" ou "sqlite"); o arquivo, de SUPERMERCADO_DB_FILE.
+    """
+    backend = (backend or os.environ.get('SUPERMERCADO_DB_BACKEND', 'json')).lower()
+    database_file = database_file or os.environ.get('SUPERMERCADO_DB_FILE')
+
+    if backend == 'json':
+        return DatabaseManager(database_file or "database.json")
+    if backend == 'journal':
+        from modules.journal import JournaledDatabaseManager
+        return JournaledDatabaseManager(database_file or "database.json")
+    if backend == 'sqlite':
+        from modules.sqlite_database import SQLiteDatabaseManager
+        return SQLiteDatabaseManager(database_file or "database.db")
+    raise ValueError(f"Backend de banco de dados desconhecido: {backend}")
@@ -0,0 +1,79 @@
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# umask do processo, lido uma vez (os.umask só informa o valor trocando-o)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def file_mode_for(path):
+    """Permissões para o arquivo que vai substituir 'path' via os.replace
+
+    As do arquivo atual ou, se ele ainda não existe, 0666 menos o umask (o
+    mesmo que open() daria). mkstemp cria com 0600, o que impediria processos
+    de outros usuários de ler o arquivo trocado.
+    """
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+
+class FileLock:
+    """Trava de arquivo entre processos (flock no Unix, msvcrt no Windows)
+
+    Cada uso deve criar sua própria instância:
+
+        with FileLock("database.json.lock"):
+            ...
+    """
+
+    def __init__(self, path, shared=False):
+        self.path = path
+        self.shared = shared
+        self._fd = None
+
+    def acquire(self):
+        """Bloqueia até obter a trava"""
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX)
+            else:
+                # msvcrt não tem trava compartilhada: leitores também ficam exclusivos
+                while True:
+                    try:
+                        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        continue
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+
+    def release(self):
+        """Libera a trava"""
+        if self._fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
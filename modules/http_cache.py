@@ -0,0 +1,76 @@
+import os
+import threading
+
+
+def etag_matches(if_none_match, etag):
+    """True se o cabeçalho If-None-Match aceita 'etag' (lista separada por vírgulas ou '*')"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == '*' or candidate == etag:
+            return True
+    return False
+
+
+class VersionedResponseCache:
+    """Corpos de resposta já serializados, por versão dos dados
+
+    A ETag é '"<época>-<versão>"': a época é sorteada por processo, então
+    uma ETag de antes de reiniciar nunca coincide por acaso. Só os corpos da
+    versão mais recente ficam guardados (um por variação da consulta, até
+    'max_entries').
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.epoch = os.urandom(4).hex()
+        self._lock = threading.Lock()
+        self._version = None
+        self._bodies = {}
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def etag(self, version):
+        return f'"{self.epoch}-{version}"'
+
+    def not_modified_for(self, if_none_match, version):
+        """True se o cliente já tem a versão atual (responder 304)"""
+        if etag_matches(if_none_match, self.etag(version)):
+            with self._lock:
+                self.not_modified += 1
+            return True
+        return False
+
+    def body(self, version, key, render):
+        """Corpo em cache para (versão, variação); 'render()' gera os bytes na falta
+
+        Leia a versão antes de montar a resposta: se os dados mudarem no meio,
+        o corpo fica associado à versão antiga e é refeito na próxima consulta.
+        """
+        with self._lock:
+            if version == self._version and key in self._bodies:
+                self.hits += 1
+                return self._bodies[key]
+            self.misses += 1
+        body = render()
+        with self._lock:
+            if version != self._version:
+                self._version = version
+                self._bodies = {}
+            if len(self._bodies) < self.max_entries:
+                self._bodies[key] = body
+        return body
+
+    def stats(self):
+        with self._lock:
+            return {
+                'versao': self._version,
+                'corpos': len(self._bodies),
+                'hits': self.hits,
+                'misses': self.misses,
+                'nao_modificado': self.not_modified
+            }
@@ -0,0 +1,163 @@
+from modules.product_index import normalize_name
+
+# Valor das palavras numéricas, já normalizadas (sem acento)
+UNIDADES = {
+    'zero': 0, 'um': 1, 'uma': 1, 'dois': 2, 'duas': 2, 'tres': 3, 'quatro': 4, 'cinco': 5,
+    'seis': 6, 'sete': 7, 'oito': 8, 'nove': 9, 'dez': 10, 'onze': 11, 'doze': 12,
+    'treze': 13, 'quatorze': 14, 'catorze': 14, 'quinze': 15, 'dezesseis': 16,
+    'dezessete': 17, 'dezoito': 18, 'dezenove': 19, 'vinte': 20, 'trinta': 30,
+    'quarenta': 40, 'cinquenta': 50, 'sessenta': 60, 'setenta': 70, 'oitenta': 80,
+    'noventa': 90, 'cem': 100, 'cento': 100, 'duzentos': 200, 'duzentas': 200,
+    'trezentos': 300, 'trezentas': 300, 'quatrocentos': 400, 'quinhentos': 500,
+    'seiscentos': 600, 'setecentos': 700, 'oitocentos': 800, 'novecentos': 900
+}
+
+# Palavras que ligam o comando ao produto e não fazem parte do nome
+PALAVRAS_VAZIAS = {
+    'a', 'o', 'as', 'os', 'ao', 'aos', 'de', 'do', 'da', 'dos', 'das', 'no', 'na', 'e', 'me',
+    'por', 'favor', 'quero', 'queria', 'pacote', 'pacotes', 'unidade', 'unidades', 'quilo',
+    'quilos', 'kg', 'litro', 'litros', 'caixa', 'caixas', 'lata', 'latas', 'garrafa', 'garrafas'
+}
+
+_FIM = None
+
+
+def tokenize(text):
+    return normalize_name(text).split()
+
+
+def parse_number(tokens, start):
+    """Lê um número a partir de tokens[start] ("25", "vinte e cinco", "mil e duzentos")
+
+    Retorna (valor, posição depois do número) ou None se ali não começa um número.
+    """
+    token = tokens[start]
+    if token.isdigit():
+        return int(token), start + 1
+
+    total, atual, i, fim = 0, 0, start, None
+    while i < len(tokens):
+        token = tokens[i]
+        if token in UNIDADES:
+            atual += UNIDADES[token]
+        elif token == 'mil':
+            total += (atual or 1) * 1000
+            atual = 0
+        else:
+            break
+        i += 1
+        fim = i
+        # "e" só continua o número se vier outra palavra numérica depois
+        if i + 1 < len(tokens) and tokens[i] == 'e' and (tokens[i + 1] in UNIDADES or tokens[i + 1] == 'mil'):
+            i += 1
+    if fim is None:
+        return None
+    return total + atual, fim
+
+
+class PhraseTrie:
+    """Trie de frases por palavra: acha, em uma posição do texto, a frase mais longa"""
+
+    def __init__(self):
+        self._root = {}
+        self.size = 0
+
+    def add(self, phrase, value):
+        node = self._root
+        for token in tokenize(phrase):
+            node = node.setdefault(token, {})
+        if _FIM not in node:
+            node[_FIM] = value
+            self.size += 1
+
+    def longest(self, tokens, start):
+        """Retorna (valor, posição depois da frase) da frase mais longa em tokens[start:]"""
+        node, found = self._root, None
+        for i in range(start, len(tokens)):
+            token = tokens[i]
+            child = node.get(token)
+            if child is None and token.endswith('s'):
+                # Plurais regulares: "bananas" -> "banana", "colheres" -> "colher"
+                child = node.get(token[:-1])
+                if child is None and token.endswith('es'):
+                    child = node.get(token[:-2])
+            if child is None:
+                break
+            node = child
+            if _FIM in node:
+                found = (node[_FIM], i + 1)
+        return found
+
+
+class IntentParser:
+    """Reconhece, em uma única frase, a ação e os campos (produto e quantidade)
+
+    'comandos' segue o formato de COMANDOS_VOZ em main.py: (ação, palavras),
+    em ordem de prioridade. O texto é percorrido uma vez; em cada posição
+    vence a frase mais longa entre comandos, produtos e números. Palavras
+    de ligação ("pacotes", "de", "por favor") são ignoradas; as demais que
+    não casam vão para 'resto' (por exemplo, um produto mal reconhecido).
+
+    parse("comprar dois pacotes de arroz") ->
+        {'acao': 'add_to_cart_voice', 'acoes': [...], 'produto': 'Arroz', 'quantidade': 2, 'resto': ''}
+    """
+
+    def __init__(self, comandos, produtos=()):
+        self._prioridade = {}
+        self._comandos = PhraseTrie()
+        for ordem, (acao, palavras) in enumerate(comandos):
+            self._prioridade.setdefault(acao, ordem)
+            for palavra in palavras:
+                self._comandos.add(palavra, acao)
+        self.set_products(produtos)
+
+    def set_products(self, produtos):
+        """Troca a lista de nomes de produtos reconhecidos"""
+        self._produtos = PhraseTrie()
+        for nome in produtos:
+            self._produtos.add(nome, nome)
+
+    def parse(self, text):
+        tokens = tokenize(text or '')
+        acoes, produto, quantidade, resto = [], None, None, []
+        i = 0
+        while i < len(tokens):
+            candidatos = []
+            comando = self._comandos.longest(tokens, i)
+            if comando:
+                candidatos.append((comando[1], 2, 'acao', comando[0]))
+            encontrado = self._produtos.longest(tokens, i)
+            if encontrado:
+                candidatos.append((encontrado[1], 1, 'produto', encontrado[0]))
+            numero = parse_number(tokens, i)
+            if numero:
+                candidatos.append((numero[1], 0, 'quantidade', numero[0]))
+            if not candidatos:
+                if tokens[i] not in PALAVRAS_VAZIAS:
+                    resto.append(tokens[i])
+                i += 1
+                continue
+
+            # Mais longa vence; no empate, comando > produto > número
+            fim, _, campo, valor = max(candidatos)
+            if campo == 'acao':
+                if valor not in acoes:
+                    acoes.append(valor)
+            elif campo == 'produto':
+                produto = produto or valor
+            elif quantidade is None:
+                quantidade = valor
+            i = fim
+
+        acoes.sort(key=self._prioridade.get)
+        return {
+            'acao': acoes[0] if acoes else None,
+            'acoes': acoes,
+            'produto': produto,
+            'quantidade': quantidade,
+            'resto': ' '.join(resto)
+        }
+
+    def match(self, text):
+        """Só a ação de maior prioridade, ou None"""
+        return self.parse(text)['acao']
@@ -0,0 +1,266 @@
+import json
+import os
+import tempfile
+import threading
+
+from modules.database import (ConcurrentModificationError, DatabaseManager, apply_mutation, first_sale_after,
+                              freeze, thaw)
+from modules.file_lock import FileLock, file_mode_for
+from modules.product_index import ProductIndex
+
+
+def _file_identity(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+class JournaledDatabaseManager(DatabaseManager):
+    """DatabaseManager que grava mutações em um log e compacta periodicamente
+
+    O arquivo principal continua sendo um snapshot no mesmo formato JSON do
+    DatabaseManager comum. Cada mutação é anexada como uma linha JSON em
+    '<database_file>.journal'; ao iniciar, snapshot + log são reaplicados.
+    """
+
+    def __init__(self, database_file="database.json", max_journal_bytes=1024 * 1024,
+                 compact_every=1000, fsync=False):
+        self.journal_file = database_file + ".journal"
+        self.max_journal_bytes = max_journal_bytes
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self._mutex = threading.RLock()
+        self._state = None
+        self._index = None
+        self._frozen = None
+        self._seq = 0
+        self._snapshot_identity = None
+        self._journal_offset = 0
+        self._journal_records = 0
+        super().__init__(database_file)
+
+    def initialize_database(self):
+        """Cria o snapshot vazio se não existir"""
+        with self._mutex, FileLock(self.lock_file):
+            if not os.path.exists(self.database_file):
+                self._set_state({"produtos": [], "usuarios": [], "vendas": []})
+                self._compact_locked()
+
+    def _set_state(self, data):
+        self._state = data
+        self._index = ProductIndex(self._state['produtos'])
+        self._frozen = None
+
+    def _read_snapshot(self):
+        """Lê o snapshot compactado"""
+        try:
+            with open(self.database_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._snapshot_identity = _file_identity(self.database_file)
+            self._seq = data.pop('_seq', 0)
+            data.pop('_versao', None)
+            return data
+        except FileNotFoundError:
+            self._snapshot_identity = None
+            self._seq = 0
+            return {"produtos": [], "usuarios": [], "vendas": []}
+
+    def _replay_journal(self):
+        """Reaplica os registros do log a partir da última posição lida"""
+        try:
+            f = open(self.journal_file, 'rb')
+        except FileNotFoundError:
+            self._journal_offset = 0
+            return
+
+        with f:
+            f.seek(self._journal_offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # Registro incompleto (escrita interrompida): ignora a cauda
+                    break
+                self._journal_offset += len(line)
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                self._journal_records += 1
+                # Registros já incorporados ao snapshot (compactação interrompida)
+                if record['_seq'] <= self._seq:
+                    continue
+                apply_mutation(self._state, record, self._index)
+                self._seq = record['_seq']
+        self._frozen = None
+
+    def _refresh(self):
+        """Sincroniza o estado em memória com snapshot e log; exige a trava"""
+        journal_size = os.path.getsize(self.journal_file) if os.path.exists(self.journal_file) else 0
+
+        if (self._state is None or _file_identity(self.database_file) != self._snapshot_identity
+                or journal_size < self._journal_offset):
+            self._set_state(self._read_snapshot())
+            self._journal_offset = 0
+            self._journal_records = 0
+
+        if journal_size > self._journal_offset:
+            self._replay_journal()
+
+    def _refresh_shared(self):
+        """Sincroniza o estado com uma trava compartilhada (leitura)"""
+        with FileLock(self.lock_file, shared=True):
+            self._refresh()
+
+    def read_data(self):
+        """Retorna uma visão somente leitura do snapshot com o log reaplicado"""
+        with self._mutex:
+            self._refresh_shared()
+            if self._frozen is None:
+                self._frozen = freeze(self._state)
+            return self._frozen
+
+    def load_data(self):
+        """Carrega o snapshot com o log reaplicado"""
+        return thaw(self.read_data())
+
+    def data_version(self):
+        """Sequência do log; muda a cada gravação"""
+        with self._mutex:
+            self._refresh_shared()
+            return self._seq
+
+    def load_versioned(self):
+        """Carrega uma cópia editável dos dados junto com a sequência do log"""
+        with self._mutex:
+            data = self.read_data()
+            return thaw(data), self._seq
+
+    def iter_sales(self, filter=None, after_id=None):
+        """Gera as vendas do estado em memória, na ordem em que foram registradas
+
+        Com 'after_id', só as de id maior (busca binária, sem percorrer as anteriores).
+        """
+        with self._mutex:
+            self._refresh_shared()
+            vendas = self._state['vendas']
+            total = len(vendas)
+            start = first_sale_after(vendas, after_id) if after_id is not None else 0
+
+        # A lista só cresce; cada venda sai como cópia somente leitura
+        for position in range(start, total):
+            venda = vendas[position]
+            if filter is None or filter(venda):
+                yield freeze(venda)
+
+    def find_product(self, name):
+        """Encontra um produto pelo nome, consultando o índice em memória"""
+        with self._mutex:
+            self._refresh_shared()
+            produto = self._index.get(name)
+            return freeze(produto) if produto is not None else None
+
+    def save_data(self, data, expected_version=None):
+        """Substitui todo o documento, gravando um novo snapshot"""
+        with self._mutex, FileLock(self.lock_file):
+            if expected_version is not None:
+                self._refresh()
+                if expected_version != self._seq:
+                    raise ConcurrentModificationError(
+                        f"{self.database_file}: sequência {self._seq}, esperada {expected_version}")
+            self._set_state(thaw(data))
+            self._seq += 1
+            self._compact_locked()
+
+    def commit(self, record):
+        """Aplica uma mutação em memória e a anexa ao log"""
+        return self.commit_many([record], notify=False)[0]
+
+    def commit_many(self, records, notify=True):
+        """Aplica várias mutações e as anexa ao log com uma única escrita
+
+        Cada registro vale por si: um que falha não impede os demais. Se a
+        escrita no log falhar, nada do lote fica valendo, nem em memória.
+        """
+        with self._mutex, FileLock(self.lock_file):
+            self._refresh()
+            results = []
+            lines = []
+            try:
+                for record in records:
+                    if not apply_mutation(self._state, record, self._index):
+                        results.append(False)
+                        continue
+                    self._frozen = None
+                    self._seq += 1
+                    record['_seq'] = self._seq
+                    lines.append((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+                    results.append(True)
+
+                if lines:
+                    data = b''.join(lines)
+                    with open(self.journal_file, 'ab') as f:
+                        # Descarta uma cauda incompleta deixada por uma escrita interrompida
+                        if f.tell() > self._journal_offset:
+                            f.truncate(self._journal_offset)
+                        f.write(data)
+                        f.flush()
+                        if self.fsync:
+                            os.fsync(f.fileno())
+            except BaseException:
+                self._discard_unwritten()
+                raise
+
+            if lines:
+                self._journal_offset += len(data)
+                self._journal_records += len(lines)
+
+                if (self._journal_offset >= self.max_journal_bytes
+                        or self._journal_records >= self.compact_every):
+                    try:
+                        self._compact_locked()
+                    except OSError as e:
+                        # O lote já está no log; a compactação fica para a próxima gravação
+                        print(f"Erro ao compactar {self.database_file}: {e}")
+
+        if notify:
+            self._notify_sales(records, results)
+        return results
+
+    def _discard_unwritten(self):
+        """Volta ao que está no disco depois de uma escrita no log que falhou; exige a trava
+
+        O lote pode ter sido aplicado em memória e gravado em parte: a cauda
+        do log é cortada e o estado é relido do snapshot e do log, para que
+        quem repetir o lote não o aplique duas vezes.
+        """
+        try:
+            if os.path.exists(self.journal_file) and os.path.getsize(self.journal_file) > self._journal_offset:
+                with open(self.journal_file, 'r+b') as f:
+                    f.truncate(self._journal_offset)
+        except OSError:
+            pass
+        self._state = None
+        self._frozen = None
+
+    def compact(self):
+        """Reescreve o snapshot com o estado atual e esvazia o log"""
+        with self._mutex, FileLock(self.lock_file):
+            self._refresh()
+            self._compact_locked()
+
+    def _compact_locked(self):
+        path = os.path.abspath(self.database_file)
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                        dir=os.path.dirname(path))
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(dict(self._state, _seq=self._seq), f, ensure_ascii=False, indent=2)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.chmod(tmp_path, file_mode_for(path))
+        os.replace(tmp_path, path)
+        open(self.journal_file, 'wb').close()
+
+        self._snapshot_identity = _file_identity(path)
+        self._journal_offset = 0
+        self._journal_records = 0
@@ -0,0 +1,87 @@
+import json
+import re
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r'[ \t\n\r]*')
+
+
+class _Reader:
+    """Buffer de texto sobre um arquivo, lido em blocos sob demanda"""
+
+    def __init__(self, fileobj, chunk_size):
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Lê mais um bloco; retorna False no fim do arquivo"""
+        if self.eof:
+            return False
+        chunk = self.fileobj.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # Descarta o que já foi consumido para manter a memória constante
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Próximo caractere não branco (sem consumir)"""
+        while True:
+            self.pos = _whitespace.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                raise ValueError("JSON incompleto")
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Esperado '{char}' na posição {self.pos}")
+        self.pos += 1
+
+    def value(self):
+        """Decodifica o próximo valor JSON completo"""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+                # Um número no fim do buffer pode continuar no próximo bloco
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+
+def iter_array_items(fileobj, key, chunk_size=64 * 1024):
+    """Gera, um a um, os itens da lista 'key' de um objeto JSON no topo do arquivo
+
+    Só um item por vez (mais um bloco de leitura) fica em memória.
+    """
+    reader = _Reader(fileobj, chunk_size)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+
+    while True:
+        name = reader.value()
+        reader.expect(':')
+        if name == key:
+            reader.expect('[')
+            if reader.peek() == ']':
+                return
+            while True:
+                yield reader.value()
+                if reader.peek() == ']':
+                    return
+                reader.expect(',')
+
+        reader.value()
+        if reader.peek() == '}':
+            return
+        reader.expect(',')
@@ -0,0 +1,157 @@
+import threading
+import wave
+
+import numpy as np
+
+# Mesmos padrões de librosa.feature.mfcc
+N_FFT = 2048
+HOP_LENGTH = 512
+N_MELS = 128
+TOP_DB = 80.0
+AMIN = 1e-10
+FFT_BLOCK = 256
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+# Escala mel de Slaney (a padrão do librosa): linear até 1 kHz, logarítmica depois
+_F_SP = 200.0 / 3
+_MIN_LOG_HZ = 1000.0
+_MIN_LOG_MEL = _MIN_LOG_HZ / _F_SP
+_LOGSTEP = np.log(6.4) / 27.0
+
+
+def _hz_to_mel(hz):
+    hz = np.asarray(hz, dtype=np.float64)
+    mel = hz / _F_SP
+    log_region = hz >= _MIN_LOG_HZ
+    mel[log_region] = _MIN_LOG_MEL + np.log(hz[log_region] / _MIN_LOG_HZ) / _LOGSTEP
+    return mel
+
+
+def _mel_to_hz(mel):
+    mel = np.asarray(mel, dtype=np.float64)
+    hz = _F_SP * mel
+    log_region = mel >= _MIN_LOG_MEL
+    hz[log_region] = _MIN_LOG_HZ * np.exp(_LOGSTEP * (mel[log_region] - _MIN_LOG_MEL))
+    return hz
+
+
+def mel_filterbank(sample_rate, n_fft=N_FFT, n_mels=N_MELS):
+    """Banco de filtros mel triangulares com normalização de Slaney, (n_mels, 1 + n_fft // 2)"""
+    fft_freqs = np.fft.rfftfreq(n_fft, 1.0 / sample_rate)
+    mel_points = np.linspace(_hz_to_mel(np.array([0.0]))[0],
+                             _hz_to_mel(np.array([sample_rate / 2.0]))[0], n_mels + 2)
+    mel_freqs = _mel_to_hz(mel_points)
+
+    widths = np.diff(mel_freqs)
+    ramps = mel_freqs[:, None] - fft_freqs[None, :]
+    lower = -ramps[:-2] / widths[:-1, None]
+    upper = ramps[2:] / widths[1:, None]
+    weights = np.maximum(0.0, np.minimum(lower, upper))
+
+    # Área constante por filtro
+    weights *= (2.0 / (mel_freqs[2:] - mel_freqs[:-2]))[:, None]
+    return weights
+
+
+def dct_matrix(n_mfcc, n_mels=N_MELS):
+    """Matriz da DCT-II ortonormal, (n_mfcc, n_mels)"""
+    n = np.arange(n_mels)
+    k = np.arange(n_mfcc)[:, None]
+    basis = np.cos(np.pi * k * (2 * n + 1) / (2 * n_mels)) * np.sqrt(2.0 / n_mels)
+    basis[0] /= np.sqrt(2.0)
+    return basis
+
+
+def _tables(sample_rate, n_mfcc):
+    """Janela, filtros mel e DCT, calculados uma vez por taxa de amostragem"""
+    key = (sample_rate, n_mfcc)
+    tables = _cache.get(key)
+    if tables is None:
+        with _cache_lock:
+            tables = _cache.get(key)
+            if tables is None:
+                # Hann periódica, como scipy.signal.get_window('hann', N_FFT)
+                window = 0.5 - 0.5 * np.cos(2 * np.pi * np.arange(N_FFT) / N_FFT)
+                tables = _cache[key] = (window, mel_filterbank(sample_rate), dct_matrix(n_mfcc))
+    return tables
+
+
+def _frames(y):
+    """Quadros sobrepostos do sinal centralizado (padding de zeros, como center=True)"""
+    y = np.pad(np.asarray(y, dtype=np.float64), N_FFT // 2)
+    if len(y) < N_FFT:
+        y = np.pad(y, (0, N_FFT - len(y)))
+    n_frames = 1 + (len(y) - N_FFT) // HOP_LENGTH
+    return np.lib.stride_tricks.as_strided(
+        y, shape=(n_frames, N_FFT), strides=(y.strides[0] * HOP_LENGTH, y.strides[0]), writeable=False)
+
+
+def mfcc_batch(signals, sample_rate=16000, n_mfcc=13):
+    """MFCCs de vários áudios de uma vez, compartilhando janela, filtros e DCT
+
+    Retorna uma lista de arrays (n_mfcc, quadros), um por áudio, equivalentes
+    a librosa.feature.mfcc(y=..., sr=sample_rate, n_mfcc=n_mfcc). Contra o
+    librosa 0.11 a diferença absoluta fica abaixo de 1e-3 nos coeficientes
+    (o librosa calcula em float32, aqui tudo é float64).
+    """
+    window, filterbank, dct = _tables(sample_rate, n_mfcc)
+    frames = [_frames(y) for y in signals]
+    if not frames:
+        return []
+    counts = [len(f) for f in frames]
+
+    mel = np.empty((sum(counts), len(filterbank)))
+    row = 0
+    for signal_frames in frames:
+        # Blocos de quadros: o espectro de um bloco cabe no cache
+        for start in range(0, len(signal_frames), FFT_BLOCK):
+            block = signal_frames[start:start + FFT_BLOCK]
+            spectrum = np.fft.rfft(block * window, axis=1)
+            mel[row:row + len(block)] = (spectrum.real ** 2 + spectrum.imag ** 2) @ filterbank.T
+            row += len(block)
+    log_mel = 10.0 * np.log10(np.maximum(AMIN, mel))
+
+    result = []
+    for block in np.split(log_mel, np.cumsum(counts)[:-1]):
+        # power_to_db(top_db=80): corte relativo ao pico de cada áudio
+        block = np.maximum(block, block.max() - TOP_DB)
+        result.append(dct @ block.T)
+    return result
+
+
+def mfcc(y, sample_rate=16000, n_mfcc=13):
+    """MFCCs de um áudio, (n_mfcc, quadros)"""
+    return mfcc_batch([y], sample_rate, n_mfcc)[0]
+
+
+def resample(y, orig_sr, target_sr):
+    """Reamostra com filtro polifásico (scipy), sem importar o librosa"""
+    from math import gcd
+    from scipy.signal import resample_poly
+
+    factor = gcd(int(orig_sr), int(target_sr))
+    return resample_poly(y, int(target_sr) // factor, int(orig_sr) // factor).astype(np.float32)
+
+
+def load_wav(path):
+    """Lê um WAV PCM de 8/16/32 bits como float32 mono; retorna (amostras, taxa)"""
+    with wave.open(path, 'rb') as f:
+        sample_rate = f.getframerate()
+        channels = f.getnchannels()
+        width = f.getsampwidth()
+        raw = f.readframes(f.getnframes())
+
+    if width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif width == 2:
+        samples = np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768.0
+    elif width == 4:
+        samples = np.frombuffer(raw, dtype='<i4').astype(np.float32) / 2147483648.0
+    else:
+        raise ValueError(f"{path}: amostras de {width} bytes não suportadas")
+
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return samples, sample_rate
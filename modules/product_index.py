@@ -0,0 +1,223 @@
+import functools
+import re
+import unicodedata
+
+_whitespace = re.compile(r"\s+")
+
+
+def normalize_name(name):
+    """Normaliza um nome de produto: sem acentos, minúsculo e com espaços simples"""
+    decomposed = unicodedata.normalize('NFKD', name)
+    without_accents = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return _whitespace.sub(' ', without_accents).strip().casefold()
+
+
+class ProductIndex:
+    """Índice hash do nome normalizado para o registro do produto"""
+
+    def __init__(self, produtos=()):
+        self._by_name = {}
+        for produto in produtos:
+            self._by_name.setdefault(normalize_name(produto['nome']), produto)
+
+    def __len__(self):
+        return len(self._by_name)
+
+    def __contains__(self, name):
+        return normalize_name(name) in self._by_name
+
+    def get(self, name):
+        """Retorna o produto com esse nome, ou None"""
+        return self._by_name.get(normalize_name(name))
+
+    def add(self, produto):
+        """Indexa um produto novo; retorna False se o nome já existir"""
+        key = normalize_name(produto['nome'])
+        if key in self._by_name:
+            return False
+        self._by_name[key] = produto
+        return True
+
+    def remove(self, name):
+        """Remove o produto do índice e o retorna"""
+        return self._by_name.pop(normalize_name(name), None)
+
+    def rename(self, old_name, produto):
+        """Reindexa um produto cujo nome mudou; retorna False se o novo nome já existir"""
+        old_key = normalize_name(old_name)
+        new_key = normalize_name(produto['nome'])
+        if new_key != old_key and new_key in self._by_name:
+            return False
+        self._by_name.pop(old_key, None)
+        self._by_name[new_key] = produto
+        return True
+
+
+# Regras da chave fonética, aplicadas em ordem a cada palavra já sem acentos
+_REGRAS_FONETICAS = [(re.compile(padrao), troca) for padrao, troca in (
+    (r"[^a-z0-9]", ""),
+    (r"ph", "f"),
+    (r"[cs]h", "x"),
+    (r"lh", "li"),
+    (r"nh", "ni"),
+    (r"h", ""),
+    (r"[sx]c(?=[ei])", "s"),
+    (r"g(?=[ei])", "j"),
+    (r"gu(?=[ei])", "g"),
+    (r"qu?", "k"),
+    (r"c(?=[ei])", "s"),
+    (r"c", "k"),
+    (r"z", "s"),
+    (r"y", "i"),
+    (r"w", "v"),
+    (r"l(?=[^aeiou]|$)", "u"),
+    (r"m(?=[^aeiou]|$)", "n"),
+    (r"(?<=.)s$", ""),
+    (r"e$", "i"),
+    (r"o$", "u"),
+    (r"(.)\1+", r"\1"),
+)]
+
+
+@functools.lru_cache(maxsize=65536)
+def _phonetic_word(palavra):
+    for padrao, troca in _REGRAS_FONETICAS:
+        palavra = padrao.sub(troca, palavra)
+    return palavra
+
+
+def phonetic_key(name):
+    """Chave fonética simplificada do português: 'Feijão' e 'feijao' ou 'Açúcar' e 'assucar' coincidem"""
+    palavras = (_phonetic_word(p) for p in normalize_name(name.casefold().replace('ç', 's')).split())
+    return ' '.join(p for p in palavras if p)
+
+
+def trigrams(text):
+    """Trigramas de caracteres, com espaço marcando o início e o fim"""
+    text = f" {text} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _dice(a, b):
+    return 2 * len(a & b) / (len(a) + len(b)) if a or b else 0.0
+
+
+class FuzzyProductIndex:
+    """Busca aproximada de nomes de produtos para o texto vindo do reconhecedor de fala
+
+    Índice invertido de trigramas da chave fonética (ver phonetic_key): cada
+    trigrama da consulta vota nos nomes que o contêm (np.bincount sobre as
+    listas de ids, sem percorrer o catálogo em Python) e os mais votados são
+    reordenados pelo coeficiente de Dice dos trigramas do nome e da chave.
+    Nomes removidos viram lápides; o índice se recompacta quando elas passam
+    da metade.
+    """
+
+    # Trigramas em mais nomes que isso (ou 5% do catálogo) não votam, salvo os três mais raros
+    max_postings = 1000
+
+    def __init__(self, names=()):
+        self._names = []
+        self._keys = []
+        self._ids = {}
+        self._by_key = {}
+        self._by_phonetic = {}
+        self._postings = {}
+        self._arrays = {}
+        self._removed = 0
+        for name in names:
+            self.add(name)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, name):
+        return name in self._ids
+
+    def add(self, name):
+        """Indexa um nome; retorna False se ele já estiver no índice"""
+        if name in self._ids:
+            return False
+        ident = len(self._names)
+        chave = phonetic_key(name)
+        self._names.append(name)
+        self._keys.append(chave)
+        self._ids[name] = ident
+        self._by_key.setdefault(normalize_name(name), ident)
+        self._by_phonetic.setdefault(chave, []).append(ident)
+        for gram in trigrams(chave):
+            self._postings.setdefault(gram, []).append(ident)
+            self._arrays.pop(gram, None)
+        return True
+
+    def remove(self, name):
+        """Tira um nome do índice; retorna False se ele não estava lá"""
+        ident = self._ids.pop(name, None)
+        if ident is None:
+            return False
+        key = normalize_name(name)
+        if self._by_key.get(key) == ident:
+            del self._by_key[key]
+        self._names[ident] = None
+        self._removed += 1
+        if self._removed > len(self._ids):
+            self._rebuild()
+        return True
+
+    def _rebuild(self):
+        names = list(self._ids)
+        self.__init__(names)
+
+    def rename(self, old_name, new_name):
+        self.remove(old_name)
+        self.add(new_name)
+
+    def sync(self, names):
+        """Ajusta o índice para conter exatamente 'names', mexendo só nas diferenças"""
+        atuais = set(names)
+        for name in self._ids.keys() - atuais:
+            self.remove(name)
+        for name in atuais - self._ids.keys():
+            self.add(name)
+
+    def _array(self, gram):
+        array = self._arrays.get(gram)
+        if array is None:
+            import numpy as np
+            array = self._arrays[gram] = np.array(self._postings[gram], dtype=np.int32)
+        return array
+
+    def search(self, query, limit=5, min_score=0.5):
+        """Nomes parecidos com 'query', como [(nome, pontuação de 0 a 1)], do melhor para o pior"""
+        ident = self._by_key.get(normalize_name(query))
+        if ident is not None:
+            return [(self._names[ident], 1.0)]
+
+        chave = phonetic_key(query)
+        grams = trigrams(chave)
+        # Trigramas muito comuns (marcas, unidades) pesam no tempo e pouco no ranking:
+        # votam só os raros, e pelo menos os três mais raros
+        presentes = sorted((g for g in grams if g in self._postings), key=lambda g: len(self._postings[g]))
+        comuns = max(self.max_postings, len(self._ids) // 20)
+        listas = [self._array(g) for i, g in enumerate(presentes) if i < 3 or len(self._postings[g]) <= comuns]
+        candidatos = [i for i in self._by_phonetic.get(chave, ()) if self._names[i] is not None]
+        if listas:
+            import numpy as np
+            votos = np.bincount(np.concatenate(listas), minlength=len(self._names))
+            # Só os nomes perto do máximo de votos seguem para a reordenação
+            melhores = np.flatnonzero(votos >= max(1, votos.max() - 2))
+            if len(melhores) > limit * 3:
+                melhores = melhores[np.argpartition(-votos[melhores], limit * 3)[:limit * 3]]
+            candidatos.extend(int(i) for i in melhores if self._names[i] is not None)
+
+        consulta = trigrams(normalize_name(query))
+        pontuados = {}
+        for i in candidatos:
+            if i in pontuados:
+                continue
+            score = max(_dice(grams, trigrams(self._keys[i])),
+                        _dice(consulta, trigrams(normalize_name(self._names[i]))))
+            pontuados[i] = score
+        resultados = sorted(((self._names[i], round(score, 3)) for i, score in pontuados.items()
+                             if score >= min_score), key=lambda r: r[1], reverse=True)
+        return resultados[:limit]
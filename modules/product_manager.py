@@ -1,77 +1,134 @@
-from modules.database import DatabaseManager
+from modules.database import create_database_manager
+from modules.product_index import FuzzyProductIndex
 
 class ProductManager:
-    def __init__(self):
-        self.db = DatabaseManager()
+    def __init__(self, db=None):
+        self.db = db or create_database_manager()
+        self._busca = None
+        self._busca_versao = None
+    
+    def search_index(self):
+        """Índice aproximado dos nomes, montado no primeiro uso
+
+        As mutações feitas por aqui atualizam o índice na hora; se o banco
+        mudou por outro caminho (outro processo, checkout), só as diferenças
+        de nomes são aplicadas.
+        """
+        versao = self.db.data_version()
+        if self._busca is None:
+            self._busca = FuzzyProductIndex(p['nome'] for p in self.list_products())
+        elif versao != self._busca_versao:
+            self._busca.sync(p['nome'] for p in self.list_products())
+        self._busca_versao = versao
+        return self._busca
+    
+    def _indexar(self, versao_anterior, *mudancas):
+        """Aplica ao índice uma mutação bem-sucedida feita por este gerenciador"""
+        if self._busca is None:
+            return
+        for metodo, args in mudancas:
+            getattr(self._busca, metodo)(*args)
+        # Se ninguém mais gravou no meio, o índice continua em dia com o banco
+        if self._busca_versao == versao_anterior and self.db.data_version() == versao_anterior + 1:
+            self._busca_versao = versao_anterior + 1
     
     def add_product(self, name, price, quantity):
         """Adiciona novo produto"""
-        data = self.db.load_data()
-        
-        product_id = len(data['produtos']) + 1
-        data['produtos'].append({
-            'id': product_id,
-            'nome': name,
-            'preco': price,
-            'quantidade': quantity
-        })
-        
-        self.db.save_data(data)
+        versao = self.db.data_version()
+        if not self.db.add_product({'nome': name, 'preco': price, 'quantidade': quantity}):
+            return False
+        self._indexar(versao, ('add', (name,)))
         return True
     
     def list_products(self):
         """Lista todos os produtos"""
-        data = self.db.load_data()
+        data = self.db.read_data()
         return data['produtos']
     
     def find_product(self, name):
         """Encontra um produto pelo nome"""
-        data = self.db.load_data()
-        for produto in data['produtos']:
-            if produto['nome'].lower() == name.lower():
-                return produto
-        return None
+        return self.db.find_product(name)
+    
+    def search_products(self, query, limit=5, min_score=0.5):
+        """Produtos com nome parecido com 'query' (erros do reconhecedor de fala)
+
+        Retorna [(produto, pontuação)] do mais para o menos provável; um nome
+        exato (ignorando acentos e maiúsculas) vem sozinho com pontuação 1.0.
+        """
+        resultados = []
+        for nome, score in self.search_index().search(query, limit, min_score):
+            produto = self.find_product(nome)
+            if produto is not None:
+                resultados.append((produto, score))
+        return resultados
+    
+    def match_product(self, name, min_score=0.6):
+        """Produto com esse nome ou, se não houver, o mais parecido; None se nada chegar perto"""
+        produto = self.find_product(name)
+        if produto is None:
+            resultados = self.search_products(name, limit=1, min_score=min_score)
+            produto = resultados[0][0] if resultados else None
+        return produto
     
     def update_product(self, name, new_price=None, new_quantity=None):
         """Atualiza produto existente"""
-        data = self.db.load_data()
+        changes = {}
+        if new_price is not None:
+            changes['preco'] = new_price
+        if new_quantity is not None:
+            changes['quantidade'] = new_quantity
         
-        for produto in data['produtos']:
-            if produto['nome'].lower() == name.lower():
-                if new_price is not None:
-                    produto['preco'] = new_price
-                if new_quantity is not None:
-                    produto['quantidade'] = new_quantity
-                
-                self.db.save_data(data)
-                return True
-        
-        return False
+        versao = self.db.data_version()
+        if not self.db.update_product(name, changes):
+            return False
+        self._indexar(versao)
+        return True
     
     def remove_product(self, name):
         """Remove produto"""
-        data = self.db.load_data()
-        initial_count = len(data['produtos'])
-        
-        data['produtos'] = [p for p in data['produtos'] if p['nome'].lower() != name.lower()]
-        
-        if len(data['produtos']) < initial_count:
-            self.db.save_data(data)
-            return True
-        return False
+        produto = self.find_product(name)
+        versao = self.db.data_version()
+        if not self.db.remove_product(name):
+            return False
+        self._indexar(versao, ('remove', (produto['nome'] if produto else name,)))
+        return True
     
     def update_stock(self, product_name, quantity_change):
         """Atualiza o estoque de um produto"""
-        data = self.db.load_data()
-        
-        for produto in data['produtos']:
-            if produto['nome'].lower() == product_name.lower():
-                new_quantity = produto['quantidade'] + quantity_change
-                if new_quantity < 0:
-                    return False  
-                
-                produto['quantidade'] = new_quantity
-                self.db.save_data(data)
-                return True
-        
-        return False  
\ No newline at end of file
+        versao = self.db.data_version()
+        if not self.db.update_stock(product_name, quantity_change):
+            return False
+        self._indexar(versao)
+        return True
+    
+    def upsert_products(self, produtos):
+        """Inclui ou atualiza vários produtos em uma única gravação (tudo ou nada)
+
+        'produtos' são dicts com 'nome' e, se houver, 'preco' e 'quantidade'
+        (obrigatórios para produto novo). Retorna (ok, resultados por item,
+        como em plan_upserts); com ok False nada foi gravado.
+        """
+        if not produtos:
+            return True, []
+        record = {'op': 'upsert_products', 'produtos': [dict(p) for p in produtos]}
+        versao = self.db.data_version()
+        if not self.db.commit(record):
+            return False, record['resultados']
+        novos = [r['nome'] for r in record['resultados'] if r['status'] == 'criado']
+        self._indexar(versao, *(('add', (nome,)) for nome in novos))
+        return True, record['resultados']
+    
+    def update_stocks(self, alteracoes):
+        """Aplica vários deltas de estoque [(nome, delta)] em uma única gravação (tudo ou nada)
+
+        Retorna (ok, resultados por item, como em plan_stock_changes); com ok
+        False (produto inexistente ou estoque negativo) nada foi gravado.
+        """
+        if not alteracoes:
+            return True, []
+        record = {'op': 'update_stock_many', 'alteracoes': [[nome, delta] for nome, delta in alteracoes]}
+        versao = self.db.data_version()
+        if not self.db.commit(record):
+            return False, record['resultados']
+        self._indexar(versao)
+        return True, record['resultados']
@@ -0,0 +1,116 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+
+
+class PromptCache:
+    """Frases já sintetizadas, guardadas em disco como WAV
+
+    A chave é (texto, voz, velocidade). Só entram frases fixas ('prompts') ou
+    que casam com um modelo ('templates', com '{}' no lugar das partes
+    variáveis); o diretório é limitado a 'max_bytes', descartando primeiro as
+    frases usadas há mais tempo.
+    """
+
+    def __init__(self, directory="tts_cache", max_bytes=32 * 1024 * 1024, prompts=(), templates=()):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.prompts = set(prompts)
+        self._templates = [
+            re.compile(re.escape(template).replace(re.escape('{}'), '.+') + r'\Z')
+            for template in templates
+        ]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.renders = 0
+        self.evictions = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self._size = sum(entry.stat().st_size for entry in os.scandir(self.directory)
+                         if entry.name.endswith('.wav'))
+
+    def cacheable(self, text):
+        return text in self.prompts or any(t.match(text) for t in self._templates)
+
+    def path(self, text, voice, rate):
+        key = hashlib.sha1(f"{voice}\0{rate}\0{text}".encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key + '.wav')
+
+    def contains(self, text, voice, rate):
+        return os.path.exists(self.path(text, voice, rate))
+
+    def lookup(self, text, voice, rate):
+        """Caminho do áudio pronto, ou None; conta acerto/falha das frases cacheáveis"""
+        if not self.cacheable(text):
+            return None
+        path = self.path(text, voice, rate)
+        try:
+            # O mtime marca o último uso, para o descarte
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def store(self, text, voice, rate, render):
+        """Sintetiza com render(caminho) e guarda o resultado atomicamente"""
+        path = self.path(text, voice, rate)
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        os.close(fd)
+        try:
+            render(tmp_path)
+            size = os.path.getsize(tmp_path)
+            if size == 0:
+                return None
+            # Regravar a mesma frase troca o arquivo: só a diferença entra no total
+            try:
+                replaced = os.path.getsize(path)
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        with self._lock:
+            self.renders += 1
+            self._size += size - replaced
+            over = self._size > self.max_bytes
+        if over:
+            self.evict()
+        return path
+
+    def evict(self):
+        """Apaga os áudios menos usados até o diretório caber em max_bytes"""
+        with self._lock:
+            entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith('.wav')]
+            entries.sort(key=lambda entry: entry.stat().st_mtime_ns)
+            self._size = sum(entry.stat().st_size for entry in entries)
+            for entry in entries:
+                if self._size <= self.max_bytes:
+                    break
+                try:
+                    size = entry.stat().st_size
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+                self._size -= size
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'renders': self.renders,
+                'evictions': self.evictions,
+                'bytes': self._size,
+                'max_bytes': self.max_bytes
+            }
@@ -1,11 +1,13 @@
-from modules.database import DatabaseManager
+from datetime import datetime
+
+from modules.database import create_database_manager
 from modules.product_manager import ProductManager
 
 class ShoppingCart:
-    def __init__(self, username):
+    def __init__(self, username, db=None):
         self.username = username
-        self.db = DatabaseManager()
-        self.product_manager = ProductManager()
+        self.db = db or create_database_manager()
+        self.product_manager = ProductManager(self.db)
         self.cart = []
     
     def add_to_cart(self, product_name, quantity):
@@ -62,28 +64,17 @@ class ShoppingCart:
         if not self.cart:
             return False, "Carrinho vazio"
         
-        for item in self.cart:
-            product = self.product_manager.find_product(item['produto'])
-            if product['quantidade'] < item['quantidade']:
-                return False, f"Estoque insuficiente para {item['produto']}"
-        
-        for item in self.cart:
-            success = self.product_manager.update_stock(item['produto'], -item['quantidade'])
-            if not success:
-                return False, f"Erro ao atualizar estoque de {item['produto']}"
-        
-        data = self.db.load_data()
-        sale_id = len(data['vendas']) + 1
         total = self.get_cart_total()
         
-        data['vendas'].append({
-            'id': sale_id,
+        success, result = self.db.checkout({
             'usuario': self.username,
             'itens': self.cart.copy(),
-            'total': total
+            'total': total,
+            'data': datetime.now().isoformat()
         })
+        if not success:
+            return False, f"Estoque insuficiente para {result}"
         
-        self.db.save_data(data)
         self.clear_cart()
         
         return True, f"Compra finalizada com sucesso! Total: R$ {total:.2f}"
\ No newline at end of file
@@ -0,0 +1,161 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from modules.speaker_store import log_weights_and_norm, mixture_log_likelihood
+
+
+class SpeakerModelCache:
+    """Cache LRU dos GMMs de locutor carregados de '<usuario>_gmm.pkl'
+
+    Cada entrada guarda o mtime/tamanho do arquivo; se o usuário for
+    recadastrado, o arquivo muda e o modelo é recarregado.
+    """
+
+    def __init__(self, voice_profiles_dir="voice_profiles", max_size=32):
+        self.voice_profiles_dir = voice_profiles_dir
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+
+    def model_file(self, username):
+        """Caminho do arquivo do modelo de um usuário"""
+        return os.path.join(self.voice_profiles_dir, f"{username}_gmm.pkl")
+
+    def get(self, username):
+        """Retorna o GMM do usuário, ou None se ele não tiver modelo"""
+        model_file = self.model_file(username)
+        try:
+            stat = os.stat(model_file)
+        except FileNotFoundError:
+            self.invalidate(username)
+            return None
+        key = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            cached = self._models.get(username)
+            if cached is not None and cached[0] == key:
+                self._models.move_to_end(username)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+
+        import joblib
+        model = joblib.load(model_file)
+
+        with self._lock:
+            self._models[username] = (key, model)
+            self._models.move_to_end(username)
+            while len(self._models) > self.max_size:
+                self._models.popitem(last=False)
+        return model
+
+    def invalidate(self, username):
+        """Descarta o modelo em cache de um usuário"""
+        with self._lock:
+            self._models.pop(username, None)
+
+    def prewarm(self, usernames):
+        """Carrega antecipadamente os modelos de uma lista de usuários"""
+        loaded = 0
+        for username in usernames:
+            if self.get(username) is not None:
+                loaded += 1
+        return loaded
+
+    def stats(self):
+        """Contadores de acertos e falhas do cache"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'size': len(self._models),
+                'max_size': self.max_size
+            }
+
+
+class SpeakerIdentifier:
+    """Identificação 1:N: pontua um áudio contra todos os GMMs diagonais de uma vez
+
+    Médias e precisões de todos os usuários já ficam empilhadas no
+    SpeakerModelStore (usuários x componentes x coeficientes); a
+    verossimilhança de todos os modelos sai de uma única passada NumPy.
+    """
+
+    # Mesmo limiar da verificação 1:1; a margem evita aceitar um empate entre usuários
+    min_score = -50
+    min_margin = 2.0
+
+    def __init__(self, store):
+        self.store = store
+        self.usernames = ()
+        self._version = None
+        self._lock = threading.Lock()
+        self._means = None
+        self._precisions = None
+        self._log_weights = None
+        self._log_norm = None
+
+    def refresh(self):
+        """Reempilha os modelos se algum foi cadastrado, alterado ou removido"""
+        with self._lock:
+            version, usernames, rows = self.store.stacked()
+            if version == self._version:
+                return
+            self.usernames = usernames
+            self._version = version
+            if rows is None:
+                self._means = None
+                return
+
+            D = self.store.n_features
+            # Visões do arquivo mapeado; só pesos e constantes são calculados aqui
+            self._means = rows[:, :, 1:1 + D]
+            self._precisions = rows[:, :, 1 + 2 * D:]
+            self._log_weights, self._log_norm = log_weights_and_norm(rows[:, :, 0], self._precisions)
+
+    def score(self, features):
+        """Log-verossimilhança média de 'features' (D,) ou (N, D) sob cada usuário"""
+        with self._lock:
+            if self._means is None:
+                return np.empty(0)
+            stacked = (self._means, self._precisions, self._log_weights, self._log_norm)
+        X = np.atleast_2d(np.asarray(features, dtype=np.float64))
+        return mixture_log_likelihood(X, *stacked).mean(axis=0)
+
+    def identify(self, features, top_k=3):
+        """Os top_k usuários mais prováveis, com a margem sobre o candidato seguinte"""
+        self.refresh()
+        scores = self.score(features)
+        if scores.size == 0:
+            return []
+
+        k = min(top_k + 1, scores.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+
+        ranking = []
+        for position, u in enumerate(top[:top_k]):
+            next_score = scores[top[position + 1]] if position + 1 < len(top) else -np.inf
+            ranking.append({
+                'usuario': self.usernames[u],
+                'score': float(scores[u]),
+                'margem': float(scores[u] - next_score)
+            })
+        return ranking
+
+    def best_match(self, features):
+        """Usuário identificado com segurança, ou None se o áudio for ambíguo"""
+        ranking = self.identify(features, top_k=1)
+        if not ranking:
+            return None
+        best = ranking[0]
+        if best['score'] > self.min_score and best['margem'] >= self.min_margin:
+            return best['usuario']
+        return None
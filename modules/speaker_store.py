@@ -0,0 +1,358 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+
+import numpy as np
+
+from modules.file_lock import FileLock, file_mode_for
+
+FORMAT_VERSION = 2
+
+
+def mixture_log_likelihood(X, means, precisions, log_weights, log_norm):
+    """Log-verossimilhança de cada amostra sob vários GMMs diagonais empilhados
+
+    X tem forma (N, D); means/precisions (U, K, D); log_weights/log_norm (U, K).
+    Retorna (N, U).
+    """
+    mp = means * precisions
+    # Mahalanobis diagonal expandida: x²·p - 2·x·μ·p + μ²·p, para todos os modelos
+    quad = (np.einsum('nd,ukd->nuk', X * X, precisions)
+            - 2.0 * np.einsum('nd,ukd->nuk', X, mp)
+            + np.einsum('ukd,ukd->uk', means, mp)[None])
+    log_prob = log_norm[None] - 0.5 * quad + log_weights[None]
+
+    peak = log_prob.max(axis=2, keepdims=True)
+    return peak[..., 0] + np.log(np.exp(log_prob - peak).sum(axis=2))
+
+
+def log_weights_and_norm(weights, precisions):
+    """Log dos pesos e constante de normalização de cada componente"""
+    with np.errstate(divide='ignore'):
+        # Componentes de preenchimento têm peso zero (log = -inf)
+        log_weights = np.log(weights)
+    n_features = precisions.shape[-1]
+    log_norm = -0.5 * (n_features * np.log(2 * np.pi) - np.log(precisions).sum(axis=-1))
+    return log_weights, log_norm
+
+
+class StoredGMM:
+    """GMM diagonal cujos parâmetros são visões (sem cópia) do arquivo mapeado"""
+
+    def __init__(self, row, n_features):
+        self.weights_ = row[:, 0]
+        self.means_ = row[:, 1:1 + n_features]
+        self.covariances_ = row[:, 1 + n_features:1 + 2 * n_features]
+        self.precisions_ = row[:, 1 + 2 * n_features:]
+
+    def score(self, X):
+        """Log-verossimilhança média das amostras, como GaussianMixture.score"""
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        log_weights, log_norm = log_weights_and_norm(self.weights_, self.precisions_)
+        per_sample = mixture_log_likelihood(X, self.means_[None], self.precisions_[None],
+                                            log_weights[None], log_norm[None])
+        return float(per_sample.mean())
+
+
+class SpeakerModelStore:
+    """Modelos de locutor em um único arquivo .npy mapeado em memória
+
+    Cada modelo ocupa uma linha de forma (componentes, 1 + 3 * coeficientes):
+    peso, médias, covariâncias e precisões de um GMM diagonal. O índice
+    '<name>.json' guarda o formato, a versão (incrementada a cada escrita), o
+    arquivo de dados atual e, em ordem, os usuários e suas linhas. Só números
+    são lidos do disco, nunca pickles.
+
+    Nenhuma linha referenciada pelo índice publicado é reescrita: um modelo
+    novo ou substituído vai para uma linha ainda não usada e só passa a valer
+    quando o índice é trocado, então um leitor com o índice antigo nunca
+    pontua contra o modelo de outro usuário. Linhas liberadas só são
+    reaproveitadas quando o arquivo enche: aí as linhas vivas são copiadas
+    para um arquivo novo (com outro número de geração no nome) e quem ainda
+    tem o antigo mapeado continua lendo o mesmo conteúdo.
+    """
+
+    def __init__(self, directory="voice_profiles", name="speaker_models",
+                 n_components=3, n_features=13, initial_capacity=16):
+        self.directory = directory
+        self.name = name
+        self.index_file = os.path.join(directory, name + ".json")
+        self.lock_file = self.index_file + ".lock"
+        self.n_components = n_components
+        self.n_features = n_features
+        self.initial_capacity = initial_capacity
+        self._lock = threading.RLock()
+        self._index = None
+        self._index_key = None
+        self._slots = {}
+        self._array = None
+        self._stacked = None
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def row_width(self):
+        return 1 + 3 * self.n_features
+
+    @property
+    def data_file(self):
+        """Arquivo de dados da geração atual"""
+        with self._lock:
+            self._sync()
+            return os.path.join(self.directory, self._index['arquivo'])
+
+    def _empty_index(self):
+        return {
+            'formato': FORMAT_VERSION,
+            'versao': 0,
+            'n_components': self.n_components,
+            'n_features': self.n_features,
+            'arquivo': self.name + ".npy",
+            'capacidade': 0,
+            'ocupadas': 0,
+            'usuarios': [],
+            'linhas': []
+        }
+
+    def _index_stat(self):
+        try:
+            stat = os.stat(self.index_file)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _sync(self, locked=False):
+        """Relê o índice (e remapeia o arquivo) se outro processo o alterou
+
+        Índice e arquivo são lidos com a trava compartilhada, para que um
+        escritor não troque um deles no meio; 'locked' indica que quem chama
+        já tem a trava exclusiva.
+        """
+        if self._index is not None and self._index_stat() == self._index_key:
+            return
+        if not locked:
+            with FileLock(self.lock_file, shared=True):
+                return self._sync(locked=True)
+
+        key = self._index_stat()
+        if key is None:
+            index = self._empty_index()
+        else:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('formato') == 1:
+                # Formato 1: linhas sempre contíguas, no arquivo <name>.npy
+                index.update(formato=FORMAT_VERSION, arquivo=self.name + ".npy",
+                             ocupadas=len(index['usuarios']), linhas=list(range(len(index['usuarios']))))
+            if index.get('formato') != FORMAT_VERSION:
+                raise ValueError(f"{self.index_file}: formato {index.get('formato')} não suportado")
+            self.n_components = index['n_components']
+            self.n_features = index['n_features']
+
+        self._index = index
+        self._index_key = key
+        self._slots = dict(zip(index['usuarios'], index['linhas']))
+        self._stacked = None
+        self._array = (np.load(os.path.join(self.directory, index['arquivo']), mmap_mode='r')
+                       if index['capacidade'] else None)
+
+    def _write_index(self, index):
+        """Grava o índice atomicamente; exige a trava já adquirida"""
+        path = os.path.abspath(self.index_file)
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                        dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(index, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp_path, file_mode_for(path))
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._index_key = None
+
+    def _writable_array(self, index, extra):
+        """Abre o arquivo para escrever 'extra' linhas novas depois das já usadas
+
+        Se não couber, cria o arquivo da geração seguinte só com as linhas
+        vivas (o índice passa a apontar para ele quando for gravado).
+        """
+        if index['ocupadas'] + extra <= index['capacidade']:
+            return np.load(os.path.join(self.directory, index['arquivo']), mmap_mode='r+')
+
+        live = len(index['linhas'])
+        new_capacity = max(self.initial_capacity, 2 * (live + extra))
+        generation = index['versao'] + 1
+        name = f"{self.name}.{generation}.npy"
+        path = os.path.abspath(os.path.join(self.directory, name))
+        fd, tmp_path = tempfile.mkstemp(prefix=name + ".", suffix=".npy", dir=os.path.dirname(path))
+        os.close(fd)
+        array = np.lib.format.open_memmap(tmp_path, mode='w+', dtype='<f8',
+                                          shape=(new_capacity, self.n_components, self.row_width))
+        if live:
+            array[:live] = np.load(os.path.join(self.directory, index['arquivo']), mmap_mode='r')[index['linhas']]
+        array.flush()
+        os.chmod(tmp_path, file_mode_for(os.path.join(self.directory, index['arquivo'])))
+        os.replace(tmp_path, path)
+        index.update(arquivo=name, capacidade=new_capacity, ocupadas=live, linhas=list(range(live)))
+        return array
+
+    def _remove_old_files(self, current):
+        """Apaga os arquivos de gerações anteriores (no Windows, os ainda mapeados ficam para a próxima)"""
+        for name in os.listdir(self.directory):
+            # '<name>.npy' (formato 1) ou '<name>.<geração>.npy'
+            generation = name[len(self.name) + 1:-4]
+            if (name != current and name.startswith(self.name + ".") and name.endswith(".npy")
+                    and (generation == "" or generation.isdigit())):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def _row(self, gmm):
+        """Converte um GaussianMixture diagonal em uma linha do arquivo"""
+        covariances = np.asarray(gmm.covariances_, dtype=np.float64)
+        means = np.asarray(gmm.means_, dtype=np.float64)
+        n_components = len(gmm.weights_)
+        if covariances.shape != means.shape:
+            raise ValueError("Apenas GMMs com covariance_type='diag' são suportados")
+        if n_components > self.n_components or means.shape[1] != self.n_features:
+            raise ValueError(f"GMM {means.shape} não cabe no formato "
+                             f"({self.n_components}, {self.n_features})")
+
+        D = self.n_features
+        row = np.zeros((self.n_components, self.row_width))
+        row[:, 1 + D:] = 1.0
+        row[:n_components, 0] = gmm.weights_
+        row[:n_components, 1:1 + D] = means
+        row[:n_components, 1 + D:1 + 2 * D] = covariances
+        row[:n_components, 1 + 2 * D:] = 1.0 / covariances
+        return row
+
+    def add_many(self, models):
+        """Adiciona ou substitui vários modelos com uma única escrita do índice"""
+        with self._lock, FileLock(self.lock_file):
+            self._sync(locked=True)
+            # Se um usuário se repetir, vale o último modelo
+            rows = {username: self._row(gmm) for username, gmm in models}
+            if not rows:
+                return 0
+
+            index = dict(self._index, usuarios=list(self._index['usuarios']),
+                         linhas=list(self._index['linhas']))
+            old_file = index['arquivo']
+            array = self._writable_array(index, len(rows))
+            positions = {username: i for i, username in enumerate(index['usuarios'])}
+            for username, row in rows.items():
+                line = index['ocupadas']
+                index['ocupadas'] += 1
+                array[line] = row
+                if username in positions:
+                    index['linhas'][positions[username]] = line
+                else:
+                    index['usuarios'].append(username)
+                    index['linhas'].append(line)
+            array.flush()
+            del array
+
+            index['versao'] += 1
+            self._write_index(index)
+            if index['arquivo'] != old_file:
+                self._remove_old_files(index['arquivo'])
+            return len(rows)
+
+    def add(self, username, gmm):
+        """Adiciona (ou substitui) o modelo de um usuário"""
+        self.add_many([(username, gmm)])
+
+    def delete(self, username):
+        """Remove o modelo de um usuário; a linha dele só é reaproveitada no próximo arquivo"""
+        with self._lock, FileLock(self.lock_file):
+            self._sync(locked=True)
+            if username not in self._slots:
+                return False
+
+            position = self._index['usuarios'].index(username)
+            index = dict(self._index, usuarios=list(self._index['usuarios']),
+                         linhas=list(self._index['linhas']))
+            del index['usuarios'][position]
+            del index['linhas'][position]
+
+            index['versao'] += 1
+            self._write_index(index)
+            return True
+
+    def get(self, username):
+        """Modelo do usuário como visões do arquivo mapeado, ou None"""
+        with self._lock:
+            self._sync()
+            slot = self._slots.get(username)
+            if slot is None:
+                return None
+            return StoredGMM(self._array[slot], self.n_features)
+
+    def stacked(self):
+        """(versão, usuários, linhas) de todos os modelos
+
+        Sem cópia enquanto as linhas estão em ordem no arquivo; depois de
+        remoções ou substituições, uma cópia feita uma vez por versão.
+        """
+        with self._lock:
+            self._sync()
+            usernames = tuple(self._index['usuarios'])
+            if not usernames:
+                return self._index['versao'], usernames, None
+            if self._stacked is None:
+                lines = self._index['linhas']
+                if lines == list(range(len(lines))):
+                    self._stacked = self._array[:len(lines)]
+                else:
+                    self._stacked = self._array[lines]
+            return self._index['versao'], usernames, self._stacked
+
+    @property
+    def version(self):
+        with self._lock:
+            self._sync()
+            return self._index['versao']
+
+    def usernames(self):
+        with self._lock:
+            self._sync()
+            return list(self._index['usuarios'])
+
+    def __contains__(self, username):
+        with self._lock:
+            self._sync()
+            return username in self._slots
+
+    def __len__(self):
+        with self._lock:
+            self._sync()
+            return len(self._index['usuarios'])
+
+
+def import_pickles(voice_profiles_dir="voice_profiles", store=None, overwrite=False):
+    """Converte os arquivos '<usuario>_gmm.pkl' de um diretório para o store"""
+    import joblib
+
+    store = store or SpeakerModelStore(voice_profiles_dir)
+    models = []
+    for name in sorted(os.listdir(voice_profiles_dir)):
+        if not name.endswith("_gmm.pkl"):
+            continue
+        username = name[:-len("_gmm.pkl")]
+        if overwrite or username not in store:
+            models.append((username, joblib.load(os.path.join(voice_profiles_dir, name))))
+    return store.add_many(models)
+
+
+if __name__ == "__main__":
+    diretorio = sys.argv[1] if len(sys.argv) > 1 else "voice_profiles"
+    store = SpeakerModelStore(diretorio)
+    convertidos = import_pickles(diretorio, store)
+    print(f"Convertidos {convertidos} modelos para {store.data_file} ({len(store)} no total)")
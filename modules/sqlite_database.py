@@ -0,0 +1,425 @@
+import json
+import sqlite3
+import sys
+import threading
+
+from modules.database import (ConcurrentModificationError, DatabaseManager, freeze, plan_stock_changes,
+                              plan_upserts)
+from modules.product_index import normalize_name
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS produtos (
+    id INTEGER PRIMARY KEY,
+    nome TEXT NOT NULL,
+    nome_busca TEXT NOT NULL,
+    preco REAL NOT NULL,
+    quantidade INTEGER NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_produtos_nome_busca ON produtos (nome_busca);
+
+CREATE TABLE IF NOT EXISTS usuarios (
+    nome TEXT PRIMARY KEY,
+    nivel_acesso TEXT,
+    data_cadastro TEXT
+);
+
+CREATE TABLE IF NOT EXISTS vendas (
+    id INTEGER PRIMARY KEY,
+    usuario TEXT,
+    total REAL NOT NULL,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_vendas_usuario ON vendas (usuario);
+CREATE INDEX IF NOT EXISTS idx_vendas_data ON vendas (data);
+
+CREATE TABLE IF NOT EXISTS itens (
+    venda_id INTEGER NOT NULL REFERENCES vendas (id) ON DELETE CASCADE,
+    posicao INTEGER NOT NULL,
+    produto TEXT NOT NULL,
+    quantidade INTEGER NOT NULL,
+    preco_unitario REAL,
+    subtotal REAL,
+    PRIMARY KEY (venda_id, posicao)
+);
+
+CREATE TABLE IF NOT EXISTS carrinhos (
+    usuario TEXT PRIMARY KEY,
+    itens TEXT NOT NULL
+);
+"""
+
+
+class _Rollback(Exception):
+    """Interrompe a transação corrente"""
+
+
+def _without_none(row):
+    return {k: v for k, v in dict(row).items() if v is not None}
+
+
+class SQLiteDatabaseManager(DatabaseManager):
+    """DatabaseManager com tabelas SQLite em vez de um documento JSON"""
+
+    def __init__(self, database_file="database.db"):
+        self._local = threading.local()
+        # (PRAGMA user_version, documento congelado) da última leitura completa
+        self._frozen = (None, None)
+        self._frozen_lock = threading.Lock()
+        super().__init__(database_file)
+
+    def _connect(self, check_same_thread=True):
+        conn = sqlite3.connect(self.database_file, timeout=30, check_same_thread=check_same_thread)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys = ON")
+        # WAL permite leitores simultâneos a um escritor entre processos
+        conn.execute("PRAGMA journal_mode = WAL")
+        return conn
+
+    def _connection(self):
+        """Conexão SQLite da thread atual"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def initialize_database(self):
+        """Cria as tabelas e índices se não existirem"""
+        conn = self._connection()
+        with conn:
+            conn.executescript(SCHEMA)
+
+    def load_data(self):
+        """Monta o documento completo a partir das tabelas"""
+        return self.load_versioned()[0]
+
+    def load_versioned(self):
+        """Lê todas as tabelas em uma única transação, junto com PRAGMA user_version"""
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN")
+            return self._read_all(conn), conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def data_version(self):
+        """PRAGMA user_version; muda a cada gravação"""
+        return self._connection().execute("PRAGMA user_version").fetchone()[0]
+
+    def _read_all(self, conn):
+        produtos = [
+            dict(row) for row in
+            conn.execute("SELECT id, nome, preco, quantidade FROM produtos ORDER BY id")
+        ]
+        usuarios = [
+            _without_none(row) for row in
+            conn.execute("SELECT nome, nivel_acesso, data_cadastro FROM usuarios ORDER BY rowid")
+        ]
+
+        itens_por_venda = {}
+        for row in conn.execute(
+                "SELECT venda_id, produto, quantidade, preco_unitario, subtotal "
+                "FROM itens ORDER BY venda_id, posicao"):
+            item = _without_none(row)
+            itens_por_venda.setdefault(item.pop('venda_id'), []).append(item)
+
+        vendas = []
+        for row in conn.execute("SELECT id, usuario, total, data FROM vendas ORDER BY id"):
+            venda = _without_none(row)
+            venda['itens'] = itens_por_venda.get(venda['id'], [])
+            vendas.append(venda)
+
+        carrinhos = {
+            row['usuario']: json.loads(row['itens'])
+            for row in conn.execute("SELECT usuario, itens FROM carrinhos ORDER BY rowid")
+        }
+
+        return {"produtos": produtos, "usuarios": usuarios, "vendas": vendas, "carrinhos": carrinhos}
+
+    def read_data(self):
+        """Visão somente leitura dos dados, remontada das tabelas só quando a versão muda"""
+        version = self.data_version()
+        cached_version, frozen = self._frozen
+        if cached_version == version:
+            return frozen
+        with self._frozen_lock:
+            cached_version, frozen = self._frozen
+            if cached_version != version:
+                data, version = self.load_versioned()
+                frozen = freeze(data)
+                self._frozen = (version, frozen)
+            return frozen
+
+    def save_data(self, data, expected_version=None):
+        """Substitui todo o conteúdo das tabelas pelo documento informado"""
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            current = conn.execute("PRAGMA user_version").fetchone()[0]
+            if expected_version is not None and expected_version != current:
+                raise ConcurrentModificationError(
+                    f"{self.database_file}: versão {current}, esperada {expected_version}")
+            self._bump_version(conn)
+            conn.execute("DELETE FROM itens")
+            conn.execute("DELETE FROM vendas")
+            conn.execute("DELETE FROM usuarios")
+            conn.execute("DELETE FROM produtos")
+            conn.execute("DELETE FROM carrinhos")
+            for produto in data.get('produtos', []):
+                self._insert_product(conn, produto)
+            for usuario in data.get('usuarios', []):
+                self._insert_user(conn, usuario)
+            for venda in data.get('vendas', []):
+                self._insert_sale(conn, venda)
+            for usuario, itens in data.get('carrinhos', {}).items():
+                self._apply(conn, {'op': 'set_cart', 'usuario': usuario, 'itens': itens})
+
+    def _insert_product(self, conn, produto):
+        cursor = conn.execute(
+            "INSERT INTO produtos (id, nome, nome_busca, preco, quantidade) VALUES (?, ?, ?, ?, ?)",
+            (produto.get('id'), produto['nome'], normalize_name(produto['nome']),
+             produto['preco'], produto['quantidade']))
+        return cursor.lastrowid
+
+    def _insert_user(self, conn, usuario):
+        conn.execute(
+            "INSERT INTO usuarios (nome, nivel_acesso, data_cadastro) VALUES (?, ?, ?)",
+            (usuario['nome'], usuario.get('nivel_acesso'), usuario.get('data_cadastro')))
+
+    def _insert_sale(self, conn, venda):
+        cursor = conn.execute(
+            "INSERT INTO vendas (id, usuario, total, data) VALUES (?, ?, ?, ?)",
+            (venda.get('id'), venda.get('usuario'), venda['total'], venda.get('data')))
+        venda_id = cursor.lastrowid
+        conn.executemany(
+            "INSERT INTO itens (venda_id, posicao, produto, quantidade, preco_unitario, subtotal) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(venda_id, posicao, item['produto'], item['quantidade'],
+              item.get('preco_unitario'), item.get('subtotal'))
+             for posicao, item in enumerate(venda.get('itens', []))])
+        return venda_id
+
+    def _bump_version(self, conn):
+        """Incrementa o contador de versão guardado em PRAGMA user_version"""
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        conn.execute(f"PRAGMA user_version = {version + 1}")
+
+    def commit(self, record):
+        """Aplica uma mutação em uma transação SQLite"""
+        conn = self._connection()
+        try:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                if not self._apply(conn, record):
+                    raise _Rollback()
+                self._bump_version(conn)
+        except _Rollback:
+            return False
+        return True
+
+    def commit_many(self, records, notify=True):
+        """Aplica várias mutações em uma única transação
+
+        Cada registro roda em um SAVEPOINT próprio: um que falha é desfeito
+        sem desfazer os demais.
+        """
+        conn = self._connection()
+        results = []
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for record in records:
+                conn.execute("SAVEPOINT registro")
+                ok = self._apply(conn, record)
+                conn.execute("RELEASE registro" if ok else "ROLLBACK TO registro")
+                if not ok:
+                    conn.execute("RELEASE registro")
+                results.append(ok)
+            if any(results):
+                self._bump_version(conn)
+
+        if notify:
+            self._notify_sales(records, results)
+        return results
+
+    def _apply(self, conn, record):
+        """Executa a mutação dentro da transação corrente"""
+        op = record['op']
+
+        if op == 'add_user':
+            try:
+                self._insert_user(conn, record['usuario'])
+            except sqlite3.IntegrityError:
+                return False
+            return True
+
+        if op == 'seed_products':
+            if any(conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone()
+                   for table in ('produtos', 'usuarios', 'vendas')):
+                return False
+            for produto in record['produtos']:
+                self._insert_product(conn, produto)
+            return True
+
+        if op == 'add_product':
+            try:
+                self._insert_product(conn, record['produto'])
+            except sqlite3.IntegrityError:
+                return False
+            return True
+
+        if op == 'update_product':
+            campos = {k: v for k, v in record['campos'].items() if k in ('nome', 'preco', 'quantidade')}
+            if 'nome' in campos:
+                campos['nome_busca'] = normalize_name(campos['nome'])
+            assignments = ", ".join(f"{column} = ?" for column in campos) or "id = id"
+            try:
+                cursor = conn.execute(
+                    f"UPDATE produtos SET {assignments} WHERE nome_busca = ?",
+                    (*campos.values(), normalize_name(record['nome'])))
+            except sqlite3.IntegrityError:
+                return False
+            return cursor.rowcount > 0
+
+        if op == 'remove_product':
+            cursor = conn.execute("DELETE FROM produtos WHERE nome_busca = ?",
+                                  (normalize_name(record['nome']),))
+            return cursor.rowcount > 0
+
+        if op == 'update_stock':
+            cursor = conn.execute(
+                "UPDATE produtos SET quantidade = quantidade + ? "
+                "WHERE nome_busca = ? AND quantidade + ? >= 0",
+                (record['delta'], normalize_name(record['nome']), record['delta']))
+            return cursor.rowcount > 0
+
+        if op == 'upsert_products':
+            ok, record['resultados'] = plan_upserts(record['produtos'], lambda nome: self._find(conn, nome))
+            if not ok:
+                return False
+            for produto, resultado in zip(record['produtos'], record['resultados']):
+                if resultado['status'] == 'criado':
+                    self._insert_product(conn, produto)
+                    continue
+                campos = {k: produto[k] for k in ('preco', 'quantidade') if produto.get(k) is not None}
+                if campos:
+                    assignments = ", ".join(f"{column} = ?" for column in campos)
+                    conn.execute(f"UPDATE produtos SET {assignments} WHERE nome_busca = ?",
+                                 (*campos.values(), normalize_name(produto['nome'])))
+            return True
+
+        if op == 'update_stock_many':
+            ok, record['resultados'], novas = plan_stock_changes(
+                record['alteracoes'], lambda nome: self._find(conn, nome))
+            if not ok:
+                return False
+            conn.executemany("UPDATE produtos SET quantidade = ? WHERE nome_busca = ?",
+                             [(quantidade, key) for key, (_, quantidade) in novas.items()])
+            return True
+
+        if op == 'set_cart':
+            if record['itens']:
+                conn.execute("INSERT OR REPLACE INTO carrinhos (usuario, itens) VALUES (?, ?)",
+                             (record['usuario'], json.dumps(record['itens'], ensure_ascii=False)))
+            else:
+                conn.execute("DELETE FROM carrinhos WHERE usuario = ?", (record['usuario'],))
+            return True
+
+        if op == 'add_sale':
+            venda_id = self._insert_sale(conn, record['venda'])
+            if 'id' not in record['venda']:
+                record['venda'] = {'id': venda_id, **record['venda']}
+            return True
+
+        if op == 'checkout':
+            venda = record['venda']
+            linhas = {}
+            for item in venda['itens']:
+                linha = linhas.setdefault(normalize_name(item['produto']), [item['produto'], 0])
+                linha[1] += item['quantidade']
+
+            for key, (nome, quantidade) in linhas.items():
+                cursor = conn.execute(
+                    "UPDATE produtos SET quantidade = quantidade - ? "
+                    "WHERE nome_busca = ? AND quantidade >= ?",
+                    (quantidade, key, quantidade))
+                if cursor.rowcount == 0:
+                    # O commit desfaz as baixas já feitas nesta transação
+                    record['falta'] = nome
+                    return False
+            record['venda'] = {'id': self._insert_sale(conn, venda), **venda}
+            return True
+
+        raise ValueError(f"Operação desconhecida: {op}")
+
+    def iter_sales(self, filter=None, after_id=None):
+        """Gera as vendas uma a uma a partir de um cursor, com seus itens
+
+        Com 'after_id', só as de id maior (faixa da chave primária).
+
+        O cursor usa uma conexão própria, fechada ao fim: o gerador pode ser
+        consumido aos poucos e de threads diferentes (ex.: StreamingResponse).
+        """
+        conn = self._connect(check_same_thread=False)
+        try:
+            cursor = conn.execute(
+                "SELECT v.id, v.usuario, v.total, v.data, "
+                "i.produto, i.quantidade, i.preco_unitario, i.subtotal "
+                "FROM vendas v LEFT JOIN itens i ON i.venda_id = v.id "
+                "WHERE v.id > ? ORDER BY v.id, i.posicao", (-1 if after_id is None else after_id,))
+
+            venda = None
+            for row in cursor:
+                if venda is None or venda['id'] != row['id']:
+                    if venda is not None and (filter is None or filter(venda)):
+                        yield venda
+                    venda = _without_none({k: row[k] for k in ('id', 'usuario', 'total', 'data')})
+                    venda['itens'] = []
+                if row['produto'] is not None:
+                    venda['itens'].append(_without_none(
+                        {k: row[k] for k in ('produto', 'quantidade', 'preco_unitario', 'subtotal')}))
+            if venda is not None and (filter is None or filter(venda)):
+                yield venda
+        finally:
+            conn.close()
+
+    def carts(self):
+        """Carrinhos em aberto, por usuário"""
+        return {
+            row['usuario']: json.loads(row['itens'])
+            for row in self._connection().execute("SELECT usuario, itens FROM carrinhos ORDER BY rowid")
+        }
+
+    def user_exists(self, username):
+        """Verifica se um usuário existe"""
+        row = self._connection().execute(
+            "SELECT 1 FROM usuarios WHERE nome = ?", (username,)).fetchone()
+        return row is not None
+
+    def _find(self, conn, name):
+        row = conn.execute(
+            "SELECT id, nome, preco, quantidade FROM produtos WHERE nome_busca = ?",
+            (normalize_name(name),)).fetchone()
+        return dict(row) if row else None
+
+    def find_product(self, name):
+        """Encontra um produto pelo nome"""
+        return self._find(self._connection(), name)
+
+
+def migrate_json_to_sqlite(json_file="database.json", sqlite_file="database.db"):
+    """Copia o conteúdo de um database.json para um banco SQLite"""
+    with open(json_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    db = SQLiteDatabaseManager(sqlite_file)
+    db.save_data(data)
+    return {
+        'produtos': len(data.get('produtos', [])),
+        'usuarios': len(data.get('usuarios', [])),
+        'vendas': len(data.get('vendas', []))
+    }
+
+
+if __name__ == "__main__":
+    origem = sys.argv[1] if len(sys.argv) > 1 else "database.json"
+    destino = sys.argv[2] if len(sys.argv) > 2 else "database.db"
+    contagem = migrate_json_to_sqlite(origem, destino)
+    print(f"Migrados para {destino}: {contagem['produtos']} produtos, "
+          f"{contagem['usuarios']} usuários, {contagem['vendas']} vendas")
@@ -0,0 +1,192 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from modules.database import plan_stock_changes
+from modules.product_index import normalize_name
+
+
+class StockManager:
+    """Baixa de estoque e reservas sobre um catálogo em memória, com uma trava por produto
+
+    checkout() confere e baixa todas as linhas de uma compra de uma vez,
+    segurando só as travas dos produtos envolvidos, sempre na ordem do nome
+    normalizado (assim duas compras nunca esperam uma pela outra em ciclo).
+    Compras de produtos diferentes não disputam trava nenhuma. Isso só
+    rende paralelismo com chamadas vindas de várias threads e trabalho
+    demorado com as travas seguras (ver _debit); chamado de rotas async
+    em um único event loop, tudo já roda em sequência.
+
+    Com 'reservation_ttl' (segundos), reserve() separa estoque para o
+    carrinho de um usuário por esse tempo; o que está reservado para outros
+    não conta como disponível. Reservas vencidas são descartadas quando o
+    produto é consultado de novo.
+    """
+
+    def __init__(self, catalog, reservation_ttl=None, clock=time.monotonic):
+        self.catalog = catalog
+        self.reservation_ttl = reservation_ttl
+        self.clock = clock
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        # nome normalizado -> {usuario: [quantidade, expira_em]}
+        self._reservas = {}
+
+    def _lock(self, key):
+        lock = self._locks.get(key)
+        if lock is None:
+            with self._locks_guard:
+                lock = self._locks.setdefault(key, threading.Lock())
+        return lock
+
+    @contextmanager
+    def _locked(self, keys):
+        """Segura as travas de vários produtos, sempre na ordem do nome normalizado"""
+        locks = [self._lock(key) for key in sorted(set(keys))]
+        for lock in locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def _reservas_vivas(self, key):
+        """Reservas ainda válidas do produto; exige a trava dele"""
+        reservas = self._reservas.get(key)
+        if not reservas:
+            return {}
+        agora = self.clock()
+        for usuario in [u for u, (_, expira) in reservas.items() if expira <= agora]:
+            del reservas[usuario]
+        return reservas
+
+    def _disponivel(self, key, produto, usuario=None):
+        """Estoque menos o que está reservado para outros usuários; exige a trava"""
+        reservas = self._reservas_vivas(key)
+        return produto['quantidade'] - sum(q for u, (q, _) in reservas.items() if u != usuario)
+
+    def available(self, name, usuario=None):
+        """Quantidade que 'usuario' ainda pode levar (None se o produto não existir)"""
+        key = normalize_name(name)
+        with self._lock(key):
+            produto = self.catalog.get(key)
+            return None if produto is None else self._disponivel(key, produto, usuario)
+
+    def reserve(self, usuario, name, quantidade):
+        """Soma 'quantidade' à reserva do usuário e renova o prazo; False se não houver estoque
+
+        Sem 'reservation_ttl' só confere a disponibilidade, sem reservar.
+        """
+        key = normalize_name(name)
+        with self._lock(key):
+            produto = self.catalog.get(key)
+            if produto is None:
+                return False
+            if not self.reservation_ttl:
+                return self._disponivel(key, produto, usuario) >= quantidade
+            reservas = self._reservas_vivas(key)
+            atual = reservas.get(usuario, (0, 0))[0]
+            if self._disponivel(key, produto, usuario) < atual + quantidade:
+                return False
+            self._reservas.setdefault(key, {})[usuario] = [atual + quantidade, self.clock() + self.reservation_ttl]
+            return True
+
+    def release(self, usuario, name=None, quantidade=None):
+        """Devolve a reserva do usuário: de um produto (toda ou 'quantidade') ou de todos"""
+        keys = [normalize_name(name)] if name is not None else list(self._reservas)
+        for key in keys:
+            with self._lock(key):
+                reservas = self._reservas.get(key, {})
+                reserva = reservas.get(usuario)
+                if reserva is None:
+                    continue
+                if quantidade is None or quantidade >= reserva[0]:
+                    del reservas[usuario]
+                else:
+                    reserva[0] -= quantidade
+
+    def reserve_many(self, usuario, itens):
+        """Reserva várias linhas (nome, quantidade) de uma vez: todas ou nenhuma
+
+        Retorna (ok, resultados), um por item: 'ok', 'nao_encontrado' ou
+        'indisponivel'. Linhas do mesmo produto se somam.
+        """
+        keys = [normalize_name(nome) for nome, _ in itens]
+        with self._locked(keys):
+            pedido = {}
+            resultados = []
+            for key, (nome, quantidade) in zip(keys, itens):
+                produto = self.catalog.get(key)
+                if produto is None:
+                    resultados.append({'nome': nome, 'status': 'nao_encontrado'})
+                    continue
+                total = pedido.get(key, 0) + quantidade
+                if self.reservation_ttl:
+                    total_reservado = self._reservas_vivas(key).get(usuario, (0, 0))[0] + total
+                else:
+                    total_reservado = total
+                if self._disponivel(key, produto, usuario) < total_reservado:
+                    resultados.append({'nome': nome, 'status': 'indisponivel'})
+                    continue
+                pedido[key] = total
+                resultados.append({'nome': nome, 'status': 'ok'})
+            if any(r['status'] != 'ok' for r in resultados):
+                return False, resultados
+            if self.reservation_ttl:
+                expira = self.clock() + self.reservation_ttl
+                for key, quantidade in pedido.items():
+                    reservas = self._reservas.setdefault(key, {})
+                    reservas[usuario] = [reservas.get(usuario, (0, 0))[0] + quantidade, expira]
+            return True, resultados
+
+    def adjust(self, alteracoes):
+        """Aplica deltas de estoque [(nome, delta)] de uma vez: todos ou nenhum
+
+        Retorna (ok, resultados por item, como em plan_stock_changes). O
+        estoque reservado não impede a baixa; só o total não pode ficar negativo.
+        """
+        with self._locked(normalize_name(nome) for nome, _ in alteracoes):
+            ok, resultados, novas = plan_stock_changes(alteracoes, self.catalog.get)
+            if ok:
+                for produto, quantidade in novas.values():
+                    produto['quantidade'] = quantidade
+                self.catalog.touch()
+            return ok, resultados
+
+    def checkout(self, usuario, itens):
+        """Confere e baixa o estoque de todas as linhas de uma vez
+
+        'itens' são pares (nome, quantidade). Retorna (True, None) ou
+        (False, nome do produto que faltou); sem baixa parcial. As reservas
+        do usuário para esses produtos são consumidas.
+        """
+        linhas = {}
+        for nome, quantidade in itens:
+            linha = linhas.setdefault(normalize_name(nome), [nome, 0])
+            linha[1] += quantidade
+
+        with self._locked(linhas):
+            produtos = {}
+            for key in sorted(linhas):
+                nome, quantidade = linhas[key]
+                produto = self.catalog.get(key)
+                if produto is None or self._disponivel(key, produto, usuario) < quantidade:
+                    return False, nome
+                produtos[key] = produto
+            self._debit(produtos, linhas)
+            self.catalog.touch()
+            for key in linhas:
+                self._reservas.get(key, {}).pop(usuario, None)
+            return True, None
+
+    def _debit(self, produtos, linhas):
+        """Aplica a baixa; roda com as travas dos produtos seguras"""
+        for key, produto in produtos.items():
+            produto['quantidade'] -= linhas[key][1]
+
+    def reserved(self, name):
+        """Total reservado (e válido) de um produto"""
+        key = normalize_name(name)
+        with self._lock(key):
+            return sum(q for q, _ in self._reservas_vivas(key).values())
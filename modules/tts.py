@@ -0,0 +1,237 @@
+import threading
+from collections import deque
+
+from modules.mfcc import load_wav
+
+
+def coalesce(texts):
+    """Junta frases enfileiradas em uma só fala, sem repetir frases seguidas iguais"""
+    partes = []
+    for text in texts:
+        text = text.strip()
+        if not text or (partes and partes[-1] == text):
+            continue
+        partes.append(text)
+    return " ".join(p if p[-1] in ".!?:;," else p + "." for p in partes)
+
+
+def play_wav(path):
+    """Toca um WAV pelo sounddevice e espera terminar"""
+    import sounddevice as sd
+
+    samples, sample_rate = load_wav(path)
+    sd.play(samples, sample_rate)
+    sd.wait()
+
+
+def stop_playback():
+    import sounddevice as sd
+    sd.stop()
+
+
+class SpeechWorker:
+    """Síntese de voz em uma thread dedicada, alimentada por uma fila
+
+    speak() só enfileira e retorna um Event que é marcado quando a frase
+    termina (ou é descartada). Frases que se acumulam enquanto o motor fala
+    saem juntas na próxima chamada ao motor. cancel() esvazia a fila e pede
+    ao motor que pare a frase atual (barge-in). O motor é criado pela
+    própria thread, na primeira fala, com 'engine_factory'.
+
+    Com um PromptCache, frases já sintetizadas são tocadas direto do disco;
+    as que faltam são renderizadas quando a fila estiver vazia.
+    """
+
+    def __init__(self, engine_factory, max_coalesce=20, prompt_cache=None, player=play_wav):
+        self.engine_factory = engine_factory
+        self.max_coalesce = max_coalesce
+        self.prompt_cache = prompt_cache
+        self.player = player
+        self.idle = threading.Event()
+        self.idle.set()
+        self._queue = deque()
+        self._to_render = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self._engine = None
+        self._voice = None
+        self._speaking = False
+        self._playing = False
+        self._can_play = True
+        self._generation = 0
+        self.enfileiradas = 0
+        self.falas = 0
+        self.canceladas = 0
+
+    def _start(self):
+        """Inicia a thread se preciso; exige self._cond"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="tts", daemon=True)
+            self._thread.start()
+
+    def speak(self, text, wait=False, timeout=None):
+        """Enfileira uma frase; com wait=True, bloqueia até ela ser falada"""
+        done = threading.Event()
+        with self._cond:
+            self._queue.append((text, done))
+            self.enfileiradas += 1
+            self.idle.clear()
+            self._start()
+            self._cond.notify()
+        if wait:
+            done.wait(timeout)
+        return done
+
+    def warm(self, texts):
+        """Renderiza no cache, em segundo plano, as frases que ainda não estão lá"""
+        if self.prompt_cache is None:
+            return
+        with self._cond:
+            for text in texts:
+                if self.prompt_cache.cacheable(text) and text not in self._to_render:
+                    self._to_render.append(text)
+            self._start()
+            self._cond.notify()
+
+    def cancel(self):
+        """Descarta a fila e interrompe a frase em andamento"""
+        with self._cond:
+            dropped = list(self._queue)
+            self._queue.clear()
+            self._generation += 1
+            self.canceladas += len(dropped)
+            engine = self._engine if self._speaking else None
+            playing = self._playing
+        for _, done in dropped:
+            done.set()
+        try:
+            if playing:
+                stop_playback()
+            if engine is not None:
+                engine.stop()
+        except Exception:
+            pass
+
+    def busy(self):
+        return not self.idle.is_set()
+
+    def wait(self, timeout=None):
+        """Espera a fila esvaziar e o motor ficar livre"""
+        return self.idle.wait(timeout)
+
+    def stats(self):
+        with self._cond:
+            stats = {
+                'enfileiradas': self.enfileiradas,
+                'falas': self.falas,
+                'canceladas': self.canceladas,
+                'pendentes': len(self._queue),
+                'falando': self._speaking or self._playing
+            }
+        if self.prompt_cache is not None:
+            stats['cache'] = self.prompt_cache.stats()
+        return stats
+
+    def _run(self):
+        try:
+            self._engine = self.engine_factory()
+        except Exception as e:
+            print(f"Erro ao inicializar síntese de voz: {e}")
+            self._engine = None
+        if self._engine is not None:
+            try:
+                self._voice = (self._engine.getProperty('voice'), self._engine.getProperty('rate'))
+            except Exception:
+                self._voice = (None, None)
+
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self.idle.set()
+                    if self._to_render:
+                        break
+                    self._cond.wait()
+                if not self._queue:
+                    text = self._to_render.pop(0)
+                    batch = None
+                else:
+                    batch = [self._queue.popleft() for _ in range(min(self.max_coalesce, len(self._queue)))]
+                    generation = self._generation
+
+            if batch is None:
+                self._render(text)
+                continue
+
+            try:
+                self._speak_batch([text for text, _ in batch], generation)
+            except Exception as e:
+                print(f"Erro ao falar: {e}")
+            finally:
+                with self._cond:
+                    self._speaking = False
+                    self._playing = False
+                    self.falas += 1
+                for _, done in batch:
+                    done.set()
+
+    def _speak_batch(self, texts, generation):
+        """Toca as frases em cache e sintetiza as demais, na ordem"""
+        segments = []
+        for text in texts:
+            path = self._cached(text)
+            if path is not None:
+                segments.append(('tocar', path, text))
+            elif segments and segments[-1][0] == 'falar':
+                segments[-1][2].append(text)
+            else:
+                segments.append(('falar', None, [text]))
+
+        for kind, path, payload in segments:
+            with self._cond:
+                if generation != self._generation:
+                    return
+                self._playing = kind == 'tocar'
+                self._speaking = kind == 'falar'
+            if kind == 'tocar':
+                try:
+                    self.player(path)
+                    continue
+                except Exception as e:
+                    # Sem saída de áudio pelo sounddevice: volta a sintetizar
+                    print(f"Erro ao tocar frase em cache: {e}")
+                    self._can_play = False
+                    payload = [payload]
+                    with self._cond:
+                        self._playing = False
+                        self._speaking = True
+            if self._engine is not None:
+                self._engine.say(coalesce(payload))
+                self._engine.runAndWait()
+
+    def _cached(self, text):
+        if self.prompt_cache is None or self._engine is None or not self._can_play:
+            return None
+        voice, rate = self._voice
+        path = self.prompt_cache.lookup(text, voice, rate)
+        if path is None and self.prompt_cache.cacheable(text):
+            with self._cond:
+                if text not in self._to_render:
+                    self._to_render.append(text)
+        return path
+
+    def _render(self, text):
+        cache = self.prompt_cache
+        if cache is None or self._engine is None or not self._can_play:
+            return
+        voice, rate = self._voice
+        if cache.contains(text, voice, rate):
+            return
+
+        def render(path):
+            self._engine.save_to_file(text, path)
+            self._engine.runAndWait()
+
+        try:
+            cache.store(text, voice, rate, render)
+        except Exception as e:
+            print(f"Erro ao renderizar frase: {e}")
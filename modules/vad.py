@@ -0,0 +1,117 @@
+import numpy as np
+
+
+def frame_features(samples, frame_length):
+    """Energia (dBFS) e taxa de cruzamentos por zero de cada quadro completo"""
+    n_frames = len(samples) // frame_length
+    frames = np.asarray(samples[:n_frames * frame_length], dtype=np.float32).reshape(n_frames, frame_length)
+    energy = 10.0 * np.log10(np.mean(frames * frames, axis=1, dtype=np.float64) + 1e-10)
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (frame_length - 1)
+    return energy, zcr
+
+
+def is_speech(energy, zcr, noise_db, energy_margin_db=10.0, zcr_threshold=0.3, floor_db=-55.0):
+    """Quadros de fala: bem acima do ruído, ou um pouco acima com muitos cruzamentos por zero
+
+    O segundo critério pega consoantes surdas (s, f, x), fracas em energia.
+    Funciona com escalares ou arrays.
+    """
+    loud = energy > noise_db + energy_margin_db
+    fricative = (energy > noise_db + energy_margin_db / 2) & (zcr > zcr_threshold)
+    return (loud | fricative) & (energy > floor_db)
+
+
+def trim_silence(samples, sample_rate=16000, frame_ms=20, padding_ms=100):
+    """Remove o silêncio do começo e do fim (devolve uma visão, sem cópia)
+
+    O nível de ruído é estimado pelos quadros mais fracos do próprio áudio;
+    se nenhum quadro parecer fala, o áudio volta inalterado.
+    """
+    frame_length = int(sample_rate * frame_ms / 1000)
+    energy, zcr = frame_features(samples, frame_length)
+    if len(energy) == 0:
+        return samples
+
+    noise_db = np.percentile(energy, 10)
+    speech = np.flatnonzero(is_speech(energy, zcr, noise_db))
+    if len(speech) == 0:
+        return samples
+
+    padding = int(sample_rate * padding_ms / 1000)
+    start = max(0, speech[0] * frame_length - padding)
+    end = min(len(samples), (speech[-1] + 1) * frame_length + padding)
+    return samples[start:end]
+
+
+class VoiceActivityDetector:
+    """Detector de fim de fala para captura em streaming
+
+    Os primeiros quadros calibram o nível de ruído; a fala começa depois de
+    alguns quadros de fala seguidos e termina após 'hangover_ms' de silêncio.
+    """
+
+    def __init__(self, sample_rate=16000, frame_ms=20, hangover_ms=600, calibration_ms=200,
+                 min_speech_ms=60, energy_margin_db=10.0, zcr_threshold=0.3, floor_db=-55.0):
+        self.sample_rate = sample_rate
+        self.frame_length = int(sample_rate * frame_ms / 1000)
+        self.hangover_frames = max(1, hangover_ms // frame_ms)
+        self.calibration_frames = max(1, calibration_ms // frame_ms)
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.energy_margin_db = energy_margin_db
+        self.zcr_threshold = zcr_threshold
+        self.floor_db = floor_db
+        self.reset()
+
+    def reset(self):
+        self.noise_db = None
+        self.triggered = False
+        self.finished = False
+        self.frames = 0
+        self.speech_frames = 0
+        self._calibration = []
+        self._pending = np.empty(0, dtype=np.float32)
+        self._run = 0
+        self._silence = 0
+
+    def process(self, block):
+        """Consome um bloco de amostras; retorna True quando a fala terminou"""
+        block = np.asarray(block, dtype=np.float32)
+        samples = np.concatenate((self._pending, block)) if len(self._pending) else block
+        usable = len(samples) - len(samples) % self.frame_length
+        self._pending = samples[usable:].copy()
+
+        energy, zcr = frame_features(samples[:usable], self.frame_length)
+        for frame_energy, frame_zcr in zip(energy.tolist(), zcr.tolist()):
+            self._frame(frame_energy, frame_zcr)
+            if self.finished:
+                break
+        return self.finished
+
+    def _frame(self, energy, zcr):
+        self.frames += 1
+        if self.noise_db is None:
+            # O quadro mais fraco da calibração resiste a uma fala que comece cedo
+            self._calibration.append(energy)
+            if len(self._calibration) >= self.calibration_frames:
+                self.noise_db = min(self._calibration)
+            return
+
+        speech = is_speech(energy, zcr, self.noise_db, self.energy_margin_db,
+                           self.zcr_threshold, self.floor_db)
+        if not self.triggered:
+            if speech:
+                self._run += 1
+                if self._run >= self.min_speech_frames:
+                    self.triggered = True
+                    self.speech_frames = self._run
+            else:
+                self._run = 0
+                self.noise_db = 0.95 * self.noise_db + 0.05 * energy
+        elif speech:
+            self._silence = 0
+            self.speech_frames += 1
+        else:
+            self._silence += 1
+            if self._silence >= self.hangover_frames:
+                self.finished = True
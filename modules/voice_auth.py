@@ -1,57 +1,75 @@
 import os
-import numpy as np
-import librosa
-import soundfile as sf
 import speech_recognition as sr
-from sklearn.mixture import GaussianMixture
 import warnings
+
+from modules.audio import (SAMPLE_RATE, AudioTurnStats, extract_mfcc_features, record_samples,
+                           record_until_silence, to_samples)
+from modules.speaker_models import SpeakerIdentifier, SpeakerModelCache
+from modules.speaker_store import SpeakerModelStore
+
 warnings.filterwarnings('ignore')
 
 class VoiceAuthenticator:
-    def __init__(self, voice_profiles_dir="voice_profiles"):
+    def __init__(self, voice_profiles_dir="voice_profiles", model_cache_size=32, prewarm_users=None,
+                 use_vad=True):
         self.voice_profiles_dir = voice_profiles_dir
+        self.use_vad = use_vad
+        self.audio_stats = AudioTurnStats()
         self.recognizer = sr.Recognizer()
         
         try:
-            self.microphone = sr.Microphone()
+            # Captura direto em 16 kHz para evitar reamostragem
+            self.microphone = sr.Microphone(sample_rate=SAMPLE_RATE)
         except OSError:
             print("Aviso: Microfone não detectado. Usando entrada alternativa.")
             self.microphone = None
         
         os.makedirs(self.voice_profiles_dir, exist_ok=True)
+        
+        self.model_cache = SpeakerModelCache(self.voice_profiles_dir, model_cache_size)
+        if prewarm_users:
+            self.model_cache.prewarm(prewarm_users)
+        self.model_store = SpeakerModelStore(self.voice_profiles_dir)
+        self.identifier = SpeakerIdentifier(self.model_store)
     
-    def extract_voice_features(self, audio_file):
-        """Extrai características MFCC do áudio para treinamento"""
+    def extract_voice_features(self, audio, sample_rate=SAMPLE_RATE):
+        """Extrai características MFCC do áudio para treinamento
+
+        'audio' pode ser um AudioData, bytes PCM de 16 bits, um array NumPy
+        ou, por compatibilidade, o caminho de um arquivo WAV.
+        """
         try:
-            y, sample_rate = librosa.load(audio_file, sr=16000)
-            mfcc = librosa.feature.mfcc(y=y, sr=sample_rate, n_mfcc=13)
-            return np.mean(mfcc.T, axis=0)
+            return extract_mfcc_features(audio, sample_rate, trim=self.use_vad, stats=self.audio_stats)
         except Exception as e:
             print(f"Erro ao extrair características: {e}")
             return None
     
-    def record_audio(self, filename, duration=5):
-        """Grava áudio usando uma abordagem alternativa"""
+    def record_audio(self, duration=5):
+        """Grava áudio usando uma abordagem alternativa e devolve as amostras"""
         try:
-            import sounddevice as sd
-            import wavio
-            
-            sample_rate = 16000
             print("Gravando... Fale agora!")
-            audio = sd.rec(int(duration * sample_rate), 
-                          samplerate=sample_rate, 
-                          channels=1, 
-                          dtype='float32')
-            sd.wait()
-            
-            wavio.write(filename, audio, sample_rate, sampwidth=2)
-            return True
+            if self.use_vad:
+                samples = record_until_silence(duration, SAMPLE_RATE)
+            else:
+                samples = record_samples(duration, SAMPLE_RATE)
+            self.audio_stats.add_recording(samples, SAMPLE_RATE)
+            return samples
         except ImportError:
             print("sounddevice não instalado. Use: pip install sounddevice")
-            return False
+            return None
         except Exception as e:
             print(f"Erro ao gravar áudio: {e}")
-            return False
+            return None
+    
+    def capture_audio(self):
+        """Captura uma fala do microfone (ou gravação alternativa) em memória"""
+        if self.microphone:
+            with self.microphone as source:
+                self.recognizer.adjust_for_ambient_noise(source)
+                audio = self.recognizer.listen(source, timeout=5, phrase_time_limit=5)
+            self.audio_stats.add_recording(to_samples(audio), SAMPLE_RATE)
+            return audio
+        return self.record_audio()
     
     def register_voice(self, username, phrase="Acesso ao sistema supermercado"):
         """Cadastra a voz do usuário"""
@@ -62,37 +80,26 @@ class VoiceAuthenticator:
             print(f"Amostra {i+1}. Fale agora:")
             
             try:
-                if self.microphone:
-                    with self.microphone as source:
-                        self.recognizer.adjust_for_ambient_noise(source)
-                        audio = self.recognizer.listen(source, timeout=5, phrase_time_limit=5)
-                    
-                    audio_file = os.path.join(self.voice_profiles_dir, f"{username}_sample_{i}.wav")
-                    with open(audio_file, "wb") as f:
-                        f.write(audio.get_wav_data())
-                else:
-                    audio_file = os.path.join(self.voice_profiles_dir, f"{username}_sample_{i}.wav")
-                    if not self.record_audio(audio_file):
-                        return False
+                audio = self.capture_audio()
+                if audio is None:
+                    return False
                 
-                features = self.extract_voice_features(audio_file)
+                features = self.extract_voice_features(audio)
                 if features is not None:
                     features_list.append(features)
                 
-                if os.path.exists(audio_file):
-                    os.remove(audio_file)
-                
             except Exception as e:
                 print(f"Erro na amostra {i+1}: {e}")
                 return False
         
         if features_list:
+            from sklearn.mixture import GaussianMixture
+            
             gmm = GaussianMixture(n_components=3, covariance_type='diag')
             gmm.fit(features_list)
             
-            model_file = os.path.join(self.voice_profiles_dir, f"{username}_gmm.pkl")
-            import joblib
-            joblib.dump(gmm, model_file)
+            self.model_store.add(username, gmm)
+            self.model_cache.invalidate(username)
             
             return True
         return False
@@ -102,36 +109,46 @@ class VoiceAuthenticator:
         print("Por favor, repita a frase de verificação")
         
         try:
-            temp_file = os.path.join(self.voice_profiles_dir, "temp_verification.wav")
-            
-            if self.microphone:
-                with self.microphone as source:
-                    self.recognizer.adjust_for_ambient_noise(source)
-                    audio = self.recognizer.listen(source, timeout=5, phrase_time_limit=5)
-                
-                with open(temp_file, "wb") as f:
-                    f.write(audio.get_wav_data())
-            else:
-                if not self.record_audio(temp_file):
-                    return False
-            
-            current_features = self.extract_voice_features(temp_file)
+            audio = self.capture_audio()
+            if audio is None:
+                return False
             
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
+            current_features = self.extract_voice_features(audio)
             
             if current_features is None:
                 return False
             
-            model_file = os.path.join(self.voice_profiles_dir, f"{username}_gmm.pkl")
-            if not os.path.exists(model_file):
+            gmm = self.model_store.get(username)
+            if gmm is None:
+                # Modelo antigo em pickle, ainda não convertido (python -m modules.speaker_store)
+                gmm = self.model_cache.get(username)
+            if gmm is None:
                 return False
             
-            import joblib
-            gmm = joblib.load(model_file)
-            
             score = gmm.score([current_features])
             return score > -50  
         except Exception as e:
             print(f"Erro na verificação: {e}")
-            return False
\ No newline at end of file
+            return False
+    
+    def identify_voice(self, top_k=3):
+        """Identifica quem está falando entre todos os usuários cadastrados
+
+        Retorna (usuário ou None, ranking dos top_k candidatos com margens).
+        """
+        print("Por favor, repita a frase de acesso")
+        
+        try:
+            audio = self.capture_audio()
+            if audio is None:
+                return None, []
+            
+            features = self.extract_voice_features(audio)
+            if features is None:
+                return None, []
+            
+            ranking = self.identifier.identify(features, top_k)
+            return self.identifier.best_match(features), ranking
+        except Exception as e:
+            print(f"Erro na identificação: {e}")
+            return None, []
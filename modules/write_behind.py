@@ -0,0 +1,138 @@
+import asyncio
+import os
+from collections import deque
+
+# Janela de durabilidade padrão: quanto uma mutação pode esperar na fila antes de ir para o disco
+FLUSH_MS = float(os.environ.get("SUPERMERCADO_API_FLUSH_MS", "200"))
+
+
+class WriteBehindStore:
+    """Grava no DatabaseManager, em lotes e fora do event loop, as mutações de um serviço asyncio
+
+    Quem chama aplica a mudança no próprio estado em memória e passa o
+    registro de mutação (o mesmo formato de DatabaseManager.commit) para
+    submit(), que só enfileira. Uma tarefa de fundo junta o que chegou na
+    janela de durabilidade ('flush_interval' segundos, ou antes se o lote
+    encher) e grava tudo com db.commit_many em uma thread: uma queda perde
+    no máximo essa janela. flush() espera o que já foi enfileirado estar
+    gravado; stop() encerra a tarefa e grava o resto.
+
+    Para o que o cliente precisa saber que foi gravado (uma venda), commit()
+    enfileira, grava na hora e devolve o resultado do banco; chamadas
+    simultâneas entram no mesmo lote (group commit).
+    """
+
+    def __init__(self, db, flush_interval=FLUSH_MS / 1000, max_batch=500):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._pending = deque()
+        # id(registro) -> future de quem espera o resultado (commit)
+        self._waiters = {}
+        self._wakeup = None
+        self._lock = None
+        self._task = None
+        self._stopping = False
+        self.enfileiradas = 0
+        self.gravadas = 0
+        self.rejeitadas = 0
+        self.lotes = 0
+        self.ultimo_erro = None
+
+    def submit(self, record):
+        """Enfileira uma mutação; não faz E/S"""
+        self._pending.append(record)
+        self.enfileiradas += 1
+        if len(self._pending) >= self.max_batch and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def commit(self, record):
+        """Grava o registro junto com o que já está na fila; retorna o resultado do banco
+
+        Se a gravação falhar, a exceção chega aqui e o registro não é
+        repetido depois (quem chamou já sabe que não foi gravado).
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[id(record)] = future
+        self.submit(record)
+        try:
+            await self.flush()
+        except Exception:
+            # Falha de outro lote: este registro continua na fila e a tarefa de fundo o grava
+            pass
+        return await future
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Para a tarefa de fundo e grava o que ainda estiver na fila"""
+        if self._task is not None:
+            # Sem cancelar: um lote pode estar sendo gravado na thread e precisa terminar antes do resto
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                # O lote volta para a fila e é tentado de novo na próxima janela
+                print(f"Erro ao gravar mutações pendentes: {e}")
+
+    async def flush(self):
+        """Grava tudo o que foi enfileirado até agora"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while self._pending:
+                batch = [self._pending.popleft() for _ in range(min(self.max_batch, len(self._pending)))]
+                try:
+                    results = await asyncio.to_thread(self.db.commit_many, batch)
+                except Exception as e:
+                    retry = []
+                    for record in batch:
+                        waiter = self._waiters.pop(id(record), None)
+                        if waiter is None:
+                            retry.append(record)
+                        elif not waiter.done():
+                            waiter.set_exception(e)
+                    self._pending.extendleft(reversed(retry))
+                    self.ultimo_erro = str(e)
+                    raise
+                self.lotes += 1
+                for record, ok in zip(batch, results):
+                    waiter = self._waiters.pop(id(record), None)
+                    if waiter is not None and not waiter.done():
+                        waiter.set_result(ok)
+                    if ok:
+                        self.gravadas += 1
+                        continue
+                    self.rejeitadas += 1
+                    if waiter is None:
+                        # O banco divergiu da memória (ex.: outro processo mexeu no mesmo produto);
+                        # com commit(), quem esperava recebe a recusa e responde ao cliente
+                        self.ultimo_erro = f"mutação recusada pelo banco: {record['op']}"
+                        print(f"Aviso: {self.ultimo_erro}")
+
+    def stats(self):
+        return {
+            'janela_ms': self.flush_interval * 1000,
+            'pendentes': len(self._pending),
+            'enfileiradas': self.enfileiradas,
+            'gravadas': self.gravadas,
+            'rejeitadas': self.rejeitadas,
+            'lotes': self.lotes,
+            'ultimo_erro': self.ultimo_erro
+        }
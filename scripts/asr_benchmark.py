@@ -0,0 +1,138 @@
+"""Compara latência e acerto dos reconhecedores de fala sobre gravações WAV
+
+Uso:
+    python scripts/asr_benchmark.py fixtures/asr
+    python scripts/asr_benchmark.py fixtures/asr --motores vosk,google --repeticoes 3
+
+O diretório deve conter gravações '<nome>.wav' (PCM, mono, de preferência
+16 kHz) e, opcionalmente, '<nome>.txt' com a transcrição esperada. A
+gramática do Vosk é montada com os comandos de main.py e os produtos do
+banco (SUPERMERCADO_DB_FILE / SUPERMERCADO_DB_BACKEND).
+"""
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import COMANDOS_MENU, COMANDOS_VOZ  # noqa: E402
+from modules.asr import DEFAULT_VOSK_MODEL, GoogleRecognizer, VoskRecognizer, build_grammar  # noqa: E402
+from modules.database import create_database_manager  # noqa: E402
+
+
+def word_error_rate(esperado, obtido):
+    """Distância de edição entre as palavras, dividida pelo tamanho da referência"""
+    ref, hyp = esperado.lower().split(), obtido.lower().split()
+    anterior = list(range(len(hyp) + 1))
+    for i, palavra in enumerate(ref, 1):
+        atual = [i] + [0] * len(hyp)
+        for j, candidata in enumerate(hyp, 1):
+            atual[j] = min(anterior[j] + 1, atual[j - 1] + 1, anterior[j - 1] + (palavra != candidata))
+        anterior = atual
+    return anterior[-1] / max(1, len(ref))
+
+
+def carregar_fixtures(diretorio):
+    import speech_recognition as sr
+
+    recognizer = sr.Recognizer()
+    fixtures = []
+    for caminho in sorted(glob.glob(os.path.join(diretorio, "*.wav"))):
+        with sr.AudioFile(caminho) as fonte:
+            audio = recognizer.record(fonte)
+        transcricao = os.path.splitext(caminho)[0] + ".txt"
+        esperado = None
+        if os.path.exists(transcricao):
+            with open(transcricao, encoding="utf-8") as f:
+                esperado = f.read().strip()
+        fixtures.append((os.path.basename(caminho), audio, esperado))
+    return fixtures
+
+
+def criar_motor(nome, restrito, modelo):
+    if nome == "google":
+        return GoogleRecognizer()
+    if nome == "vosk":
+        db = create_database_manager()
+        comandos = [palavras for _, palavras in COMANDOS_MENU + COMANDOS_VOZ]
+        gramatica = build_grammar(comandos, [p['nome'] for p in db.read_data()['produtos']])
+        return VoskRecognizer(modelo, (lambda: gramatica) if restrito else None)
+    raise SystemExit(f"Motor desconhecido: {nome}")
+
+
+def medir(motor, fixtures, repeticoes):
+    import speech_recognition as sr
+
+    latencias, taxas_erro, acertos, falhas = [], [], 0, 0
+    linhas = []
+    for nome, audio, esperado in fixtures:
+        texto = None
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            try:
+                texto = motor.recognize(audio)
+            except sr.UnknownValueError:
+                texto = ""
+            except sr.RequestError as e:
+                texto = None
+                linhas.append(f"    {nome}: erro ({e})")
+                break
+            latencias.append((time.perf_counter() - inicio) * 1000)
+
+        if texto is None:
+            falhas += 1
+            continue
+        if esperado is not None:
+            taxas_erro.append(word_error_rate(esperado, texto))
+            acertos += texto == esperado.lower()
+        linhas.append(f"    {nome}: {latencias[-1]:7.1f} ms  '{texto}'"
+                      + (f"  (esperado '{esperado}')" if esperado is not None else ""))
+    return latencias, taxas_erro, acertos, falhas, linhas
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("fixtures", help="diretório com os arquivos .wav (e .txt)")
+    parser.add_argument("--motores", default="vosk,google")
+    parser.add_argument("--repeticoes", type=int, default=1, help="reconhecimentos por arquivo")
+    parser.add_argument("--livre", action="store_true", help="Vosk sem a gramática restrita")
+    parser.add_argument("--modelo", default=DEFAULT_VOSK_MODEL, help="diretório do modelo Vosk")
+    args = parser.parse_args()
+
+    fixtures = carregar_fixtures(args.fixtures)
+    if not fixtures:
+        raise SystemExit(f"Nenhum .wav em {args.fixtures}")
+    print(f"{len(fixtures)} gravações, {args.repeticoes} repetição(ões) cada\n")
+
+    for nome in args.motores.split(","):
+        motor = criar_motor(nome.strip(), not args.livre, args.modelo)
+        # A primeira chamada carrega o modelo / abre a conexão; fica fora da medição
+        try:
+            motor.recognize(fixtures[0][1])
+        except Exception:
+            pass
+
+        latencias, taxas_erro, acertos, falhas, linhas = medir(motor, fixtures, args.repeticoes)
+        print(f"== {motor.name} ==")
+        print("\n".join(linhas))
+        if latencias:
+            print(f"  latência: média {statistics.mean(latencias):.1f} ms, "
+                  f"p50 {percentil(latencias, 50):.1f} ms, p95 {percentil(latencias, 95):.1f} ms")
+        if taxas_erro:
+            print(f"  WER médio {statistics.mean(taxas_erro):.1%}, "
+                  f"frases exatas {acertos}/{len(taxas_erro)}")
+        if falhas:
+            print(f"  {falhas} gravações sem resposta do motor")
+        print()
+
+
+if __name__ == "__main__":
+    main()
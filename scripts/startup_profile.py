@@ -0,0 +1,127 @@
+"""Relatório de inicialização: tempo de import por módulo e tempo até a primeira requisição
+
+Uso:
+    python scripts/startup_profile.py                 # backend Flask
+    python scripts/startup_profile.py --alvo main     # só o import de main.py
+    python scripts/startup_profile.py --orcamento-ms 1500
+
+Cada medição roda em um interpretador novo (como um cold start), em um
+diretório temporário, para não tocar no database.json nem em voice_profiles.
+Com --orcamento-ms, o código de saída é 1 se o tempo até a primeira
+requisição (ou do import, para main) passar do orçamento.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_LINHA_IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+PRIMEIRA_REQUISICAO = """
+import time
+inicio = time.perf_counter()
+sys.path.insert(0, os.path.join({raiz!r}, "backend"))
+import app
+cliente = app.app.test_client()
+resposta = cliente.get("/api/health")
+assert resposta.status_code == 200, resposta.status_code
+print("PRIMEIRA_REQUISICAO_MS", (time.perf_counter() - inicio) * 1000)
+"""
+
+SO_IMPORT = """
+import time
+inicio = time.perf_counter()
+import {alvo}
+print("PRIMEIRA_REQUISICAO_MS", (time.perf_counter() - inicio) * 1000)
+"""
+
+
+def _rodar(codigo, importtime=False):
+    """Executa 'codigo' em um interpretador novo; retorna (stdout, stderr, segundos de parede)"""
+    ambiente = dict(os.environ, PYTHONPATH=RAIZ + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    with tempfile.TemporaryDirectory() as pasta:
+        ambiente["SUPERMERCADO_DB_FILE"] = os.path.join(pasta, "database.json")
+        comando = [sys.executable] + (["-X", "importtime"] if importtime else []) + \
+            ["-c", "import os, sys\n" + codigo]
+        inicio = time.perf_counter()
+        processo = subprocess.run(comando, cwd=pasta, env=ambiente, capture_output=True, text=True)
+        parede = time.perf_counter() - inicio
+    if processo.returncode != 0:
+        sys.stderr.write(processo.stderr)
+        raise SystemExit(f"Falha ao executar o alvo (código {processo.returncode})")
+    return processo.stdout, processo.stderr, parede
+
+
+def imports_por_modulo(stderr):
+    """Lista (módulo, próprio_ms, acumulado_ms, profundidade) da saída de -X importtime"""
+    modulos = []
+    for linha in stderr.splitlines():
+        m = _LINHA_IMPORTTIME.match(linha)
+        if m:
+            proprio, acumulado, recuo, nome = m.groups()
+            modulos.append((nome, int(proprio) / 1000, int(acumulado) / 1000, len(recuo) // 2))
+    return modulos
+
+
+def _tempo_reportado(stdout):
+    for linha in stdout.splitlines():
+        if linha.startswith("PRIMEIRA_REQUISICAO_MS"):
+            return float(linha.split()[1])
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--alvo", default="backend",
+                        help="'backend' (import + GET /api/health) ou um módulo, ex.: main")
+    parser.add_argument("--top", type=int, default=15, help="quantos imports mostrar")
+    parser.add_argument("--orcamento-ms", type=float, default=None,
+                        help="falha se o tempo até a primeira requisição passar disso")
+    args = parser.parse_args()
+
+    if args.alvo == "backend":
+        codigo = PRIMEIRA_REQUISICAO.format(raiz=RAIZ)
+        rotulo = "import + primeira requisição"
+    else:
+        codigo = SO_IMPORT.format(alvo=args.alvo)
+        rotulo = f"import {args.alvo}"
+
+    # Uma execução limpa para o tempo, outra com -X importtime (que tem custo próprio)
+    stdout, _, parede = _rodar(codigo)
+    total_ms = _tempo_reportado(stdout)
+    _, stderr, _ = _rodar(codigo, importtime=True)
+    modulos = imports_por_modulo(stderr)
+
+    print(f"Alvo: {args.alvo}")
+    print(f"{rotulo}: {total_ms:.0f} ms (processo inteiro: {parede * 1000:.0f} ms)")
+    print(f"Módulos importados: {len(modulos)}")
+
+    print(f"\nTop {args.top} imports de primeiro nível por tempo acumulado:")
+    topo = sorted((m for m in modulos if m[3] == 0), key=lambda m: m[2], reverse=True)
+    for nome, proprio, acumulado, _ in topo[:args.top]:
+        print(f"  {acumulado:9.1f} ms  {proprio:8.1f} ms próprio  {nome}")
+
+    print(f"\nTop {args.top} módulos por tempo próprio:")
+    for nome, proprio, acumulado, _ in sorted(modulos, key=lambda m: m[1], reverse=True)[:args.top]:
+        print(f"  {proprio:9.1f} ms  {nome}")
+
+    pesados = [nome for nome, _, _, _ in modulos
+               if nome.split(".")[0] in ("sklearn", "librosa", "numba", "pyttsx3", "sounddevice", "scipy")]
+    if pesados:
+        print(f"\nAviso: dependências pesadas carregadas na inicialização: "
+              f"{', '.join(sorted({n.split('.')[0] for n in pesados}))}")
+
+    if args.orcamento_ms is not None:
+        if total_ms > args.orcamento_ms:
+            print(f"\nACIMA do orçamento: {total_ms:.0f} ms > {args.orcamento_ms:.0f} ms")
+            sys.exit(1)
+        print(f"\nDentro do orçamento: {total_ms:.0f} ms <= {args.orcamento_ms:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""Teste de estresse da baixa de estoque: nenhuma venda além do estoque e vazão por tipo de trava
+
+Uso:
+    python scripts/stock_stress.py
+    python scripts/stock_stress.py --threads 16 --compras 2000 --latencia-ms 1
+    python scripts/stock_stress.py --api --usuarios 200
+
+Sem --api, várias threads finalizam compras direto no StockManager, com
+uma trava por produto e, para comparar, com uma trava global. Uma parte
+dos produtos é disputada por todas as threads (estoque curto) e o resto
+só aparece em compras avulsas. --latencia-ms simula o trabalho feito com
+as travas seguras (ex.: gravar no banco). Sem latência a baixa dura
+microssegundos e o GIL serializa tudo: as duas travas empatam. A trava
+por produto só ganha quando há espera com a trava segura (--latencia-ms 1).
+
+Com --api, os usuários montam carrinhos e finalizam ao mesmo tempo pelo
+FastAPI de api.py (em processo, com um banco temporário) enquanto uma
+thread com outro gerenciador de banco (como main.py ou backend/app.py)
+vende o mesmo produto direto no banco. O estoque padrão fica abaixo da
+procura, então parte das compras tem de receber 409; no fim o banco é
+conferido: estoque não negativo, toda compra confirmada (200) gravada e
+estoque final = inicial - vendas da API - vendas do outro processo. Isso
+mede correção, não paralelismo: as rotas são async e rodam todas na
+thread do event loop, então as travas por produto nunca disputam dentro
+da API; quem pega a venda do outro processo é a conferência do banco na
+gravação ('checkout'), antes da resposta.
+
+O código de saída é 1 se houver venda além do estoque (ou, com --api,
+nenhuma recusa).
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.catalog import Catalog  # noqa: E402
+from modules.database import create_database_manager  # noqa: E402
+from modules.stock import StockManager  # noqa: E402
+
+
+class _Latencia:
+    latencia = 0.0
+
+    def _debit(self, produtos, linhas):
+        if self.latencia:
+            time.sleep(self.latencia)
+        super()._debit(produtos, linhas)
+
+
+class EstoquePorProduto(_Latencia, StockManager):
+    pass
+
+
+class EstoqueTravaGlobal(_Latencia, StockManager):
+    """Mesma lógica, mas todas as compras passam pela mesma trava"""
+
+    _global = threading.RLock()
+
+    def _lock(self, key):
+        return self._global
+
+
+def montar_catalogo(disputados, avulsos, estoque_disputado):
+    produtos = [{'nome': f'Disputado {i}', 'preco': 1.0, 'quantidade': estoque_disputado}
+                for i in range(disputados)]
+    produtos += [{'nome': f'Avulso {i}', 'preco': 1.0, 'quantidade': 10 ** 9} for i in range(avulsos)]
+    return Catalog(produtos)
+
+
+def rodar_threads(classe, args):
+    catalogo = montar_catalogo(args.disputados, args.avulsos, args.estoque)
+    inicial = {p['nome']: p['quantidade'] for p in catalogo}
+    estoque = classe(catalogo)
+    estoque.latencia = args.latencia_ms / 1000
+    vendido = {nome: 0 for nome in inicial}
+    vendido_lock = threading.Lock()
+    recusadas = [0]
+
+    def trabalhador(semente):
+        rng = random.Random(semente)
+        for n in range(args.compras // args.threads):
+            if rng.random() < args.fracao_disputada:
+                nomes = rng.sample([f'Disputado {i}' for i in range(args.disputados)], min(2, args.disputados))
+            else:
+                nomes = [f'Avulso {rng.randrange(args.avulsos)}']
+            itens = [(nome, rng.randint(1, 3)) for nome in nomes]
+            ok, _ = estoque.checkout(f'caixa-{semente}', itens)
+            with vendido_lock:
+                if ok:
+                    for nome, quantidade in itens:
+                        vendido[nome] += quantidade
+                else:
+                    recusadas[0] += 1
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as executor:
+        list(executor.map(trabalhador, range(args.threads)))
+    segundos = time.perf_counter() - inicio
+
+    total = args.compras // args.threads * args.threads
+    erros = []
+    for produto in catalogo:
+        nome = produto['nome']
+        if produto['quantidade'] < 0 or inicial[nome] - produto['quantidade'] != vendido[nome]:
+            erros.append(f"{nome}: inicial {inicial[nome]}, final {produto['quantidade']}, vendido {vendido[nome]}")
+    return total / segundos, segundos, recusadas[0], erros
+
+
+def outro_processo(parar, vendido):
+    # Outro gerenciador sobre o mesmo arquivo, vendendo 1 unidade por vez direto no banco
+    banco = create_database_manager()
+    while not parar.is_set():
+        ok = banco.commit({'op': 'checkout', 'venda': {
+            'usuario': 'caixa',
+            'itens': [{'produto': 'Disputado', 'quantidade': 1, 'preco_unitario': 2.0, 'subtotal': 2.0}],
+            'total': 2.0,
+            'data': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }})
+        if not ok:
+            break
+        vendido[0] += 1
+        time.sleep(0.002)
+
+
+async def rodar_api(args):
+    pasta = tempfile.mkdtemp()
+    os.environ['SUPERMERCADO_DB_FILE'] = os.path.join(pasta, 'database.json')
+    import httpx
+    import api
+
+    estoque_inicial = args.estoque
+    parar = threading.Event()
+    vendido_fora = [0]
+    async with api.lifespan(api.app):
+        transporte = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://teste") as cliente:
+            await cliente.post("/produtos", json={"nome": "Disputado", "preco": 2.0, "quantidade": estoque_inicial})
+            await api.persistencia.flush()
+
+            async def comprar(i):
+                usuario = f"u{i}"
+                r = await cliente.post(f"/carrinho/{usuario}/adicionar",
+                                       json={"produto_nome": "Disputado", "quantidade": 1 + i % 3})
+                if r.status_code != 200:
+                    # Recusa ao reservar (estoque em memória já comprometido): não chega a finalizar
+                    return "carrinho", r.status_code, 0
+                r = await cliente.post(f"/carrinho/{usuario}/finalizar")
+                return "finalizar", r.status_code, (1 + i % 3 if r.status_code == 200 else 0)
+
+            segundo = threading.Thread(target=outro_processo, args=(parar, vendido_fora))
+            inicio = time.perf_counter()
+            segundo.start()
+            respostas = await asyncio.gather(*(comprar(i) for i in range(args.usuarios)))
+            segundos = time.perf_counter() - inicio
+            parar.set()
+            segundo.join()
+    # lifespan encerrado: a fila de gravação foi esvaziada
+    no_banco = api.db.find_product("Disputado")["quantidade"]
+    gravadas = {}
+    for venda in api.db.iter_sales():
+        gravadas[venda["usuario"]] = gravadas.get(venda["usuario"], 0) + sum(i["quantidade"] for i in venda["itens"])
+
+    vendido = sum(quantidade for _, _, quantidade in respostas)
+    sem_reserva = sum(1 for etapa, _, _ in respostas if etapa == "carrinho")
+    recusadas = sum(1 for etapa, status, _ in respostas if etapa == "finalizar" and status == 409)
+    esperado = {"carrinho": (400,), "finalizar": (200, 409)}
+    erros = [f"u{i}: {etapa} com status {status}" for i, (etapa, status, _) in enumerate(respostas)
+             if status not in esperado[etapa]]
+    erros += [f"u{i}: compra confirmada e não gravada" for i, (etapa, status, quantidade) in enumerate(respostas)
+              if etapa == "finalizar" and status == 200 and gravadas.get(f"u{i}", 0) != quantidade]
+    if no_banco < 0 or no_banco != estoque_inicial - vendido - vendido_fora[0]:
+        erros.append(f"estoque no banco {no_banco} != {estoque_inicial} - {vendido} - {vendido_fora[0]}")
+    if gravadas.get("caixa", 0) != vendido_fora[0]:
+        erros.append(f"outro processo: {vendido_fora[0]} vendidas, {gravadas.get('caixa', 0)} gravadas")
+    if not recusadas:
+        erros.append("nenhuma compra recusada ao finalizar (409): aumente --usuarios ou diminua --estoque")
+
+    print(f"API: {args.usuarios} usuários em {segundos:.2f} s ({args.usuarios / segundos:.0f} compras/s)")
+    print(f"  estoque inicial {estoque_inicial}, vendido pela API {vendido}, pelo outro processo {vendido_fora[0]}, "
+          f"final no banco {no_banco}")
+    print(f"  {recusadas} recusadas ao finalizar (409), {sem_reserva} sem estoque ao reservar")
+    print(f"  gravação: {api.persistencia.stats()}")
+    for erro in erros:
+        print(f"  ERRO: {erro}")
+    return not erros
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--compras", type=int, default=20000, help="total de compras finalizadas")
+    parser.add_argument("--disputados", type=int, default=4, help="produtos disputados por todas as threads")
+    parser.add_argument("--avulsos", type=int, default=1000)
+    parser.add_argument("--estoque", type=int, help="estoque inicial dos disputados (padrão 500; com --api, 100)")
+    parser.add_argument("--fracao-disputada", type=float, default=0.2)
+    parser.add_argument("--latencia-ms", type=float, default=0.0, help="trabalho simulado com as travas seguras")
+    parser.add_argument("--api", action="store_true", help="finaliza compras pelo FastAPI de api.py")
+    parser.add_argument("--usuarios", type=int, default=200)
+    args = parser.parse_args()
+    if args.estoque is None:
+        # Com --api o estoque fica abaixo da procura (~2 por usuário) para haver recusas
+        args.estoque = 100 if args.api else 500
+
+    if args.api:
+        sys.exit(0 if asyncio.run(rodar_api(args)) else 1)
+
+    falhou = False
+    for rotulo, classe in (("trava por produto", EstoquePorProduto), ("trava global", EstoqueTravaGlobal)):
+        vazao, segundos, recusadas, erros = rodar_threads(classe, args)
+        print(f"{rotulo}: {vazao:,.0f} compras/s ({segundos:.2f} s, {recusadas} recusadas por falta de estoque)")
+        for erro in erros:
+            print(f"  VENDA ALÉM DO ESTOQUE: {erro}")
+        falhou = falhou or bool(erros)
+    sys.exit(1 if falhou else 0)
+
+
+if __name__ == "__main__":
+    main()